@@ -11,10 +11,10 @@ def check_paragraphs_breaks(file_path):
     # 获取所有段落类型的块
     para_blocks = []
     for block in blocks:
-        if block[0] == 'paragraph' or block[0] == 'formula':
+        if block.type == 'paragraph' or block.type == 'formula':
             para_blocks.append(block)
         # 遇到参考文献就停止
-        if block[0] == 'header' and 'references' in block[1].lower():
+        if block.type == 'header' and 'references' in block.text.lower():
             break
 
     # 用于标记是否有问题
@@ -22,12 +22,12 @@ def check_paragraphs_breaks(file_path):
     # 收集异常段落
     issue_paragraphs = []
 
-    for para in para_blocks:
+    for para_index, para in enumerate(para_blocks):
         # 跳过公式块
-        if para[0] == 'formula':
+        if para.type == 'formula':
             continue
-        content = para[1].strip()
-        line_num = lines.index(para[1]) + 1
+        content = para.text.strip()
+        line_num = para.line_number
 
         # 初始化异常标记
         start_issue = False
@@ -47,8 +47,8 @@ def check_paragraphs_breaks(file_path):
         punctuation = '.!?;:"\''
         if not content[-1] in punctuation:
             # 检查下一个Block是否为formula
-            next_block_index = para_blocks.index(para) + 1
-            if not (next_block_index < len(para_blocks) and para_blocks[next_block_index][0] == 'formula'):
+            next_block_index = para_index + 1
+            if not (next_block_index < len(para_blocks) and para_blocks[next_block_index].type == 'formula'):
                 end_issue = True
                 has_issues = True
 
@@ -64,17 +64,17 @@ def check_paragraphs_breaks(file_path):
     # 获取参考文献块，参考文献块是Reference标题下的所有paragraph块
     ref_blocks = []
     for i, block in enumerate(blocks):
-        if block[0] == 'header' and 'references' in block[1].lower():
+        if block.type == 'header' and 'references' in block.text.lower():
             for j in range(i + 1, len(blocks)):
-                if blocks[j][0] == 'paragraph':
+                if blocks[j].type == 'paragraph':
                     ref_blocks.append(blocks[j])
                 else:
                     break
             break
     # 检查开头是否以[开头
     for para in ref_blocks:
-        content = para[1].strip()
-        line_num = lines.index(para[1]) + 1
+        content = para.text.strip()
+        line_num = para.line_number
 
         # 检查开头是否以数字或[开头
         if content[0] != '[' and not content[0].isdigit():
@@ -105,10 +105,10 @@ def check_paragraphs_breaks_interactive(file_path):
         # para_blocks = [block for block in blocks if block[0] == 'paragraph']
         para_blocks = []
         for block in blocks:
-            if block[0] == 'paragraph' or block[0] == 'formula':
+            if block.type == 'paragraph' or block.type == 'formula':
                 para_blocks.append(block)
             # 遇到参考文献就停止
-            if block[0] == 'header' and 'references' in block[1].lower():
+            if block.type == 'header' and 'references' in block.text.lower():
                 break
 
         # 用于标记是否有问题
@@ -116,12 +116,12 @@ def check_paragraphs_breaks_interactive(file_path):
         # 收集异常段落
         issue_paragraphs = []
 
-        for para in para_blocks:
+        for para_index, para in enumerate(para_blocks):
             # 跳过公式块
-            if para[0] == 'formula':
+            if para.type == 'formula':
                 continue
-            content = para[1].strip()
-            line_num = lines.index(para[1]) + 1
+            content = para.text.strip()
+            line_num = para.line_number
 
             # 初始化异常标记
             start_issue = False
@@ -141,8 +141,8 @@ def check_paragraphs_breaks_interactive(file_path):
             punctuation = '.!?;:"\''
             if not content[-1] in punctuation:
                 # 检查下一个Block是否为formula
-                next_block_index = para_blocks.index(para) + 1
-                if not (next_block_index < len(para_blocks) and para_blocks[next_block_index][0] == 'formula'):
+                next_block_index = para_index + 1
+                if not (next_block_index < len(para_blocks) and para_blocks[next_block_index].type == 'formula'):
                     end_issue = True
                     has_issues = True
 
@@ -177,17 +177,17 @@ def check_paragraphs_breaks_interactive(file_path):
         # 获取参考文献块，参考文献块是Reference标题下的所有paragraph块
         ref_blocks = []
         for i, block in enumerate(blocks):
-            if block[0] == 'header' and 'references' in block[1].lower():
+            if block.type == 'header' and 'references' in block.text.lower():
                 for j in range(i + 1, len(blocks)):
-                    if blocks[j][0] == 'paragraph':
+                    if blocks[j].type == 'paragraph':
                         ref_blocks.append(blocks[j])
                     else:
                         break
                 break
         # 检查开头是否以[开头
         for para in ref_blocks:
-            content = para[1].strip()
-            line_num = lines.index(para[1]) + 1
+            content = para.text.strip()
+            line_num = para.line_number
 
             # 检查开头是否以数字或[开头
             if content[0] != '[' and not content[0].isdigit():
@@ -0,0 +1,409 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+# pip install aiohttp
+
+from Conversation_history import ConversationHistory
+from LLM_tools import LLM_model, build_chat_request, estimate_request_tokens, parse_sse_line
+from Model_pool import record_request
+from Retry_policy import classify_status, continuation_messages, is_retryable, retry_delay
+from Stream_sinks import BufferedFileSink, open_sink
+from Translate import (chunk_cache_key, chunk_context_messages, initial_conversation, recover_paragraph,
+                       section_block_file, split_section_chunks, write_section_verbatim)
+from Token_budget import TokenBudget, request_max_tokens
+from Translation_cache import get_translation_cache
+from utils import estimate_tokens
+
+
+def classify_aiohttp_exception(error):
+    """对aiohttp请求异常分类，返回(错误类型, Retry-After等待秒数或None)，见LLM_tools.classify_exception"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return classify_status(error.status, error.headers)
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout", None
+    if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return "connection", None
+    return "other", None
+
+
+class AsyncTranslationEngine:
+    """
+    基于asyncio+aiohttp的翻译引擎，在单个进程内并发处理多个文档的所有章节
+    每个模型一个信号量，同时在途的请求数不超过该模型的max_concurrent
+    翻译缓存、限速器、请求统计和断点日志的SQLite读写及fsync都在一个专用的IO线程中依次执行，不阻塞事件循环
+    用法：
+        async with AsyncTranslationEngine() as engine:
+            block_files = await engine.translate_sections(sections, file_dir, model)
+    """
+
+    def __init__(self):
+        self.session = None
+        self._semaphores = {}
+        self._io = None
+
+    async def __aenter__(self):
+        # 并发由各模型的信号量控制，连接数不额外限制
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translate-io")
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.session.close()
+        # 等待已提交的日志、统计写入完成
+        self._io.shutdown(wait=True)
+
+    async def run_io(self, func, *args, **kwargs):
+        """在IO线程中执行阻塞的SQLite/文件操作，返回其结果；等待中的任务被取消时操作仍会执行完毕"""
+        future = asyncio.get_running_loop().run_in_executor(self._io, functools.partial(func, *args, **kwargs))
+        return await asyncio.shield(future)
+
+    def semaphore(self, model: LLM_model):
+        """获取模型对应的信号量，同一服务地址和模型名共用一个"""
+        key = (model.post_url, model.model_name)
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(max(model.max_concurrent, 1))
+        return self._semaphores[key]
+
+    async def stream_response(self, model: LLM_model, system_prompt="You're a helpful assistant.", prompt=None,
+                              messages=None, write_file=None, max_tokens=4096, max_retry=3, timeout=10,
+                              temperature=0.7):
+        """
+        LLM_Stream_Response的异步版本，参数、返回值和重试策略相同
+        Returns:
+            tuple: (生成的文本内容, token统计字典)，调用失败时返回(None, None)
+        """
+        headers, data = build_chat_request(model, system_prompt, prompt, messages, max_tokens, temperature)
+        request_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        sink, owns_sink = open_sink(write_file)
+        key_ring = model.key_ring()
+        breaker = model.circuit_breaker()
+        estimated_tokens = estimate_request_tokens(data) if key_ring.limited else 0
+        checkpoint = sink.checkpoint() if sink else None
+        partial_output = ""
+        request_data = data
+        # 尚未释放的(API key, 名额)，以及是否已成功返回
+        lease = None
+        # 持有的熔断器探测名额，请求未得出结果就结束时释放
+        probe = None
+        succeeded = False
+
+        try:
+            retry_count = 0
+            while retry_count < max_retry:
+                # 熔断期间等待冷却结束；换用其他key重试时沿用已获得的探测名额
+                if probe is None:
+                    wait, probe = breaker.before_request()
+                    while wait:
+                        await asyncio.sleep(wait)
+                        wait, probe = breaker.before_request()
+
+                response_content = ""
+                token_stats = None
+                finish_reason = None
+                api_key, slot = None, None
+                try:
+                    async with self.semaphore(model):
+                        # 轮换选择API key，并按该key的速率限制和当前并发上限等待额度
+                        api_key, slot = await key_ring.acquire_async(estimated_tokens, self._io)
+                        if api_key is None:
+                            print("没有可用的API key")
+                            break
+                        lease = (api_key, slot)
+                        start_time = time.monotonic()
+                        async with self.session.post(model.post_url,
+                                                     headers=dict(headers, Authorization=f"Bearer {api_key.api_key}"),
+                                                     json=request_data, timeout=request_timeout) as response:
+                            response.raise_for_status()
+
+                            async for line in response.content:
+                                done, json_data = parse_sse_line(line)
+                                if done:
+                                    break
+                                if json_data is None:
+                                    continue
+
+                                if json_data.get('choices'):
+                                    delta = json_data['choices'][0].get('delta', {})
+                                    finish_reason = json_data['choices'][0].get('finish_reason') or finish_reason
+                                    if 'content' in delta:
+                                        content = delta['content']
+                                        response_content += content
+                                        if sink:
+                                            sink.write(content)
+
+                                # 获取token统计（通常在最后一个数据块中）
+                                if json_data.get('usage'):
+                                    token_stats = json_data['usage']
+
+                    if finish_reason == "length":
+                        print(f"\n输出达到max_tokens上限({max_tokens})，结果可能不完整，可调大模型的max_output_tokens")
+                    breaker.record_success()
+                    lease = probe = None
+                    await self.run_io(self._record_success, model, key_ring, api_key, slot, estimated_tokens,
+                                      token_stats, response_content, time.monotonic() - start_time)
+                    if sink:
+                        sink.flush()
+                    succeeded = True
+                    return partial_output + response_content, token_stats
+
+                except Exception as e:
+                    # 解析响应或写入sink出错时同样释放名额并重试，与LLM_Stream_Response一致
+                    kind, retry_after = classify_aiohttp_exception(e)
+                    if api_key is not None:
+                        lease = None
+                        await self.run_io(key_ring.release, api_key, slot, kind, retry_after, estimated_tokens)
+                    # 只是当前key的问题时立即换用其他key，不计入重试次数和服务商的熔断
+                    switch_key = api_key is not None and key_ring.can_switch(api_key, kind)
+                    if switch_key:
+                        print(f"API key {api_key} 调用失败: {e}，换用其他key")
+                    else:
+                        retry_count += 1
+                        print(f"调用API失败 (尝试 {retry_count}/{max_retry}): {e}")
+                        if not is_retryable(kind):
+                            print("请求参数或鉴权有误，不再重试")
+                            break
+                        breaker.record_failure(probe)
+                        probe = None
+                        await self.run_io(record_request, model, False)
+
+                    if sink and response_content:
+                        if checkpoint is not None:
+                            sink.rollback(checkpoint)
+                        else:
+                            partial_output += response_content
+                            request_data = dict(data, messages=continuation_messages(data["messages"], partial_output))
+                    if retry_count < max_retry and not switch_key:
+                        # 等待期间不占用信号量
+                        await asyncio.sleep(retry_delay(retry_count, retry_after))
+
+            return None, None
+        finally:
+            breaker.release_probe(probe)
+            # 任务被取消等情况下也释放名额，不必等到租约过期；提交到IO线程后不等待
+            if lease is not None:
+                self._io.submit(key_ring.release, *lease, "other", None, estimated_tokens)
+            # 失败或被取消时丢弃本次调用写入的内容
+            if not succeeded and sink and checkpoint is not None:
+                sink.rollback(checkpoint)
+            if owns_sink:
+                sink.close()
+
+    @staticmethod
+    def _record_success(model, key_ring, api_key, slot, estimated_tokens, token_stats, response_content, seconds):
+        """请求成功后的统计和名额释放，在IO线程中执行"""
+        token_stats = token_stats or {}
+        record_request(model, True, token_stats.get('completion_tokens') or estimate_tokens(response_content), seconds)
+        key_ring.release(api_key, slot, "ok", None, estimated_tokens, token_stats.get('total_tokens') or None)
+
+    async def cached_stream_response(self, cache, key, model: LLM_model, write_file=None, **kwargs):
+        """先查翻译缓存，未命中时调用stream_response并缓存成功的结果，返回译文，失败时返回None"""
+        if cache is not None:
+            content = await self.run_io(cache.get, key)
+            if content is not None:
+                sink, owns_sink = open_sink(write_file)
+                if sink:
+                    sink.write(content)
+                    if owns_sink:
+                        sink.close()
+                    else:
+                        sink.flush()
+                return content
+
+        content, token_usage = await self.stream_response(model, write_file=write_file, **kwargs)
+        if cache is not None and content is not None:
+            await self.run_io(cache.put, key, content, model.model_name)
+        return content
+
+    async def translate_with_failover(self, cache, text, model: LLM_model, model_pool=None, **kwargs):
+        """
+        翻译一个片段，model失败时从模型池中换用其他模型，见Translate.request_with_failover
+        max_tokens按原文长度和所用模型的输出上限设置
+        Returns:
+            tuple: (译文或None, 最终使用的模型)
+        """
+        tried = []
+        while True:
+            if model_pool is not None and model.circuit_breaker().is_open():
+                next_model = model_pool.choose(exclude=tried + [model])
+                if next_model is not None:
+                    tried.append(model)
+                    model = next_model
+            content = await self.cached_stream_response(cache, chunk_cache_key(model, text), model,
+                                                        max_tokens=request_max_tokens(model, text), **kwargs)
+            if content is not None or model_pool is None:
+                return content, model
+            tried.append(model)
+            next_model = model_pool.choose(exclude=tried)
+            if next_model is None:
+                return None, model
+            print(f"\n{model.model_name} 请求失败，切换到 {next_model.model_name}")
+            model = next_model
+
+    async def translate_chunks_parallel(self, chunks, model: LLM_model, block_sink, chunk_concurrency=3,
+                                        chunk_context="source", section_journal=None, model_pool=None):
+        """Translate.translate_chunks_parallel的异步版本，章节内的片段并发翻译，译文按原顺序写入，返回失败的片段数"""
+        translate_chunks = [(content, lines) for kind, content, lines in chunks if kind == "translate"]
+        sources = [content for content, lines in translate_chunks]
+        chunk_semaphore = asyncio.Semaphore(chunk_concurrency)
+        last_completed = [None]
+        cache = get_translation_cache()
+
+        async def translate_one(position):
+            if section_journal is not None:
+                journaled = section_journal.completed(position, sources[position])
+                if journaled is not None:
+                    return journaled
+            async with chunk_semaphore:
+                messages = (initial_conversation()
+                            + chunk_context_messages(sources, position, chunk_context, last_completed[0])
+                            + [{"role": "user", "content": sources[position]}])
+                translated_content, used_model = await self.translate_with_failover(
+                    cache, sources[position], model_pool.choose() if model_pool else model, model_pool,
+                    messages=messages, timeout=30)
+                if translated_content is not None:
+                    last_completed[0] = (sources[position], translated_content)
+                    if section_journal is not None:
+                        content, (start_line, end_line) = translate_chunks[position]
+                        await self.run_io(section_journal.record, position, content, start_line, end_line,
+                                          translated_content, used_model.model_name)
+                return translated_content
+
+        tasks = [asyncio.ensure_future(translate_one(position)) for position in range(len(sources))]
+        position = 0
+        failed = 0
+        for kind, content, lines in chunks:
+            if kind != "translate":
+                block_sink.write(content)
+                continue
+            translated_content = await tasks[position]
+            position += 1
+            if translated_content is None:
+                block_sink.write(content)
+                block_sink.write(f"\n[翻译出错，使用原文]\n")
+                failed += 1
+            else:
+                block_sink.write(translated_content)
+            block_sink.flush()
+        return failed
+
+    async def translate_section(self, section, idx, file_dir, model: LLM_model, max_translation=None,
+                                md_file_name="", chunk_concurrency=1, chunk_context="source", journal=None,
+                                model_pool=None):
+        """TranslateProcess的异步版本，不同章节之间并发；chunk_concurrency大于1时章节内的片段也并发翻译"""
+        block_file, title_text = section_block_file(section, idx, file_dir, md_file_name)
+        if title_text == '参考文献':
+            write_section_verbatim(section, block_file)
+            if journal:
+                await self.run_io(journal.section(idx).mark_done)
+            return block_file
+
+        section_journal = journal.section(idx) if journal else None
+        if section_journal is not None and len(section_journal):
+            print(f"\n章节 {idx + 1} 从断点恢复，已完成 {len(section_journal)} 个片段")
+
+        budget = TokenBudget.for_models(model_pool.models if model_pool is not None else [model])
+        chunks = split_section_chunks(section, max_translation, budget)
+        if chunk_concurrency > 1:
+            with BufferedFileSink(block_file, mode='w') as block_sink:
+                failed = await self.translate_chunks_parallel(chunks, model, block_sink, chunk_concurrency,
+                                                              chunk_context, section_journal, model_pool)
+            if section_journal is not None and not failed:
+                await self.run_io(section_journal.mark_done)
+            recover_paragraph(block_file, section)
+            return block_file
+
+        conversation_history = ConversationHistory(initial_conversation(), model.history_tokens)
+        cache = get_translation_cache()
+        failed = 0
+        with BufferedFileSink(block_file, mode='w') as block_sink:
+            position = 0
+            for kind, content, (start_line, end_line) in chunks:
+                if kind != "translate":
+                    block_sink.write(content)
+                    continue
+
+                translated_content = section_journal.completed(position, content) if section_journal is not None else None
+                conversation_history.append({"role": "user", "content": content})
+                if translated_content is not None:
+                    block_sink.write(translated_content)
+                else:
+                    # 请求失败切换模型后，后续片段沿用新模型
+                    translated_content, model = await self.translate_with_failover(
+                        cache,
+                        content,
+                        model,
+                        model_pool,
+                        messages=conversation_history.window(),
+                        write_file=block_sink,
+                        timeout=30
+                    )
+                    if translated_content is not None and section_journal is not None:
+                        await self.run_io(section_journal.record, position, content, start_line, end_line,
+                                          translated_content, model.model_name)
+                position += 1
+                if translated_content is None:
+                    # 所有重试都失败，写入原文
+                    block_sink.write(content)
+                    block_sink.write(f"\n[翻译出错，使用原文]\n")
+                    conversation_history.pop()
+                    failed += 1
+                    continue
+                conversation_history.append({"role": "assistant", "content": translated_content})
+
+        if section_journal is not None and not failed:
+            await self.run_io(section_journal.mark_done)
+        if conversation_history.saved_tokens:
+            print(f"\n章节 {idx + 1} 裁剪对话历史，节省约 {conversation_history.saved_tokens} 个prompt token")
+
+        # 恢复分段
+        recover_paragraph(block_file, section)
+        return block_file
+
+    async def translate_sections(self, sections, file_dir, model: LLM_model, max_translation=None, md_file_name="",
+                                 on_done=None, chunk_concurrency=1, chunk_context="source", journal=None,
+                                 model_pool=None, order=None):
+        """
+        并发翻译一个文档的所有章节
+        Args:
+            on_done: 可选回调on_done(idx, block_file)，每个章节完成时调用
+            journal: 可选的TranslationJournal，跳过已完成的片段
+            model_pool: 可选的ModelPool，每个章节从池中按权重选择模型，失败时换用其他模型
+            order: 可选的章节启动顺序（章节编号列表），见SectionSchedule.order
+        Returns:
+            list: 按章节顺序排列的块文件路径，出错的章节为None
+        """
+
+        async def run(idx, section):
+            try:
+                section_model = model_pool.choose() if model_pool else model
+                block_file = await self.translate_section(section, idx, file_dir, section_model, max_translation,
+                                                          md_file_name, chunk_concurrency, chunk_context, journal,
+                                                          model_pool)
+            except Exception as e:
+                print(f"\n处理章节 {idx + 1} 时出错: {str(e)}")
+                block_file = None
+            if on_done:
+                on_done(idx, block_file)
+            return block_file
+
+        # 先启动的章节先占用模型的并发名额
+        tasks = {idx: asyncio.ensure_future(run(idx, sections[idx]))
+                 for idx in (order if order is not None else range(len(sections)))}
+        return await asyncio.gather(*(tasks[idx] for idx in range(len(sections))))
+
+
+def translate_sections_async(sections, file_dir, model: LLM_model, max_translation=None, md_file_name="",
+                             on_done=None, chunk_concurrency=1, chunk_context="source", journal=None,
+                             model_pool=None, order=None):
+    """在新的事件循环中并发翻译一个文档的所有章节，返回按章节顺序排列的块文件路径"""
+
+    async def main():
+        async with AsyncTranslationEngine() as engine:
+            return await engine.translate_sections(sections, file_dir, model, max_translation, md_file_name,
+                                                   on_done, chunk_concurrency, chunk_context, journal,
+                                                   model_pool, order)
+
+    return asyncio.run(main())
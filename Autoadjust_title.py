@@ -1,14 +1,13 @@
 import os
 import re
 
-from fuzzywuzzy import process
-
 from LLM_API import LLM_model, ChooseLLM, MyLLMs
 from LLM_tools import LLM_Stream_Response
 
 
 def arrange_titles(md_file_path, model: LLM_model, replace=True):
     def replace_titles(no_number=False):
+        from fuzzywuzzy import process
         # 读取markdown文件内容
         with open(md_file_path, 'r', encoding='utf-8') as file:
             lines = file.readlines()
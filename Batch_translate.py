@@ -0,0 +1,325 @@
+import asyncio
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import get_all_start_methods, get_context
+
+from LLM_tools import LLM_model
+from Model_pool import ModelPool
+from Translate import MarkdownDocument, TranslateProcess, prewarm_models
+
+
+def collect_markdown_files(input_dir):
+    """
+    收集文件夹下需要翻译的Markdown文件：只含1个Markdown文件的子文件夹中，文件名含有_EN_且不含"笔记"的文件
+    """
+    target_files = []
+    for root, dirs, files in os.walk(input_dir):
+        md_files = [f for f in files if f.endswith('.md')]
+        if len(md_files) == 1:
+            md_file = os.path.join(root, md_files[0])
+            # 文件名需含有_EN_
+            if '_EN_' in md_file and '笔记' not in md_file:
+                target_files.append(md_file)
+    return target_files
+
+
+class BatchItem:
+    """批量翻译中单个文档的状态"""
+
+    def __init__(self, file_path):
+        # 输入的文件，PDF文件需先经OCR转换为Markdown
+        self.file_path = file_path
+        self.md_file_path = None
+        self.document = None
+        self.merger = None
+        # 状态：等待、OCR中、准备中、翻译中、完成、部分失败、出错
+        self.status = "等待"
+        self.error = None
+        self.done_jobs = 0
+        self.failed_jobs = 0
+        self.start_time = None
+        self.elapsed = 0.0
+
+    @property
+    def name(self):
+        return os.path.basename(self.file_path)
+
+    @property
+    def needs_ocr(self):
+        return self.file_path.lower().endswith('.pdf')
+
+    @property
+    def total_jobs(self):
+        return len(self.document.schedule) if self.document and self.document.schedule else 0
+
+    def convert(self, ocr_api_key=None):
+        """获取待翻译的Markdown文件，PDF文件先进行OCR，在OCR线程中执行；无法转换时抛出ValueError"""
+        from Translate import markdown_for_file
+
+        self.start_time = time.time()
+        if self.needs_ocr:
+            self.status = "OCR中"
+        md_file_path = markdown_for_file(self.file_path, ocr_api_key)
+        if md_file_path is None:
+            raise ValueError("PDF转Markdown失败" if self.needs_ocr else "不支持的文件类型")
+        self.md_file_path = md_file_path
+        self.document = MarkdownDocument(md_file_path)
+        self.status = "等待"
+
+    def prepare(self, model, model_pool, workers, max_translation=None):
+        """翻译前的准备（标题翻译、章节调度等），在准备线程中执行"""
+        self.status = "准备中"
+        self.document.prepare(model_pool.choose() if model_pool else model, model_pool, workers, max_translation)
+
+    def start(self, remove_block_files):
+        self.merger = self.document.merger(remove_block_files)
+        self.status = "翻译中"
+
+    def add(self, idx, block_file):
+        """登记一个完成的章节任务，返回文档的所有任务是否都已完成"""
+        self.merger.add(idx, block_file)
+        self.done_jobs += 1
+        if block_file is None:
+            self.failed_jobs += 1
+        return self.done_jobs == self.total_jobs
+
+    def finish(self, model_pool):
+        self.merger.close()
+        complete = self.document.finish(model_pool)
+        self.status = "完成" if complete else "部分失败"
+        self.elapsed = time.time() - self.start_time
+
+    def fail(self, error):
+        if self.merger is not None:
+            self.merger.close()
+        self.status = "出错"
+        self.error = error
+        self.elapsed = time.time() - self.start_time if self.start_time else 0.0
+
+
+def batch_report(items):
+    """批量翻译的汇总报告（Markdown表格）"""
+    lines = ["# 批量翻译报告\n\n",
+             "| 文件 | 状态 | 章节任务 | 失败任务 | 耗时(分钟) | 说明 |\n",
+             "| --- | --- | --- | --- | --- | --- |\n"]
+    for item in items:
+        note = str(item.error) if item.error else (item.document.output_file if item.status == "完成" else "")
+        lines.append(f"| {item.name} | {item.status} | {item.done_jobs}/{item.total_jobs} | {item.failed_jobs} | "
+                     f"{item.elapsed / 60:.1f} | {note.replace('|', '/')} |\n")
+    counts = {}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    lines.append("\n" + "，".join(f"{status} {count} 个" for status, count in counts.items()) + "\n")
+    return "".join(lines)
+
+
+def translate_markdown_batch(files, model: LLM_model | ModelPool, max_translation=None, max_concurrent=None,
+                             backend="process", chunk_concurrency=1, chunk_context="source", remove_block_files=False,
+                             max_active_documents=None, report_file=None, ocr_api_key=None, ocr_workers=None):
+    """
+    并发翻译多个Markdown/PDF文档，所有文档共用一个并发预算，不弹出任何对话框
+    分为两级流水线：OCR线程池（并行数ocr_workers）依次将PDF转换为Markdown，同时翻译已转换好的文档；
+    准备线程依次为文档翻译标题、调度章节任务，准备好的文档立即把章节任务加入共用的进程池（或asyncio引擎），
+    多个文档的章节交错执行；同时翻译的文档数不超过max_active_documents
+    Args:
+        files: Markdown或PDF文件路径列表
+        model: LLM模型或ModelPool
+        max_translation: 可选的片段单词数上限，默认只按模型的输出token上限拆分片段
+        max_concurrent: 翻译的全局并行数（process后端的进程数），默认取模型的max_concurrent
+        backend: "process"或"async"，见process_markdown_translation
+        max_active_documents: 同时翻译的文档数，默认为max(2, max_concurrent)
+        report_file: 可选，汇总报告的保存路径
+        ocr_api_key: Mistral OCR的API key，默认使用LLM_API中的配置
+        ocr_workers: OCR的并行数，默认使用LLM_API中的Mistral_OCR_max_concurrent
+    Returns:
+        list: 各文档的BatchItem，按输入顺序排列
+    """
+    from tqdm.auto import tqdm
+    from LLM_API import Mistral_OCR_max_concurrent
+
+    model_pool = model if isinstance(model, ModelPool) else None
+    max_concurrent = max_concurrent or (model_pool or model).max_concurrent
+    max_active_documents = max_active_documents or max(2, max_concurrent)
+    items = [BatchItem(file_path) for file_path in files]
+    progress = tqdm(total=0, desc="批量翻译进度", unit="章节")
+    finished = [0]
+
+    def finish_item(item):
+        item.finish(model_pool)
+        finished[0] += 1
+        progress.set_postfix_str(f"文档 {finished[0]}/{len(items)}")
+        progress.write(f"[{finished[0]}/{len(items)}] {item.name}: {item.status}，"
+                       f"{item.done_jobs - item.failed_jobs}/{item.total_jobs} 个章节任务成功，耗时 {item.elapsed:.1f} 秒")
+
+    def fail_item(item, error):
+        item.fail(error)
+        finished[0] += 1
+        progress.write(f"[{finished[0]}/{len(items)}] {item.name}: 出错 {error}")
+
+    with ThreadPoolExecutor(max_workers=max(1, ocr_workers or Mistral_OCR_max_concurrent)) as ocr_executor:
+        # 第一级：PDF按输入顺序提交OCR，Markdown文件直接可用
+        conversions = {}
+        for item in items:
+            if item.needs_ocr:
+                conversions[item] = ocr_executor.submit(item.convert, ocr_api_key)
+            else:
+                conversions[item] = Future()
+                try:
+                    item.convert(ocr_api_key)
+                    conversions[item].set_result(None)
+                except Exception as e:
+                    conversions[item].set_exception(e)
+
+        # 第二级：翻译转换好的文档
+        if backend == "async":
+            _run_batch_async(items, conversions, model, model_pool, max_translation, max_concurrent,
+                             chunk_concurrency, chunk_context, remove_block_files, max_active_documents, progress,
+                             finish_item, fail_item)
+        else:
+            _run_batch_in_pool(items, conversions, model, model_pool, max_translation, max_concurrent,
+                               chunk_concurrency, chunk_context, remove_block_files, max_active_documents, progress,
+                               finish_item, fail_item)
+    progress.close()
+
+    report = batch_report(items)
+    print("\n" + report)
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"汇总报告已保存至: {report_file}")
+    return items
+
+
+def _run_batch_in_pool(items, conversions, model, model_pool, max_translation, max_concurrent, chunk_concurrency,
+                       chunk_context, remove_block_files, max_active_documents, progress, finish_item, fail_item):
+    """用一个进程池翻译所有文档的章节任务，文档转换、准备好后按其调度顺序提交"""
+    models = model_pool.models if model_pool else [model]
+    pool_kwargs = {}
+    if any(pool_model.prewarm_on_start for pool_model in models):
+        pool_kwargs = {"initializer": prewarm_models, "initargs": (models,)}
+    # 工作进程按需启动，此时准备线程可能正在读写SQLite（翻译缓存、限流状态），fork会把锁状态复制到子进程，
+    # 因此在支持的平台上改由预先导入了Translate的forkserver启动工作进程
+    if "forkserver" in get_all_start_methods():
+        pool_kwargs["mp_context"] = get_context("forkserver")
+        pool_kwargs["mp_context"].set_forkserver_preload(["Translate"])
+    waiting = list(items)
+    preparing = {}
+    running = {}
+    active = 0
+
+    with ProcessPoolExecutor(max_workers=max_concurrent, **pool_kwargs) as executor, \
+            ThreadPoolExecutor(max_workers=1) as preparer:
+        while waiting or preparing or running:
+            # 按输入顺序开始翻译已转换好的文档，文档的准备（主要是标题翻译）与其他文档的翻译同时进行
+            for item in list(waiting):
+                if active >= max_active_documents:
+                    break
+                if not conversions[item].done():
+                    continue
+                waiting.remove(item)
+                try:
+                    conversions[item].result()
+                except Exception as e:
+                    fail_item(item, e)
+                    continue
+                preparing[preparer.submit(item.prepare, model, model_pool, max_concurrent, max_translation)] = item
+                active += 1
+
+            pending = list(preparing) + list(running)
+            if active < max_active_documents:
+                # 还能开始新的文档时，也等待OCR完成
+                pending += [conversions[item] for item in waiting]
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in preparing:
+                    item = preparing.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        fail_item(item, e)
+                        active -= 1
+                        continue
+                    item.start(remove_block_files)
+                    document = item.document
+                    progress.total += len(document.schedule)
+                    progress.refresh()
+                    for idx in document.schedule.order:
+                        running[executor.submit(
+                            TranslateProcess,
+                            document.schedule.jobs[idx],
+                            idx,
+                            document.file_dir,
+                            model_pool.choose() if model_pool else model,
+                            max_translation,
+                            document.md_file_name,
+                            chunk_concurrency,
+                            chunk_context,
+                            document.journal,
+                            model_pool
+                        )] = (item, idx)
+                    if not document.schedule.jobs:
+                        finish_item(item)
+                        active -= 1
+                elif future in running:
+                    item, idx = running.pop(future)
+                    try:
+                        block_file = future.result()
+                    except Exception as e:
+                        progress.write(f"\n{item.name} 处理章节 {idx + 1} 时出错: {str(e)}")
+                        block_file = None
+                    progress.update(1)
+                    if item.add(idx, block_file):
+                        finish_item(item)
+                        active -= 1
+
+
+def _run_batch_async(items, conversions, model, model_pool, max_translation, max_concurrent, chunk_concurrency,
+                     chunk_context, remove_block_files, max_active_documents, progress, finish_item, fail_item):
+    """在一个asyncio引擎中翻译所有文档，各模型的并发上限由引擎统一控制"""
+    from Async_translate import AsyncTranslationEngine
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        document_slots = asyncio.Semaphore(max_active_documents)
+
+        async with AsyncTranslationEngine() as engine:
+            with ThreadPoolExecutor(max_workers=1) as preparer:
+                async def run(item):
+                    try:
+                        await asyncio.wrap_future(conversions[item])
+                    except Exception as e:
+                        fail_item(item, e)
+                        return
+                    async with document_slots:
+                        try:
+                            await loop.run_in_executor(preparer, item.prepare, model, model_pool, max_concurrent,
+                                                       max_translation)
+                        except Exception as e:
+                            fail_item(item, e)
+                            return
+                        item.start(remove_block_files)
+                        document = item.document
+                        progress.total += len(document.schedule)
+                        progress.refresh()
+
+                        def on_done(idx, block_file):
+                            progress.update(1)
+                            if item.add(idx, block_file):
+                                finish_item(item)
+
+                        if not document.schedule.jobs:
+                            finish_item(item)
+                            return
+
+                        await engine.translate_sections(document.schedule.jobs, document.file_dir,
+                                                        model_pool.choose() if model_pool else model,
+                                                        max_translation, document.md_file_name, on_done,
+                                                        chunk_concurrency, chunk_context, document.journal,
+                                                        model_pool, document.schedule.order)
+
+                await asyncio.gather(*(run(item) for item in items))
+
+    asyncio.run(main())
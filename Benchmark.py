@@ -0,0 +1,592 @@
+"""
+性能基准测试，不依赖网络与API Key
+用法：python Benchmark.py [split] [align] [merge] [startup] [ocr_save] [section_merge] [pdf_text_layer]
+"""
+import base64
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from multiprocessing import get_context
+from pathlib import Path
+from types import SimpleNamespace
+
+import utils
+
+
+# 旧版分块实现（逐行尝试全部正则），仅用作正确性与性能对照
+def legacy_split_markdown_into_blocks(lines, skip_empty_line=True):
+    # 定义Markdown各个部分的正则表达式
+    patterns = {
+        "header": r"^(#{1,6})\s*(.*)",  # 匹配标题，#、##、### 等
+        "standard_link": r"^\s*\!\[(.*?)\]\((.*?)\)\s*$", # 匹配wiki型链接![[]]
+        "wiki_link": r"^\s*\!\[\[(.*?)\]\]\s*$",  # 匹配标准链接 ![alt text](url)
+        "code_block_start": r"^```",  # 匹配代码块开始 ```
+        "code_block_end": r"^```",  # 匹配代码块结束 ```
+        "formula_block_start": r"^\$\$\s*$",  # 匹配公式块开始 $$
+        "formula_block_end": r"^\$\$\s*$",  # 匹配公式块结束 $$
+        "single_line_formula": r"^\$\$.*\$\$$",  # 匹配单行公式 $formula$
+        "inline_formula": r"^\s*\$\s*.*\s*\$\s*$",
+        "yaml_start": r"^---\s*$",  # 匹配YAML头开始 ---
+        "yaml_end": r"^---\s*$",  # 匹配YAML头结束 ---
+        "table": r"^<table>.*</table>$",  # 匹配单行表格 <table>...</table>
+        "markdown_table_row": r"^\s*\|.*\|\s*$",  # 匹配Markdown表格行
+        "markdown_table_separator": r"^\s*\|[\s\-\|:]*\|\s*$",  # 匹配表格分隔符行
+    }
+
+    blocks = []
+
+    in_code_block = False
+    in_formula_block = False
+    in_yaml_block = False
+    in_markdown_table = False
+    current_code_block = []
+    current_formula_block = []
+    current_yaml_block = []
+    current_markdown_table = []
+
+    for line in lines:
+        # 处理代码块
+        if in_code_block:
+            current_code_block.append(line)
+            if re.match(patterns["code_block_end"], line):
+                # 代码块结束
+                blocks.append(("code_block", "".join(current_code_block)))
+                in_code_block = False
+                current_code_block = []
+            continue
+
+        # 处理公式块
+        if in_formula_block:
+            current_formula_block.append(line)
+            if re.match(patterns["formula_block_end"], line):
+                # 公式块结束
+                blocks.append(("formula", "".join(current_formula_block)))
+                in_formula_block = False
+                current_formula_block = []
+            continue
+
+        # 处理YAML头
+        if in_yaml_block:
+            current_yaml_block.append(line)
+            if re.match(patterns["yaml_end"], line):
+                # YAML头结束
+                blocks.append(("yaml", "".join(current_yaml_block)))
+                in_yaml_block = False
+                current_yaml_block = []
+            continue
+
+        # 处理Markdown表格
+        if in_markdown_table:
+            if re.match(patterns["markdown_table_row"], line) or re.match(patterns["markdown_table_separator"], line):
+                current_markdown_table.append(line)
+                continue
+            else:
+                # 表格结束
+                if current_markdown_table:
+                    blocks.append(("markdown_table", "".join(current_markdown_table)))
+                    in_markdown_table = False
+                    current_markdown_table = []
+                # 不要continue，因为当前行需要继续处理
+
+        # 匹配代码块开始
+        if re.match(patterns["code_block_start"], line):
+            in_code_block = True
+            current_code_block.append(line)
+            continue
+
+        # 匹配公式块开始
+        if re.match(patterns["formula_block_start"], line):
+            in_formula_block = True
+            current_formula_block.append(line)
+            continue
+
+        # 匹配YAML头开始
+        if re.match(patterns["yaml_start"], line):
+            in_yaml_block = True
+            current_yaml_block.append(line)
+            continue
+
+        # 匹配Markdown表格
+        if re.match(patterns["markdown_table_row"], line) and not in_markdown_table:
+            in_markdown_table = True
+            current_markdown_table.append(line)
+            continue
+
+        # 匹配标题
+        if re.match(patterns["header"], line):
+            # blocks.append(("header", re.match(patterns["header"], line).groups()))
+            blocks.append(("header", line))
+        # 匹配链接
+        elif re.findall(patterns["standard_link"], line):
+            # images = re.findall(patterns["image"], line)
+            # for alt_text, url in images:
+            #     blocks.append(("link", alt_text, url))
+            blocks.append(("link", line))
+        elif re.findall(patterns["wiki_link"], line):
+            # images = re.findall(patterns["image"], line)
+            # for alt_text, url in images:
+            #     blocks.append(("link", alt_text, url))
+            blocks.append(("link", line))
+        # 匹配单行公式
+        elif re.match(patterns["single_line_formula"], line):
+            blocks.append(("formula", line))
+        # 匹配单$包裹的单行公式
+        elif re.search(patterns["inline_formula"], line):
+            blocks.append(("formula", line))
+        # 匹配表格
+        elif re.match(patterns["table"], line):
+            blocks.append(("table", line))
+        # 跳过空行
+        elif not line.strip():
+            if skip_empty_line:
+                continue
+            else:
+                blocks.append(("empty_line", line))
+
+        # 匹配段落
+        else:
+            blocks.append(("paragraph", line))
+
+    # 处理文件末尾可能的未闭合表格
+    if in_markdown_table and current_markdown_table:
+        blocks.append(("markdown_table", "".join(current_markdown_table)))
+
+    return blocks
+
+
+# 旧版段落匹配（每个原文段落与全部译文段落做SequenceMatcher），仅用作对照
+def legacy_match_paragraphs(original_texts, translated_texts):
+    matches = []
+    for orig_idx, orig_text in enumerate(original_texts):
+        orig_preview = orig_text[:100] if len(orig_text) > 100 else orig_text
+        best_match_score = 0
+        best_match_idx = -1
+        for trans_idx, trans_content in enumerate(translated_texts):
+            matcher = SequenceMatcher(None, orig_preview,
+                                      trans_content[:100] if len(trans_content) > 100 else trans_content)
+            score = matcher.ratio()
+            if score > best_match_score:
+                best_match_score = score
+                best_match_idx = trans_idx
+        if best_match_idx != -1:
+            matches.append((orig_idx, best_match_idx))
+    return matches
+
+
+# 旧版块合并（每次用正则重新统计切片的单词数、重建后续标题列表），仅用作对照
+def legacy_merge_markdown_blocks(blocks, max_words, by_top_section=False, try_title=True):
+
+    # 统计指定索引之间的单词数
+    def count_words_between(blocks, start, end):
+        return sum(utils.count_words(block) for block in blocks[start:end])
+
+    # 合并指定索引之间的块
+    def merge_blocks(blocks, start, end):
+        return '\n\n'.join(block.text for block in blocks[start:end])  # 强化换行
+
+    # 记录所有标题块的索引位置
+    header_indices = [i for i, block in enumerate(blocks) if block.type == 'header']
+    if by_top_section:# 仅提取一级标题
+        header_indices = [i for i, block in enumerate(blocks) if block.type == 'header' and utils.determine_heading_level(block.text)==1]
+    current_index = 0
+    result = []
+
+    while current_index < len(blocks):
+        # 从最近的标题块开始计算单词数
+        # 记录所有大于当前块的标题块索引
+        possible_end_index = current_index
+        if try_title:
+            next_header_indices = [header_index for header_index in header_indices if header_index > current_index]
+
+            # 尝试合并当前块和最近标题块之间的块
+            for next_header_index in next_header_indices:
+                if count_words_between(blocks, current_index, next_header_index) > max_words:
+                    break
+                else:
+                    possible_end_index = next_header_index
+
+        # 如果没有找到合适的标题块，直接合并至最大长度
+        if possible_end_index == current_index:
+            end_index = current_index
+            while end_index < len(blocks) and count_words_between(blocks, current_index, end_index) < max_words:
+                end_index += 1
+            result.append(merge_blocks(blocks, current_index, end_index+1))
+            current_index = end_index+1
+        else:
+            result.append(merge_blocks(blocks, current_index, possible_end_index))
+            current_index = possible_end_index
+    return result
+
+
+# 生成指定大小的合成Markdown文本（按行返回），覆盖所有块类型
+def make_markdown_lines(target_bytes=4 * 1024 * 1024, seed=0):
+    rng = random.Random(seed)
+    words = ["microservice", "trace", "anomaly", "detection", "the", "of", "graph", "model",
+             "invocation", "latency", "系统", "异常", "we", "propose", "a", "novel", "approach"]
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(8, 30))).capitalize() + "."
+
+    samples = [
+        lambda: [f"{'#' * rng.randint(1, 4)} {rng.randint(1, 9)} {sentence()}\n", "\n"],
+        lambda: [" ".join(sentence() for _ in range(rng.randint(2, 8))) + "\n", "\n"],
+        lambda: [" ".join(sentence() for _ in range(rng.randint(2, 8))) + "\n", "\n"],
+        lambda: [" ".join(sentence() for _ in range(rng.randint(2, 8))) + "\n", "\n"],
+        lambda: ["$$\n", "E = mc^2 + \\sum_{i=1}^{n} x_i\n", "$$\n", "\n"],
+        lambda: ["$$ a^2 + b^2 = c^2 $$\n", "\n"],
+        lambda: ["  $ x_i \\in X $\n", "\n"],
+        lambda: ["```python\n", "def f(x):\n", "    return x\n", "```\n", "\n"],
+        lambda: ["| a | b |\n", "| --- | --- |\n", "| 1 | 2 |\n", "\n"],
+        lambda: [f"![img-{rng.randint(0, 99)}.jpeg](img-{rng.randint(0, 99)}.jpeg)\n", "\n"],
+        lambda: ["![[figure.png]]\n", "\n"],
+        lambda: ["<table><tr><td>1</td></tr></table>\n", "\n"],
+        lambda: ["- item with `code` and $x$ inline\n", "\n"],
+        lambda: ["---\n", "title: test\n", "---\n", "\n"],
+    ]
+
+    lines = []
+    size = 0
+    while size < target_bytes:
+        for line in rng.choice(samples)():
+            lines.append(line)
+            size += len(line.encode("utf-8"))
+    return lines
+
+
+def _timeit(func, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_split_markdown(target_mb=4):
+    """对比新旧split_markdown_into_blocks的吞吐量（行/秒），并校验结果一致"""
+    lines = make_markdown_lines(int(target_mb * 1024 * 1024))
+    print(f"[split] 测试文本: {target_mb}MB, {len(lines)} 行")
+
+    legacy_time, legacy_blocks = _timeit(legacy_split_markdown_into_blocks, lines)
+    new_time, new_blocks = _timeit(utils.split_markdown_into_blocks, lines)
+
+    assert list(legacy_blocks) == list(new_blocks), "新旧分块结果不一致"
+    print(f"[split] 旧实现: {len(lines) / legacy_time:,.0f} 行/秒 ({legacy_time:.3f}s)")
+    print(f"[split] 新实现: {len(lines) / new_time:,.0f} 行/秒 ({new_time:.3f}s)")
+    print(f"[split] 加速比: {legacy_time / new_time:.2f}x，块数 {len(new_blocks)}，结果一致")
+
+
+# 生成合成的原文段落及逐句对照译文段落（原文一句、译文一句），并给出正确的对齐结果
+def make_bilingual_section(n_paragraphs=500, seed=0):
+    rng = random.Random(seed)
+    words = ["microservice", "trace", "anomaly", "detection", "the", "of", "graph", "model",
+             "invocation", "latency", "we", "propose", "a", "novel", "approach", "span", "log"]
+    original_texts = []
+    translated_texts = []
+    expected = []
+    for orig_pos in range(n_paragraphs):
+        sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(6, 25))).capitalize() + "."
+                     for _ in range(rng.randint(1, 4))]
+        original_texts.append(" ".join(sentences) + "\n")
+        expected.append((orig_pos, len(translated_texts)))
+        for sentence in sentences:
+            translated_texts.append(sentence + "\n")
+            translated_texts.append("这是" + "译文" * rng.randint(3, 20) + "。\n")
+    return original_texts, translated_texts, expected
+
+
+def bench_align_paragraphs(n_paragraphs=500, legacy_sample=50):
+    """对比recover_paragraph中新旧段落对齐的耗时；旧实现按抽样段落的耗时线性外推"""
+    original_texts, translated_texts, expected = make_bilingual_section(n_paragraphs)
+    print(f"[align] 原文段落: {len(original_texts)}，译文段落: {len(translated_texts)}")
+
+    new_time, new_matches = _timeit(utils.align_paragraphs, original_texts, translated_texts)
+
+    sample = original_texts[:legacy_sample]
+    sample_time, legacy_matches = _timeit(legacy_match_paragraphs, sample, translated_texts, repeat=1)
+    legacy_time = sample_time * len(original_texts) / len(sample)
+
+    expected = set(expected)
+    legacy_correct = len(set(legacy_matches) & expected)
+    new_correct = len(set(new_matches) & expected)
+    print(f"[align] 旧实现: 约 {legacy_time:.2f}s（按 {len(sample)} 段抽样外推），抽样正确对齐 {legacy_correct}/{len(sample)}")
+    print(f"[align] 新实现: {new_time * 1000:.2f}ms，正确对齐 {new_correct}/{len(original_texts)}")
+    print(f"[align] 加速比: 约 {legacy_time / new_time:,.0f}x")
+
+
+def bench_merge_blocks(target_mb=2, max_words_list=(800, 4000)):
+    """对比新旧merge_markdown_blocks的耗时，并在各参数组合下校验结果一致"""
+    blocks = utils.split_markdown_into_blocks(make_markdown_lines(int(target_mb * 1024 * 1024)))
+    print(f"[merge] 测试文本: {target_mb}MB, {len(blocks)} 个块")
+
+    for max_words in max_words_list:
+        for by_top_section, try_title in ((False, True), (True, True), (False, False)):
+            args = (blocks, max_words, by_top_section, try_title)
+            legacy_time, legacy_result = _timeit(legacy_merge_markdown_blocks, *args, repeat=1)
+            new_time, new_result = _timeit(utils.merge_markdown_blocks, *args)
+            assert legacy_result == new_result, "新旧合并结果不一致"
+            print(f"[merge] max_words={max_words}, by_top_section={by_top_section}, try_title={try_title}: "
+                  f"旧实现 {legacy_time:.3f}s，新实现 {new_time * 1000:.2f}ms，"
+                  f"加速比 {legacy_time / new_time:,.0f}x，{len(new_result)} 段，结果一致")
+
+    # 边界参数只校验结果
+    small = blocks[:2000]
+    for words in (0, 1, 50, 10 ** 9):
+        for by_top_section, try_title in ((False, True), (True, True), (False, False)):
+            args = (small, words, by_top_section, try_title)
+            assert legacy_merge_markdown_blocks(*args) == utils.merge_markdown_blocks(*args), "新旧合并结果不一致"
+    print("[merge] 边界参数（max_words=0/1/50/1e9）结果一致")
+
+
+# 导入翻译模块时不应加载的重量级依赖，它们只在弹出对话框、OCR或显示进度时才需要
+HEAVY_MODULES = ("tkinter", "openai", "requests", "mistralai", "fuzzywuzzy", "tqdm", "aiohttp", "pymupdf")
+# 启动耗时的上限（秒），超出即视为回退
+MAX_IMPORT_SECONDS = 0.5
+MAX_SPAWN_SECONDS = 2.0
+
+
+def _run_python(code, *flags):
+    """在项目目录下用新的解释器执行code，返回(耗时, 标准输出, 标准错误)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.perf_counter() - start, result.stdout, result.stderr
+
+
+def _import_time(module, repeat=3):
+    """新解释器中导入module的耗时（秒），取-X importtime报告的累计耗时的最小值"""
+    best = float("inf")
+    for _ in range(repeat):
+        _, _, stderr = _run_python(f"import {module}", "-X", "importtime")
+        for line in stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == module:
+                best = min(best, int(fields[1]) / 1e6)
+    return best
+
+
+def bench_startup(workers=4, modules=("Translate", "Batch_translate", "Translate_cli")):
+    """
+    启动耗时：导入各入口模块的耗时、导入后已加载的重量级依赖，以及spawn方式启动进程池工作进程的耗时
+    （Windows和macOS默认以spawn启动工作进程，每个工作进程都要重新导入Translate）
+    """
+    for module in modules:
+        seconds = _import_time(module)
+        _, stdout, _ = _run_python(f"import sys, {module}; "
+                                   f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+        loaded = stdout.strip()
+        print(f"[startup] import {module}: {seconds * 1000:.1f}ms，已加载的重量级依赖: {loaded or '无'}")
+        assert not loaded, f"导入{module}时加载了重量级依赖: {loaded}"
+        assert seconds < MAX_IMPORT_SECONDS, f"导入{module}耗时{seconds:.2f}s，超过{MAX_IMPORT_SECONDS}s"
+
+    seconds, _, _ = _run_python("import sys, Translate_cli; Translate_cli.build_parser().parse_args(['x'])")
+    print(f"[startup] 命令行解析（含解释器启动）: {seconds * 1000:.1f}ms")
+
+    import Translate
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as executor:
+        # 工作进程反序列化Translate.prewarm_models时导入Translate，与翻译任务的导入开销相同
+        list(executor.map(Translate.prewarm_models, [[]] * workers))
+    seconds = time.perf_counter() - start
+    print(f"[startup] spawn启动 {workers} 个工作进程并导入Translate: {seconds * 1000:.1f}ms")
+    assert seconds < MAX_SPAWN_SECONDS, f"启动工作进程耗时{seconds:.2f}s，超过{MAX_SPAWN_SECONDS}s"
+
+
+# 旧版OCR结果保存（在主线程中逐张解码写入图片，拼接全部Markdown后一次写入），仅用作对照
+def legacy_save_ocr_results(ocr_response, pdf_path):
+    from Mistral_OCR import replace_images_in_markdown
+
+    pdf_file = Path(pdf_path)
+    pdf_dir = pdf_file.parent
+    pdf_name = pdf_file.stem
+    images_dir = pdf_dir / f"{pdf_name}.assets"
+    os.makedirs(images_dir, exist_ok=True)
+
+    all_markdowns = []
+    for page in ocr_response.pages:
+        page_images = {}
+        for img in page.images:
+            img_data = base64.b64decode(img.image_base64.split(',')[1])
+            img_path = images_dir / f"{img.id}.png"
+            with open(img_path, 'wb') as f:
+                f.write(img_data)
+            page_images[img.id] = f"{pdf_name}.assets/{img.id}.png"
+        page_markdown = replace_images_in_markdown(page.markdown, page_images)
+        all_markdowns.append(page_markdown)
+
+    markdown_path = pdf_dir / f"{pdf_name}.md"
+    with open(markdown_path, 'w', encoding='utf-8') as f:
+        f.write("\n\n".join(all_markdowns))
+
+
+def make_ocr_response(n_pages=300, image_kb=200, seed=0):
+    """模拟扫描版论文的OCR结果：每页一张不同的插图和一个相同的页眉logo"""
+    rng = random.Random(seed)
+    logo = "data:image/jpeg;base64," + base64.b64encode(rng.randbytes(8 * 1024)).decode()
+    lines = make_markdown_lines(n_pages * 3 * 1024, seed)
+    per_page = max(1, len(lines) // n_pages)
+    pages = []
+    for i in range(n_pages):
+        figure = "data:image/jpeg;base64," + base64.b64encode(rng.randbytes(image_kb * 1024)).decode()
+        images = [SimpleNamespace(id=f"img-{2 * i}.jpeg", image_base64=logo),
+                  SimpleNamespace(id=f"img-{2 * i + 1}.jpeg", image_base64=figure)]
+        markdown = (f"![img-{2 * i}.jpeg](img-{2 * i}.jpeg)\n\n" + "".join(lines[i * per_page:(i + 1) * per_page])
+                    + f"\n![img-{2 * i + 1}.jpeg](img-{2 * i + 1}.jpeg)\n")
+        pages.append(SimpleNamespace(index=i, markdown=markdown, images=images))
+    return SimpleNamespace(pages=pages)
+
+
+def _saved_document(pdf_path):
+    """读取保存结果，把Markdown中的图片引用替换为图片内容，用于比较两种保存方式的结果是否等价"""
+    pdf_dir = Path(pdf_path).parent
+    markdown = (pdf_dir / f"{Path(pdf_path).stem}.md").read_text(encoding='utf-8')
+    return re.sub(r"\]\(([^)]+\.png)\)", lambda m: "](" + str(hash((pdf_dir / m.group(1)).read_bytes())) + ")", markdown)
+
+
+def bench_ocr_save(n_pages=300, image_kb=200):
+    """对比新旧save_ocr_results的耗时，并校验Markdown及其引用的图片内容一致"""
+    from Mistral_OCR import save_ocr_results
+
+    response = make_ocr_response(n_pages, image_kb)
+    print(f"[ocr_save] 测试数据: {n_pages} 页，每页1张{image_kb}KB插图和1个重复的logo")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, save in (("旧实现", legacy_save_ocr_results), ("新实现", save_ocr_results)):
+            pdf_path = os.path.join(tmp, name, "paper.pdf")
+            os.makedirs(os.path.dirname(pdf_path))
+            start = time.perf_counter()
+            save(response, pdf_path)
+            seconds = time.perf_counter() - start
+            assets = os.path.join(os.path.dirname(pdf_path), "paper.assets")
+            count = len(os.listdir(assets))
+            size = sum(os.path.getsize(os.path.join(assets, f)) for f in os.listdir(assets))
+            results[name] = _saved_document(pdf_path)
+            shutil.rmtree(assets)
+            # 另行统计保存过程中额外占用的内存峰值（不含OCR结果本身）
+            tracemalloc.start()
+            save(response, pdf_path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            shutil.rmtree(assets)
+            print(f"[ocr_save] {name}: {seconds:.3f}s，额外内存峰值 {peak / 1024 / 1024:.1f}MB，"
+                  f"保存 {count} 张图片，共 {size / 1024 / 1024:.1f}MB")
+    assert results["旧实现"] == results["新实现"], "新旧保存结果不一致"
+    print("[ocr_save] Markdown及引用的图片内容一致")
+
+
+def make_born_digital_pdf(pdf_path, n_pages=30, seed=0):
+    """用pymupdf生成带文本层的论文：每页两个带编号的小节标题和正文段落，首页有论文标题"""
+    import pymupdf
+
+    rng = random.Random(seed)
+    words = "the model uses attention layers to learn representations of input sequences efficiently".split()
+    doc = pymupdf.open()
+    for page_no in range(n_pages):
+        page = doc.new_page()
+        y = 60
+        if page_no == 0:
+            page.insert_text((72, y), "A Synthetic Paper Title", fontsize=18, fontname="hebo")
+            y += 40
+        for section in range(2):
+            page.insert_text((72, y), f"{page_no + 1}.{section + 1} Section {page_no}", fontsize=13, fontname="hebo")
+            body = " ".join(rng.choice(words) for _ in range(170)).capitalize() + "."
+            page.insert_textbox(pymupdf.Rect(72, y + 10, 520, y + 300), body, fontsize=10, fontname="helv")
+            y += 330
+        page.insert_text((300, 810), str(page_no + 1), fontsize=9)
+    doc.save(pdf_path)
+    doc.close()
+
+
+def bench_pdf_text_layer(n_pages=30):
+    """带文本层的PDF在本地转换为Markdown的耗时（检测+提取），并校验标题和段落能被split_markdown_into_blocks识别"""
+    from PDF_backends import TextLayerBackend, choose_pdf_backend
+
+    if not TextLayerBackend().available():
+        print("[pdf_text_layer] 未安装pymupdf，跳过")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "paper.pdf")
+        make_born_digital_pdf(pdf_path, n_pages)
+        start = time.perf_counter()
+        backend = choose_pdf_backend(pdf_path, ocr_api_key="", preference="auto")
+        detect_seconds = time.perf_counter() - start
+        assert isinstance(backend, TextLayerBackend), "带文本层的PDF未选择本地转换"
+        backend.convert(pdf_path)
+        seconds = time.perf_counter() - start
+        with open(os.path.join(tmp, "paper.md"), "r", encoding="utf-8") as f:
+            blocks = utils.split_markdown_into_blocks(f.readlines())
+    headers = sum(block.type == "header" for block in blocks)
+    paragraphs = sum(block.type == "paragraph" for block in blocks)
+    print(f"[pdf_text_layer] {n_pages} 页：检测文本层 {detect_seconds * 1000:.1f}ms，检测+转换共 {seconds:.3f}s")
+    assert headers == n_pages * 2 + 1 and paragraphs == n_pages * 2, f"标题{headers}个、段落{paragraphs}个，与预期不符"
+    print(f"[pdf_text_layer] 识别出 {headers} 个标题、{paragraphs} 个段落，与预期一致")
+
+
+def bench_section_merge(n_sections=200, section_kb=256, seed=0):
+    """
+    乱序完成的章节块文件经OrderedSectionMerger合并的耗时，与逐个读入再写出的旧方式对比；
+    校验合并结果一致，并确认支持sendfile的平台上每个块文件都经sendfile复制
+    """
+    from Translate import OrderedSectionMerger
+
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        block_files = []
+        for idx in range(n_sections):
+            block_file = os.path.join(tmp, f"block_{idx}.md")
+            with open(block_file, 'w', encoding='utf-8') as f:
+                f.write(f"## 章节{idx}\n" + "译文内容 translated text\n" * (section_kb * 1024 // 32))
+            block_files.append(block_file)
+        order = list(range(n_sections))
+        rng.shuffle(order)
+
+        legacy_file = os.path.join(tmp, "legacy.md")
+        start = time.perf_counter()
+        with open(legacy_file, 'w', encoding='utf-8') as out:
+            out.write("# header\n")
+            for block_file in block_files:
+                with open(block_file, 'r', encoding='utf-8') as f:
+                    out.write(f.read() + "\n")
+        legacy_seconds = time.perf_counter() - start
+
+        output_file = os.path.join(tmp, "merged.md")
+        start = time.perf_counter()
+        with OrderedSectionMerger(output_file, n_sections, "# header\n") as merger:
+            for idx in order:
+                merger.add(idx, block_files[idx])
+        seconds = time.perf_counter() - start
+
+        with open(legacy_file, 'rb') as f1, open(output_file, 'rb') as f2:
+            assert f1.read() == f2.read(), "合并结果不一致"
+    size_mb = n_sections * section_kb / 1024
+    print(f"[section_merge] {n_sections} 个章节共 {size_mb:.0f}MB：旧方式 {legacy_seconds:.3f}s，"
+          f"OrderedSectionMerger {seconds:.3f}s，其中 {merger.sendfile_count} 个块文件经sendfile复制")
+    if hasattr(os, 'sendfile'):
+        assert merger.sendfile_count == n_sections, "sendfile未生效，已退回普通复制"
+    print("[section_merge] 合并结果一致")
+
+
+BENCHMARKS = {
+    "split": bench_split_markdown,
+    "align": bench_align_paragraphs,
+    "merge": bench_merge_blocks,
+    "startup": bench_startup,
+    "ocr_save": bench_ocr_save,
+    "section_merge": bench_section_merge,
+    "pdf_text_layer": bench_pdf_text_layer,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
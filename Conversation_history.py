@@ -0,0 +1,60 @@
+from utils import estimate_tokens
+
+# 每条消息除内容外的格式开销（role等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ConversationHistory:
+    """
+    带token预算的多轮对话历史
+    固定保留系统提示词和示例对话，其余轮次超出预算时从最早的一轮开始裁剪，最新的一条消息始终保留
+    用法与列表相同（append/pop），发送请求时使用window()得到裁剪后的消息列表
+    """
+
+    def __init__(self, pinned_messages, max_tokens=None, count_tokens=estimate_tokens):
+        """
+        Args:
+            pinned_messages: 始终保留的消息（系统提示词+示例对话）
+            max_tokens: 整个对话历史的token预算，None表示不裁剪
+            count_tokens: 计算文本token数的函数
+        """
+        self.pinned = list(pinned_messages)
+        self.turns = []
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        # 累计因裁剪而少发送的prompt token数
+        self.saved_tokens = 0
+        self._pinned_tokens = sum(self._message_tokens(message) for message in self.pinned)
+        self._turn_tokens = []
+
+    def _message_tokens(self, message):
+        return self.count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def append(self, message):
+        self.turns.append(message)
+        self._turn_tokens.append(self._message_tokens(message))
+
+    def pop(self):
+        self._turn_tokens.pop()
+        return self.turns.pop()
+
+    def __len__(self):
+        return len(self.pinned) + len(self.turns)
+
+    def window(self):
+        """返回不超过token预算的消息列表，并累计本次裁剪节省的token数"""
+        if self.max_tokens is None or not self.turns:
+            return self.pinned + self.turns
+
+        budget = self.max_tokens - self._pinned_tokens
+        start = len(self.turns) - 1
+        used = self._turn_tokens[start]
+        while start > 0 and used + self._turn_tokens[start - 1] <= budget:
+            start -= 1
+            used += self._turn_tokens[start]
+        # 保证保留的历史以user消息开头，不拆开一问一答
+        while start < len(self.turns) - 1 and self.turns[start]["role"] != "user":
+            start += 1
+
+        self.saved_tokens += sum(self._turn_tokens[:start])
+        return self.pinned + self.turns[start:]
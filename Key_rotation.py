@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+from Retry_policy import limiter_outcome
+
+# 有多个key时，某个key被限流(429)后至少暂停使用的秒数，连续被限流时加倍；服务端给出的Retry-After更长时以其为准
+KEY_COOLDOWN_SECONDS = 20
+KEY_MAX_COOLDOWN_SECONDS = 300
+# 某个key连续失败多少次后不再使用（如余额不足、配额耗尽）
+KEY_EVICT_THRESHOLD = 5
+# 与具体API key有关的错误类型，换用其他key可能成功
+KEY_ERRORS = {"rate_limited", "auth"}
+
+
+def key_fingerprint(api_key):
+    """API key的摘要，用于区分各key的限速状态，不在状态文件中保存key本身"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class ApiKey:
+    """单个API key及其状态"""
+
+    def __init__(self, api_key, limiter=None):
+        self.api_key = api_key
+        self.limiter = limiter
+        # 被限流后暂停使用，直到该时间(time.monotonic)
+        self.cooldown_until = 0
+        self.failures = 0
+        self.evicted = False
+
+    def __str__(self):
+        return f"...{self.api_key[-4:]}"
+
+
+class KeyRing:
+    """
+    同一服务商多个API key的轮换器
+    请求按顺序轮流使用各个key；每个key有独立的限速状态（rpm、tpm、并发上限按key计算），
+    被限流后暂停使用一段时间，鉴权失败或连续失败多次的key被移除，至少保留一个key
+    只有1个key时不暂停也不移除，行为与单key相同
+    暂停和移除只在当前进程内生效，限速状态由所有进程共享
+    用法：
+        api_key, slot = ring.acquire(estimated_tokens)
+        ...用api_key.api_key发送请求...
+        ring.release(api_key, slot, kind, retry_after, estimated_tokens, actual_tokens)
+    """
+
+    def __init__(self, name, keys, limiter_factory=None):
+        """
+        Args:
+            name: 服务商名称，用于打印提示
+            keys: API key列表
+            limiter_factory: 根据API key创建限速器的函数，返回None表示不限速
+        """
+        self.name = name
+        self.keys = [ApiKey(key, limiter_factory(key) if limiter_factory else None) for key in keys]
+        # 是否有key需要限速，没有时无需预估请求的token数
+        self.limited = any(key.limiter is not None for key in self.keys)
+        # 不同进程从不同的key开始轮换
+        self._cursor = os.getpid()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, estimated_tokens=0):
+        """
+        按轮换顺序选择一个可用的key，并获取该key的限速额度
+        Returns:
+            tuple: (ApiKey, 名额编号或None, 0)；暂无可用的key时(None, None, 建议等待的秒数)；
+                   没有key时(None, None, None)
+        """
+        with self._lock:
+            start = self._cursor
+            self._cursor += 1
+        now = time.monotonic()
+        waits = []
+        for i in range(len(self.keys)):
+            key = self.keys[(start + i) % len(self.keys)]
+            if key.evicted:
+                continue
+            if key.cooldown_until > now:
+                waits.append(key.cooldown_until - now)
+                continue
+            if key.limiter is None:
+                return key, None, 0
+            slot, wait = key.limiter.try_acquire(estimated_tokens)
+            if slot is not None:
+                return key, slot, 0
+            waits.append(wait)
+        return None, None, min(waits) if waits else None
+
+    def acquire(self, estimated_tokens=0):
+        """阻塞直到有可用的key，返回(ApiKey, 名额编号或None)，没有key时返回(None, None)"""
+        while True:
+            key, slot, wait = self.try_acquire(estimated_tokens)
+            if wait is None or key is not None:
+                return key, slot
+            time.sleep(wait)
+
+    async def acquire_async(self, estimated_tokens=0, executor=None):
+        """acquire的异步版本，限速器的SQLite事务在executor（默认为事件循环的默认线程池）中执行，等待期间不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            key, slot, wait = await loop.run_in_executor(executor, self.try_acquire, estimated_tokens)
+            if wait is None or key is not None:
+                return key, slot
+            await asyncio.sleep(wait)
+
+    def release(self, key, slot, kind="ok", retry_after=None, estimated_tokens=0, actual_tokens=None):
+        """
+        释放key的限速名额，并根据请求结果更新key的状态
+        Args:
+            key: acquire返回的ApiKey
+            slot: acquire返回的名额编号
+            kind: "ok"表示请求成功，否则为Retry_policy中的错误类型
+            retry_after: 服务端给出的Retry-After秒数
+            estimated_tokens: acquire时预估的token数
+            actual_tokens: 服务端返回的实际token数
+        """
+        if slot is not None:
+            key.limiter.release(slot, "ok" if kind == "ok" else limiter_outcome(kind), estimated_tokens, actual_tokens)
+        with self._lock:
+            if kind == "ok":
+                key.failures = 0
+                return
+            if kind not in KEY_ERRORS or len(self.keys) == 1:
+                return
+            key.failures += 1
+            live = sum(not other.evicted for other in self.keys)
+            if live > 1 and (kind == "auth" or key.failures >= KEY_EVICT_THRESHOLD):
+                key.evicted = True
+                reason = "鉴权失败或余额不足" if kind == "auth" else f"连续被限流 {key.failures} 次"
+                print(f"\n{self.name} 的API key {key} {reason}，不再使用，剩余 {live - 1} 个key")
+            elif kind == "rate_limited":
+                cooldown = max(retry_after or 0,
+                               min(KEY_MAX_COOLDOWN_SECONDS, KEY_COOLDOWN_SECONDS * 2 ** (key.failures - 1)))
+                key.cooldown_until = time.monotonic() + cooldown
+
+    def can_switch(self, key, kind):
+        """失败原因与key有关，且还有其他可用的key时，可以立即换用其他key重试"""
+        if kind not in KEY_ERRORS or len(self.keys) == 1:
+            return False
+        now = time.monotonic()
+        return any(other is not key and not other.evicted and other.cooldown_until <= now for other in self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+# 每个进程按(进程号, 服务商, key列表)缓存的轮换器
+_KEY_RINGS = {}
+
+
+def get_key_ring(name, keys, limiter_factory=None):
+    """获取当前进程中对应服务商和key列表的轮换器，不存在则创建"""
+    cache_key = (os.getpid(), name, tuple(keys))
+    ring = _KEY_RINGS.get(cache_key)
+    if ring is None:
+        ring = _KEY_RINGS.setdefault(cache_key, KeyRing(name, keys, limiter_factory))
+    return ring
@@ -2,6 +2,30 @@ from LLM_tools import LLM_model
 
 # 配置你的Mistral OCR API，用于将PDF转换为Markdown
 Mistral_OCR_API = ""
+# 同时进行OCR的PDF数，批量翻译时OCR与已转换文档的翻译同时进行
+Mistral_OCR_max_concurrent = 2
+# 页数超过该值的PDF按页码范围分段OCR，各段并行处理、独立重试，最后按页码顺序拼接
+Mistral_OCR_shard_pages = 50
+# 单个PDF同时OCR的分段数
+Mistral_OCR_shard_concurrent = 3
+# PDF转Markdown的方式："auto"按PDF是否有完整的文本层自动选择，"text_layer"只在本地提取文本层（需pip install pymupdf），
+# "mistral_ocr"只使用Mistral OCR；公式较多的PDF在配置了OCR时仍使用OCR，以便公式识别为LaTeX
+PDF_backend = "auto"
+
+# 翻译缓存文件（相对路径相对于本项目目录），重复翻译相同内容时直接使用缓存结果，留空则不使用缓存
+# 查看或清理缓存：python Translation_cache.py stats / prune --max-mb 100 / clear
+Translation_cache_path = "translation_cache.sqlite3"
+# 翻译缓存的容量上限(MB)，超出时淘汰最久未使用的条目
+Translation_cache_max_mb = 512
+
+# OCR缓存文件（相对路径相对于本项目目录），内容相同的PDF再次转换时直接使用缓存结果，不再上传和OCR，留空则不使用缓存
+# 查看或清理缓存：python OCR_cache.py stats / prune --max-mb 500 / clear
+OCR_cache_path = "ocr_cache.sqlite3"
+# OCR缓存的容量上限(MB)，超出时淘汰最久未使用的文档
+OCR_cache_max_mb = 2048
+
+# 速率限制状态文件（相对路径相对于本项目目录），所有翻译进程通过它共享各模型的rpm/tpm额度和并发上限
+Rate_limit_path = "rate_limits.sqlite3"
 
 '''
 配置你要用的LLM模型，部分主流模型的URL等信息已经配置好，只需要修改APIkey和model_name即可
@@ -15,10 +39,24 @@ MyLLMs = [
         model_name="deepseek-chat",
         # url地址，默认不需要修改
         post_url="https://api.deepseek.com/v1/chat/completions",
-        # 填入你的APIkey
+        # 填入你的APIkey，有多个key时可填入列表，如["sk-1", "sk-2"]，请求会在各key间轮换
         api_key="",
-        # 翻译的并行度，数字越大翻译越快，但也越容易超过并发限制，建议不超过3
+        # 翻译的并行度，数字越大翻译越快，但也越容易超过并发限制，建议不超过3；填入多个key时为每个key的并行度
         max_concurrent=3,
+        # 可选：每个进程的HTTP连接池大小（默认等于max_concurrent），以及是否在翻译开始前预先建立连接
+        # pool_size=3,
+        # prewarm=True,
+        # 可选：章节内多轮对话历史的token预算（默认8000），超出时裁剪最早的轮次，None表示不裁剪
+        # history_tokens=8000,
+        # 可选：服务商的速率限制，每分钟请求数和每分钟token数，所有翻译进程共享额度，多个key时按每个key计算
+        # rpm=60,
+        # tpm=100000,
+        # 可选：根据限流情况自动调整并发数，此时max_concurrent作为并发上限，可以设置得大一些
+        # adaptive_concurrency=True,
+        # 可选：单次请求的输出token上限（默认4096），待翻译的片段按它拆分，上限越大每次翻译的内容越多
+        # max_output_tokens=8192,
+        # 可选：估算token数的校准系数（默认1.0），服务端返回的token数明显多于估算时可调大
+        # token_scale=1.2,
     ),
     # 通义千问
     LLM_model(
@@ -89,15 +127,16 @@ MyLLMs = [
 ]
 
 
-def ChooseLLM(MyLLMs):
+def ChooseLLM(MyLLMs, allow_pool=False):
     """
     通过控制台交互，让用户选择要使用的LLM模型。
 
     Args:
         MyLLMs: LLM模型列表
+        allow_pool: 可用模型不止1个时，是否提供"使用全部模型"选项
 
     Returns:
-        用户选择的LLM_model对象
+        用户选择的LLM_model对象，选择全部模型时返回ModelPool
     """
     # 筛选出api_key不为空的LLM模型
     valid_llms = [llm for llm in MyLLMs if llm.api_key]
@@ -111,12 +150,18 @@ def ChooseLLM(MyLLMs):
         return None
 
     print("可用的LLM模型:")
+    if allow_pool:
+        print("[0] 全部模型（按各模型的速度和稳定性分配任务，某个模型出错时自动切换）")
     for i, llm in enumerate(valid_llms):
         print(f"[{i + 1}] {llm.model_name}")
 
     while True:
         try:
             choice = int(input("请选择要使用的LLM模型 (输入序号): "))
+            if allow_pool and choice == 0:
+                from Model_pool import ModelPool
+                print(f"已选择全部模型: {', '.join(llm.model_name for llm in valid_llms)}")
+                return ModelPool(valid_llms)
             if 1 <= choice <= len(valid_llms):
                 selected_llm = valid_llms[choice - 1]
                 print(f"已选择: {selected_llm.model_name}")
@@ -1,9 +1,41 @@
 import json
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple, Dict, List, Any
+from urllib.parse import urlsplit
 
-import requests
-from openai import OpenAI
+from Key_rotation import get_key_ring, key_fingerprint
+from Model_pool import record_request
+from Rate_limiter import get_rate_limiter
+from Retry_policy import classify_status, continuation_messages, get_circuit_breaker, is_retryable, retry_delay
+from Stream_sinks import OutputSink, BufferedFileSink, open_sink
+from utils import estimate_tokens
+
+
+# 每个进程内按(进程号, 服务地址)缓存的HTTP会话，复用keep-alive连接，避免每次请求重新握手
+_SESSIONS = {}
+
+
+def get_session(post_url, pool_size=4):
+    """
+    获取当前进程中对应服务地址的连接池会话，不存在则创建
+    Args:
+        post_url: 请求地址，按scheme+host区分会话
+        pool_size: 连接池大小
+    """
+    parts = urlsplit(post_url or "")
+    key = (os.getpid(), parts.scheme, parts.netloc)
+    session = _SESSIONS.get(key)
+    if session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _SESSIONS[key] = session
+    return session
 
 
 class LLM_basic:
@@ -14,25 +46,102 @@ class LLM_basic:
 
 
 class LLM_model:
-    def __init__(self, model_name, api_key="",post_url=None,LLM: LLM_basic =None , max_concurrent=2, max_translations=1000):
+    def __init__(self, model_name, api_key="",post_url=None,LLM: LLM_basic =None , max_concurrent=2, max_translations=1000,
+                 pool_size=None, prewarm=False, history_tokens=8000, rpm=None, tpm=None, adaptive_concurrency=False,
+                 max_output_tokens=4096, tokenizer=None, token_scale=1.0):
         self.model_name = model_name
         if LLM:
             self.api_key = LLM.api_key
             self.base_url = LLM.base_url
             self.post_url = LLM.post_url
-        self.api_key = api_key
+        # api_key可以是多个key的列表，请求在各key间轮换
+        self.api_keys = [key for key in ([api_key] if isinstance(api_key, str) else api_key) if key] or [""]
+        self.api_key = self.api_keys[0]
         if post_url:
             self.post_url = post_url
-        self.max_concurrent = max_concurrent
+        # 每个API key的并行度，总并行度max_concurrent随key的数量增加
+        self.key_concurrent = max_concurrent
         self.max_translations = max_translations
+        # 连接池大小，默认与并行度一致
+        self.pool_size = pool_size or max(max_concurrent, 1)
+        # 是否在提交第一个章节前预先建立连接
+        self.prewarm_on_start = prewarm
+        # 章节内多轮对话历史的token预算，超出时裁剪最早的轮次，None表示不裁剪
+        self.history_tokens = history_tokens
+        # 服务商的速率限制：每分钟请求数、每分钟token数，所有进程共享
+        self.rpm = rpm
+        self.tpm = tpm
+        # 是否根据限流情况自动调整同时在途的请求数（每个key不超过其并行度）
+        self.adaptive_concurrency = adaptive_concurrency
+        # 单次请求的输出token上限，按它拆分待翻译的片段
+        self.max_output_tokens = max_output_tokens
+        # tiktoken编码名，None表示按模型名自动查找，找不到时按字符估算
+        self.tokenizer = tokenizer
+        # 估算token数的校准系数（实际token数/估算token数），可参考服务端返回的usage调整
+        self.token_scale = token_scale
+
+    @property
+    def max_concurrent(self):
+        """总并行度：每个API key的并行度×key的数量"""
+        return self.key_concurrent * len(self.api_keys)
+
+    def session(self):
+        """当前进程中该模型服务地址的连接池会话"""
+        return get_session(self.post_url, self.pool_size)
+
+    def provider_key(self):
+        """服务商标识：服务地址+模型名，限速和熔断均按此区分"""
+        return f"{urlsplit(self.post_url or '').netloc}/{self.model_name}"
+
+    def rate_limiter(self, api_key=None):
+        """
+        该模型跨进程共享的限速器，未配置速率限制时返回None
+        有多个API key时每个key一个限速器，rpm、tpm和并发上限按key分别计算
+        """
+        key = self.provider_key()
+        if api_key is not None and len(self.api_keys) > 1:
+            key = f"{key}#{key_fingerprint(api_key)}"
+        return get_rate_limiter(key, self.rpm, self.tpm, self.key_concurrent, self.adaptive_concurrency)
+
+    def key_ring(self):
+        """当前进程中该模型的API key轮换器"""
+        return get_key_ring(self.provider_key(), self.api_keys, self.rate_limiter)
+
+    def circuit_breaker(self):
+        """当前进程中该模型的熔断器"""
+        return get_circuit_breaker(self.provider_key())
+
+    def prewarm(self, connections=1):
+        """
+        预先建立到服务地址的连接（TCP+TLS握手），之后的请求直接复用连接池中的连接
+        Args:
+            connections: 要建立的连接数，不超过连接池大小
+        """
+        parts = urlsplit(self.post_url or "")
+        if not parts.netloc:
+            return
+        import requests
+        origin = f"{parts.scheme}://{parts.netloc}/"
+        session = self.session()
+
+        def open_connection(_):
+            try:
+                session.head(origin, timeout=5)
+            except requests.RequestException:
+                pass
+
+        connections = max(1, min(connections, self.pool_size))
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            list(executor.map(open_connection, range(connections)))
 
     def set_max_concurrent(self, max_concurrent):
-        self.max_concurrent = max_concurrent
+        self.key_concurrent = max_concurrent
 
     def set_max_translations(self, max_translations):
         self.max_translations = max_translations
 
     def test_by_client(self):
+        from openai import OpenAI
         client = OpenAI(
             api_key=self.api_key,
             base_url=self.base_url,
@@ -71,7 +180,7 @@ class LLM_model:
         }
 
         # 发送POST请求并启用流式接收
-        with requests.post(self.post_url, headers=headers, json=data, stream=True) as response:
+        with self.session().post(self.post_url, headers=headers, json=data, stream=True) as response:
             response.raise_for_status()
 
             # 遍历流式响应的内容
@@ -116,7 +225,7 @@ class LLM_model:
         #记录用时
         start_time = time.time()
         # 发送POST请求并启用流式接收
-        with requests.post(self.post_url, headers=headers, json=data, stream=True) as response:
+        with self.session().post(self.post_url, headers=headers, json=data, stream=True) as response:
             response.raise_for_status()
 
             # 遍历流式响应的内容
@@ -165,7 +274,7 @@ class LLM_model:
         #记录用时
         start_time = time.time()
         # 发送POST请求并启用流式接收
-        with requests.post(self.post_url, headers=headers, json=data, stream=True) as response:
+        with self.session().post(self.post_url, headers=headers, json=data, stream=True) as response:
             response.raise_for_status()
 
             # 遍历流式响应的内容
@@ -204,7 +313,8 @@ class LLM_model:
             "max_tokens": max_tokens,
         }
 
-        with requests.post(self.post_url, headers=headers, json=data, stream=True) as response:
+        with self.session().post(self.post_url, headers=headers, json=data, stream=True) as response, \
+                BufferedFileSink(output_file) as sink:
             response.raise_for_status()
 
             for line in response.iter_lines():
@@ -221,18 +331,94 @@ class LLM_model:
                                 if 'content' in delta:
                                     content = delta['content']
                                     # print(content, end='', flush=True)
-                                    with open(output_file, 'a', encoding='utf-8') as f:
-                                        f.write(content)
+                                    sink.write(content)
                         except json.JSONDecodeError:
                             continue
-            with open(output_file, 'a', encoding='utf-8') as f:
-                f.write("\n")
+            sink.write("\n")
+
+def build_chat_request(model, system_prompt=None, prompt=None, messages=None, max_tokens=4096, temperature=0.7):
+    """
+    构造流式chat/completions请求的请求头和请求体
+    Returns:
+        tuple: (headers, data)
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {model.api_key}"
+    }
+
+    # 准备请求数据
+    if messages is None:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        if prompt:
+            messages.append({"role": "user", "content": prompt})
+
+    data = {
+        "model": model.model_name,
+        "messages": messages,
+        "stream": True,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    return headers, data
+
+
+def estimate_request_tokens(data):
+    """
+    预估一次请求消耗的token数，用于按tpm限速
+    prompt按全部消息估算，输出按最后一条用户消息的两倍估算（逐句对照约为原文的两倍），不超过max_tokens
+    """
+    messages = data.get("messages", [])
+    prompt_tokens = sum(estimate_tokens(message.get("content") or "") for message in messages)
+    last_tokens = estimate_tokens(messages[-1].get("content") or "") if messages else 0
+    return prompt_tokens + min(last_tokens * 2, data.get("max_tokens") or last_tokens * 2)
+
+
+def classify_exception(error):
+    """
+    对requests请求异常分类
+    Returns:
+        tuple: (错误类型, Retry-After等待秒数或None)，错误类型见Retry_policy
+    """
+    import requests
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return classify_status(error.response.status_code, error.response.headers)
+    if isinstance(error, requests.Timeout):
+        return "timeout", None
+    if isinstance(error, (requests.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        return "connection", None
+    return "other", None
+
+
+def parse_sse_line(line):
+    """
+    解析一行SSE数据
+    Returns:
+        tuple: (是否结束, json数据)，非数据行或无法解析时json数据为None
+    """
+    if not line:
+        return False, None
+    decoded_line = line.decode('utf-8') if isinstance(line, bytes) else line
+    decoded_line = decoded_line.strip()
+    if not decoded_line.startswith("data: "):
+        return False, None
+
+    decoded_line = decoded_line[len("data: "):]
+    if decoded_line == "[DONE]":
+        return True, None
+    try:
+        return False, json.loads(decoded_line)
+    except json.JSONDecodeError:
+        return False, None
+
 
 def LLM_Stream_Response(
         model: LLM_model,
         system_prompt = "You're a helpful assistant.",prompt = None,
         messages: List[Dict[str, str]] = None,
-        write_file = None,
+        write_file: str | OutputSink = None,
         max_tokens = 4096,max_retry: int = 3,timeout = 10,
         temperature: float = 0.7
 ) -> tuple[str | Any, Any] :
@@ -245,7 +431,7 @@ def LLM_Stream_Response(
         system_prompt: 系统提示
         prompt: 用户提示
         messages: 对话历史，如果提供则忽略system_prompt和prompt
-        write_file: 写入结果的文件路径，如果提供则以追加形式写入
+        write_file: 写入结果的文件路径或OutputSink，文件路径会以带缓冲的追加形式写入
         max_retry: 最大重试次数
         temperature: 温度参数
         max_tokens: 最大生成token数
@@ -255,83 +441,131 @@ def LLM_Stream_Response(
         tuple: (生成的文本内容, token统计字典)
         如果调用失败，返回(None, None)
     """
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {model.api_key}"
-    }
-
-    # 准备请求数据
-    if messages is None:
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        if prompt:
-            messages.append({"role": "user", "content": prompt})
+    headers, data = build_chat_request(model, system_prompt, prompt, messages, max_tokens, temperature)
 
-    data = {
-        "model": model.model_name,
-        "messages": messages,
-        "stream": True,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-    }
+    sink, owns_sink = open_sink(write_file)
 
-    response_content = ""
-    retry_count = 0
-    token_stats = None
-
-    while retry_count < max_retry:
-        try:
-            with requests.post(
-                model.post_url,
-                headers=headers,
-                json=data,
-                stream=True,
-                timeout=timeout
-            ) as response:
-                response.raise_for_status()
-
-                for line in response.iter_lines():
-                    if not line:
-                        continue
+    try:
+        return _stream_with_retry(model, headers, data, sink, max_retry, timeout)
+    finally:
+        if owns_sink:
+            sink.close()
 
-                    decoded_line = line.decode('utf-8')
-                    if not decoded_line.startswith("data: "):
-                        continue
-
-                    decoded_line = decoded_line[len("data: "):]
-                    if decoded_line == "[DONE]":
-                        break
 
-                    try:
-                        json_data = json.loads(decoded_line)
+# 发送流式请求，失败时按错误类型决定是否重试
+def _stream_with_retry(model, headers, data, sink, max_retry, timeout):
+    """
+    发送流式请求并在失败时重试
+    - 客户端错误（如400、401）不重试；429、5xx、超时、连接中断按Retry-After或带抖动的指数退避重试
+    - 有多个API key时轮换使用，某个key被限流或鉴权失败时立即换用其他key重试
+    - 同一服务商连续失败时熔断，熔断期间等待冷却结束
+    - 重试前将sink回滚到请求前的位置，避免重复写入；sink不支持回滚时带上已输出的部分续写
+    """
+    retry_count = 0
+    key_ring = model.key_ring()
+    breaker = model.circuit_breaker()
+    estimated_tokens = estimate_request_tokens(data) if key_ring.limited else 0
+    checkpoint = sink.checkpoint() if sink else None
+    # sink不支持回滚时，已写入sink的部分输出
+    partial_output = ""
+    request_data = data
+
+    # 本次调用持有的熔断器探测名额，请求未得出结果就结束时（参数错误、没有可用key、异常等）释放
+    probe = None
+    try:
+        while retry_count < max_retry:
+            # 熔断期间等待冷却结束；换用其他key重试时沿用已获得的探测名额
+            if probe is None:
+                wait, probe = breaker.before_request()
+                while wait:
+                    time.sleep(wait)
+                    wait, probe = breaker.before_request()
+
+            response_content = ""
+            token_stats = None
+            finish_reason = None
+            # 轮换选择API key，并按该key的速率限制和当前并发上限等待额度
+            api_key, slot = key_ring.acquire(estimated_tokens)
+            if api_key is None:
+                print("没有可用的API key")
+                break
+            start_time = time.monotonic()
+            try:
+                with model.session().post(
+                    model.post_url,
+                    headers=dict(headers, Authorization=f"Bearer {api_key.api_key}"),
+                    json=request_data,
+                    stream=True,
+                    timeout=timeout
+                ) as response:
+                    response.raise_for_status()
+
+                    for line in response.iter_lines():
+                        done, json_data = parse_sse_line(line)
+                        if done:
+                            break
+                        if json_data is None:
+                            continue
 
                         if json_data.get('choices'):
                             delta = json_data['choices'][0].get('delta', {})
+                            finish_reason = json_data['choices'][0].get('finish_reason') or finish_reason
 
                             if 'content' in delta:
                                 content = delta['content']
                                 response_content += content
 
-                                # 如果指定了文件，则写入
-                                if write_file:
-                                    with open(write_file, 'a', encoding='utf-8') as f:
-                                        f.write(content)
+                                # 如果指定了输出，则写入
+                                if sink:
+                                    sink.write(content)
 
                         # 获取token统计（通常在最后一个数据块中）
                         if json_data.get('usage'):
                             token_stats = json_data['usage']
-                    except json.JSONDecodeError:
-                        continue
-
-            # 请求成功，返回结果
-            return response_content, token_stats
-            # return response_content, token_stats['prompt_tokens'], token_stats['completion_tokens'], token_stats['total_tokens']
-
-        except Exception as e:
-            retry_count += 1
-            print(f"调用API失败 (尝试 {retry_count}/{max_retry}): {e}")
-            if retry_count < max_retry:
-                # 指数退避重试
-                time.sleep(2 ** retry_count)
-    return None,None
\ No newline at end of file
+
+                if finish_reason == "length":
+                    print(f"\n输出达到max_tokens上限({data.get('max_tokens')})，结果可能不完整，可调大模型的max_output_tokens")
+                # 请求成功，返回结果
+                breaker.record_success()
+                record_request(model, True, (token_stats or {}).get('completion_tokens') or estimate_tokens(response_content),
+                               time.monotonic() - start_time)
+                key_ring.release(api_key, slot, "ok", None, estimated_tokens, (token_stats or {}).get('total_tokens') or None)
+                if sink:
+                    sink.flush()
+                return partial_output + response_content, token_stats
+                # return response_content, token_stats['prompt_tokens'], token_stats['completion_tokens'], token_stats['total_tokens']
+
+            except Exception as e:
+                kind, retry_after = classify_exception(e)
+                key_ring.release(api_key, slot, kind, retry_after, estimated_tokens)
+                # 只是当前key的问题时立即换用其他key，不计入重试次数和服务商的熔断
+                switch_key = key_ring.can_switch(api_key, kind)
+                if switch_key:
+                    print(f"API key {api_key} 调用失败: {e}，换用其他key")
+                else:
+                    retry_count += 1
+                    print(f"调用API失败 (尝试 {retry_count}/{max_retry}): {e}")
+                    if not is_retryable(kind):
+                        print("请求参数或鉴权有误，不再重试")
+                        break
+                    breaker.record_failure(probe)
+                    probe = None
+                    record_request(model, False)
+
+                if sink and response_content:
+                    if checkpoint is not None:
+                        # 丢弃本次请求已写入的内容
+                        sink.rollback(checkpoint)
+                    else:
+                        # 无法回滚，让模型从中断处继续输出
+                        partial_output += response_content
+                        request_data = dict(data, messages=continuation_messages(data["messages"], partial_output))
+                if retry_count < max_retry and not switch_key:
+                    time.sleep(retry_delay(retry_count, retry_after))
+
+        # 所有重试都失败，清除已写入的部分内容，由调用方决定如何处理
+        if sink and checkpoint is not None:
+            sink.rollback(checkpoint)
+        return None, None
+    finally:
+        breaker.release_probe(probe)
@@ -1,58 +1,278 @@
-from mistralai import Mistral
 from pathlib import Path
 import os
 import base64
-from mistralai import DocumentURLChunk
-from mistralai.models import OCRResponse
-# pip install mistralai
-from LLM_API import Mistral_OCR_API
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
+# pip install mistralai，mistralai导入较慢，只在OCR时导入
+if TYPE_CHECKING:
+    from mistralai.models import OCRResponse
+    from OCR_cache import OCRCacheWriter
+from LLM_API import Mistral_OCR_API, Mistral_OCR_shard_pages, Mistral_OCR_shard_concurrent
+from OCR_cache import OCRCache, file_sha256, get_ocr_cache
+from Retry_policy import classify_status, is_retryable, retry_delay
 from utils import select_pdf
+
+# 解码、写入图片的线程数
+IMAGE_WRITE_WORKERS = 4
+# OCR模型，与PDF内容一起作为OCR缓存的键
+OCR_MODEL = "mistral-ocr-latest"
+# 单次OCR请求（整体或一个分段）失败后的最大重试次数
+OCR_MAX_RETRIES = 3
+
+
 def replace_images_in_markdown(markdown_str: str, images_dict: dict) -> str:
     for img_name, img_path in images_dict.items():
         markdown_str = markdown_str.replace(f"![{img_name}]({img_name})", f"![{img_name}]({img_path})")
     return markdown_str
 
 
-def save_ocr_results(ocr_response: OCRResponse, pdf_path: str) -> None:
-    # 获取PDF文件的目录和文件名
-    pdf_file = Path(pdf_path)
-    pdf_dir = pdf_file.parent
-    pdf_name = pdf_file.stem
-
-    # 创建图片目录（PDF文件名.assets）
-    images_dir = pdf_dir / f"{pdf_name}.assets"
-    os.makedirs(images_dir, exist_ok=True)
-
-    all_markdowns = []
-    for page in ocr_response.pages:
-        # 保存图片
-        page_images = {}
-        for img in page.images:
-            img_data = base64.b64decode(img.image_base64.split(',')[1])
-            img_path = images_dir / f"{img.id}.png"
-            with open(img_path, 'wb') as f:
-                f.write(img_data)
-            page_images[img.id] = f"{pdf_name}.assets/{img.id}.png"
-
-        # 处理markdown内容
-        page_markdown = replace_images_in_markdown(page.markdown, page_images)
-        all_markdowns.append(page_markdown)
-
-    # 保存完整markdown
-    markdown_path = pdf_dir / f"{pdf_name}.md"
-    with open(markdown_path, 'w', encoding='utf-8') as f:
-        f.write("\n\n".join(all_markdowns))
+class OCRResultWriter:
+    """
+    逐页保存OCR结果，目录结构与原先一次性保存时相同（PDF文件名.md 和 PDF文件名.assets/图片）
+    - 图片在线程池中解码、计算SHA-256并写入，等待处理的图片数有上限，不会同时在内存中保留所有解码后的图片
+    - 按内容哈希去重，重复出现的图片（如每页的logo）只保存一次，Markdown中都指向同一个文件
+    - 每页的图片处理完后按页码顺序将该页Markdown追加到临时文件，全部写完后再替换为正式文件，
+      中途出错不会留下不完整的Markdown
+    """
 
+    def __init__(self, pdf_path: str, max_workers: int = IMAGE_WRITE_WORKERS):
+        pdf_file = Path(pdf_path)
+        self.pdf_name = pdf_file.stem
+        self.markdown_path = pdf_file.parent / f"{self.pdf_name}.md"
+        # 创建图片目录（PDF文件名.assets）
+        self.images_dir = pdf_file.parent / f"{self.pdf_name}.assets"
+        os.makedirs(self.images_dir, exist_ok=True)
 
-def pdf2markdown(pdf_path: str, api_key: str) -> None:
-    # 初始化客户端
-    client = Mistral(api_key=api_key)
+        self._part_path = self.markdown_path.with_name(self.markdown_path.name + ".part")
+        self._file = open(self._part_path, 'w', encoding='utf-8')
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._max_pending = max_workers * 2
+        # 图片尚未处理完的页面：(页面Markdown, {图片id: Future})，按页码顺序排列
+        self._pending_pages = deque()
+        self._pending_images = 0
+        # 图片内容的SHA-256 -> Markdown中的相对路径
+        self._saved_images = {}
+        self._lock = threading.Lock()
+        self._file_names = set()
+        self.pages = 0
+        self.duplicate_images = 0
+
+    def add_page(self, page) -> None:
+        """提交OCR结果中的一页，图片处理完后该页的Markdown会按顺序追加到文件"""
+        self.add_page_data(page.markdown, [(img.id, img.image_base64) for img in page.images])
+
+    def add_page_data(self, markdown: str, images: list) -> None:
+        """
+        提交一页的Markdown和图片
+        Args:
+            images: [(图片id, data URI格式的base64字符串或解码后的图片数据), ...]
+        """
+        futures = {img_id: self._executor.submit(self._save_image, self._file_name(img_id), image)
+                   for img_id, image in images}
+        self._pending_pages.append((markdown, futures))
+        self._pending_images += len(futures)
+        self._flush(block=self._pending_images > self._max_pending)
+
+    def _file_name(self, img_id: str) -> str:
+        file_name = f"{img_id}.png"
+        # 不同页面的图片id相同时（如分段OCR的结果），加序号区分
+        suffix = 1
+        while file_name in self._file_names:
+            file_name = f"{Path(img_id).stem}_{suffix}.png"
+            suffix += 1
+        self._file_names.add(file_name)
+        return file_name
+
+    def _save_image(self, file_name: str, image) -> str:
+        """在线程池中解码图片，内容未保存过时写入文件，返回图片在Markdown中的相对路径"""
+        img_data = image if isinstance(image, bytes) else base64.b64decode(image.split(',')[1])
+        digest = hashlib.sha256(img_data).digest()
+        with self._lock:
+            relative_path = self._saved_images.get(digest)
+            if relative_path is not None:
+                self.duplicate_images += 1
+                return relative_path
+            relative_path = f"{self.pdf_name}.assets/{file_name}"
+            self._saved_images[digest] = relative_path
+        with open(self.images_dir / file_name, 'wb') as f:
+            f.write(img_data)
+        return relative_path
+
+    def _flush(self, block: bool = False) -> None:
+        """按页码顺序写出图片已处理完的页面；block为True时等待，直到等待处理的图片数不超过上限"""
+        while self._pending_pages:
+            markdown, futures = self._pending_pages[0]
+            if not block and not all(future.done() for future in futures.values()):
+                break
+            page_images = {img_id: future.result() for img_id, future in futures.items()}
+            self._pending_pages.popleft()
+            self._pending_images -= len(futures)
+            # 处理markdown内容
+            if self.pages:
+                self._file.write("\n\n")
+            self._file.write(replace_images_in_markdown(markdown, page_images))
+            self.pages += 1
+            block = block and self._pending_images > self._max_pending
+
+    def close(self, success: bool = True) -> None:
+        """写出剩余页面；成功时将临时文件替换为正式的Markdown文件，否则删除临时文件"""
+        try:
+            while success and self._pending_pages:
+                self._flush(block=True)
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=not success)
+            self._file.close()
+        if success:
+            os.replace(self._part_path, self.markdown_path)
+        elif self._part_path.exists():
+            os.remove(self._part_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(exc_type is None)
+        return False
+
+
+def save_ocr_results(ocr_response: "OCRResponse", pdf_path: str) -> None:
+    with OCRResultWriter(pdf_path) as writer:
+        for page in ocr_response.pages:
+            writer.add_page(page)
+    if writer.duplicate_images:
+        print(f"共 {writer.duplicate_images} 张重复图片，只保存了一次")
+
+
+def load_cached_ocr_results(cache: OCRCache, key: str, pdf_path: str) -> bool:
+    """从OCR缓存重建Markdown和图片目录，未命中或缓存在读取过程中被淘汰时返回False"""
+    pages = cache.get(key)
+    if pages is None:
+        return False
+    try:
+        with OCRResultWriter(pdf_path) as writer:
+            for markdown, images in pages:
+                writer.add_page_data(markdown, images)
+    except KeyError:
+        return False
+    return True
 
+
+def count_pdf_pages(pdf_path: str):
+    """
+    PDF的页数：安装了pypdf时精确读取，否则从页面树的/Count估计
+    Returns:
+        int: 页数，无法确定时返回None
+    """
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(pdf_path).pages)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    data = Path(pdf_path).read_bytes()
+    # 页面树根节点（/Type /Pages）的/Count即为总页数，页面树被压缩在对象流中时退而统计/Type /Page对象
+    counts = [int(count) for tree in re.findall(rb"<<(?:(?!<<|>>).)*?/Type\s*/Pages\b(?:(?!<<|>>).)*?>>", data, re.S)
+              for count in re.findall(rb"/Count\s+(\d+)", tree)]
+    if counts:
+        return max(counts)
+    return len(re.findall(rb"/Type\s*/Page\b", data)) or None
+
+
+def page_shards(total_pages: int, shard_pages: int) -> list:
+    """将0到total_pages-1页按每段shard_pages页划分"""
+    return [list(range(start, min(start + shard_pages, total_pages))) for start in range(0, total_pages, shard_pages)]
+
+
+def ocr_error_kind(error: Exception):
+    """对OCR请求的异常分类，返回(错误类型, Retry-After等待秒数或None)，错误类型见Retry_policy"""
+    response = getattr(error, "raw_response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status:
+        return classify_status(status, getattr(response, "headers", None))
+    return "connection", None
+
+
+def ocr_pages(client, document, pages: list = None) -> list:
+    """
+    OCR指定页（页码从0开始，为None时为整个文档），失败时按Retry_policy退避重试
+    Returns:
+        list: OCR结果的页面列表
+    """
+    kwargs = {"pages": pages} if pages is not None else {}
+    for attempt in range(OCR_MAX_RETRIES + 1):
+        try:
+            return client.ocr.process(document=document, model=OCR_MODEL, include_image_base64=True, **kwargs).pages
+        except Exception as e:
+            kind, retry_after = ocr_error_kind(e)
+            if attempt >= OCR_MAX_RETRIES or not is_retryable(kind):
+                raise
+            delay = retry_delay(attempt + 1, retry_after)
+            scope = f"第{pages[0] + 1}-{pages[-1] + 1}页" if pages else "全文"
+            print(f"OCR{scope}出错({kind}): {e}，{delay:.1f}秒后重试")
+            time.sleep(delay)
+
+
+def ocr_in_shards(client, document, pdf_path: str, total_pages: int, shard_pages: int, max_workers: int,
+                  cache_writer: "OCRCacheWriter" = None) -> int:
+    """
+    按页码范围分段并行OCR，每段独立重试；已连续完成的分段按页码顺序写入临时文件和OCR缓存，图片随之保存，
+    写入后即释放该段的结果；全部分段完成后才生成正式的Markdown（翻译需要完整的文档），目录结构与整体OCR相同
+    Args:
+        cache_writer: OCR缓存的写入器，为None时不写入缓存
+    Returns:
+        int: 写入的页数
+    """
+    shards = page_shards(total_pages, shard_pages)
+    results = [None] * len(shards)
+    page_count = 0
+    written = 0
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        with OCRResultWriter(pdf_path) as writer:
+            futures = {executor.submit(ocr_pages, client, document, shard): idx for idx, shard in enumerate(shards)}
+            for future in as_completed(futures):
+                idx = futures[future]
+                results[idx] = future.result()
+                print(f"OCR分段 {idx + 1}/{len(shards)} 完成（第{shards[idx][0] + 1}-{shards[idx][-1] + 1}页）")
+                while written < len(shards) and results[written] is not None:
+                    for page in results[written]:
+                        writer.add_page(page)
+                    if cache_writer:
+                        cache_writer.add_pages(results[written])
+                    page_count += len(results[written])
+                    results[written] = ()
+                    written += 1
+    finally:
+        # 某一段最终失败时，不再等待其余分段
+        executor.shutdown(wait=False, cancel_futures=True)
+    return page_count
+
+
+def pdf2markdown(pdf_path: str, api_key: str) -> None:
     # 确认PDF文件存在
     pdf_file = Path(pdf_path)
     if not pdf_file.is_file():
         raise FileNotFoundError(f"PDF文件不存在: {pdf_path}")
 
+    # 相同内容的PDF（即使文件名、位置不同）转换过时，直接使用本地缓存
+    cache = get_ocr_cache()
+    cache_key = OCRCache.make_key(file_sha256(pdf_path), OCR_MODEL) if cache else None
+    if cache and load_cached_ocr_results(cache, cache_key, pdf_path):
+        print(f"命中OCR缓存，PDF转Markdown完成。结果保存为: {pdf_file.parent / f'{pdf_file.stem}.md'}")
+        return
+
+    from mistralai import DocumentURLChunk, Mistral
+
+    # 初始化客户端
+    client = Mistral(api_key=api_key)
+
     # 上传并处理PDF
     uploaded_file = client.files.upload(
         file={
@@ -63,14 +283,31 @@ def pdf2markdown(pdf_path: str, api_key: str) -> None:
     )
 
     signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
-    pdf_response = client.ocr.process(
-        document=DocumentURLChunk(document_url=signed_url.url),
-        model="mistral-ocr-latest",
-        include_image_base64=True
-    )
+    document = DocumentURLChunk(document_url=signed_url.url)
+
+    # 页数较多时按页码范围分段并行OCR，避免单个请求过长、失败后整篇重来
+    # 结果边保存边写入OCR缓存，全部写完后缓存才生效，失败时删除已写入缓存的页面
+    done = False
+    total_pages = count_pdf_pages(pdf_path)
+    if total_pages and total_pages > Mistral_OCR_shard_pages:
+        print(f"PDF共 {total_pages} 页，分为每段 {Mistral_OCR_shard_pages} 页并行OCR")
+        try:
+            with cache.writer(cache_key, OCR_MODEL) if cache else nullcontext() as cache_writer:
+                ocr_in_shards(client, document, pdf_path, total_pages, Mistral_OCR_shard_pages,
+                              Mistral_OCR_shard_concurrent, cache_writer)
+            done = True
+        except Exception as e:
+            print(f"分段OCR失败: {e}，改为整体OCR")
+    if not done:
+        pages = ocr_pages(client, document)
+        # 保存结果
+        with cache.writer(cache_key, OCR_MODEL) if cache else nullcontext() as cache_writer, \
+                OCRResultWriter(pdf_path) as writer:
+            for page in pages:
+                writer.add_page(page)
+                if cache_writer:
+                    cache_writer.add_pages([page])
 
-    # 保存结果
-    save_ocr_results(pdf_response, pdf_path)
     print(f"PDF转Markdown处理完成。结果保存为: {pdf_file.parent / f'{pdf_file.stem}.md'}")
 
 
@@ -0,0 +1,156 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from multiprocessing.util import Finalize
+
+# 统计值的指数加权系数，越大越看重最近的请求
+STATS_ALPHA = 0.2
+# 错误率超过该值的模型视为性能下降，只在没有其他模型可用时使用
+DEGRADED_ERROR_RATE = 0.5
+# 请求结果先在内存中累积，达到条数或距上次写入超过该秒数时一次写入SQLite
+STATS_FLUSH_REQUESTS = 20
+STATS_FLUSH_SECONDS = 5.0
+
+
+class ProviderStats:
+    """
+    各模型的请求统计，保存在SQLite中，所有翻译进程共享
+    记录输出速度（token/秒）和错误率的指数加权平均值，供ModelPool按模型的实际表现分配任务
+    每次请求的结果先缓存在内存中，批量写入，进程退出时写入剩余的结果
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS provider_stats ("
+                           "key TEXT PRIMARY KEY, tokens_per_second REAL, error_rate REAL, "
+                           "requests INTEGER, updated REAL)")
+        # 尚未写入的请求结果：(key, ok, tokens, seconds)
+        self._pending = []
+        self._last_flush = time.monotonic()
+        # 进程池的工作进程退出时不执行atexit，用multiprocessing的终结器写入剩余结果
+        Finalize(self, self.flush, exitpriority=10)
+
+    def record(self, key, ok, tokens=0, seconds=0.0):
+        """记录一次请求的结果，成功时tokens为输出的token数，seconds为耗时"""
+        with self._lock:
+            self._pending.append((key, ok, tokens, seconds))
+            if (len(self._pending) >= STATS_FLUSH_REQUESTS
+                    or time.monotonic() - self._last_flush >= STATS_FLUSH_SECONDS):
+                self._flush()
+
+    def flush(self):
+        """将缓存的请求结果写入SQLite"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """按记录顺序更新各模型的加权平均值，需持有self._lock"""
+        pending, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        if not pending:
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = {}
+            for key, ok, tokens, seconds in pending:
+                if key not in current:
+                    row = self._conn.execute("SELECT tokens_per_second, error_rate, requests FROM provider_stats "
+                                             "WHERE key = ?", (key,)).fetchone()
+                    current[key] = row if row else (None, 0.0, 0)
+                tokens_per_second, error_rate, requests = current[key]
+                error_rate = (1 - STATS_ALPHA) * error_rate + STATS_ALPHA * (0 if ok else 1)
+                if ok and tokens and seconds > 0:
+                    sample = tokens / seconds
+                    tokens_per_second = sample if tokens_per_second is None else \
+                        (1 - STATS_ALPHA) * tokens_per_second + STATS_ALPHA * sample
+                current[key] = (tokens_per_second, error_rate, requests + 1)
+            now = time.time()
+            self._conn.executemany("INSERT OR REPLACE INTO provider_stats"
+                                   "(key, tokens_per_second, error_rate, requests, updated) VALUES (?, ?, ?, ?, ?)",
+                                   [(key, *values, now) for key, values in current.items()])
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def get(self, keys):
+        """返回{key: (token/秒或None, 错误率)}，没有记录的模型不在结果中"""
+        with self._lock:
+            # 先写入本进程缓存的结果
+            self._flush()
+            rows = self._conn.execute(
+                f"SELECT key, tokens_per_second, error_rate FROM provider_stats "
+                f"WHERE key IN ({','.join('?' * len(keys))})", list(keys)).fetchall()
+        return {key: (tokens_per_second, error_rate) for key, tokens_per_second, error_rate in rows}
+
+
+# 每个进程一个统计实例
+_STATS = None
+_STATS_PID = None
+
+
+def get_provider_stats():
+    """获取当前进程的模型统计，与限速器共用LLM_API中的Rate_limit_path，未配置时返回None"""
+    global _STATS, _STATS_PID
+    if _STATS_PID == os.getpid():
+        return _STATS
+    from LLM_API import Rate_limit_path
+    _STATS = None
+    if Rate_limit_path:
+        _STATS = ProviderStats(os.path.join(os.path.dirname(os.path.abspath(__file__)), Rate_limit_path))
+    _STATS_PID = os.getpid()
+    return _STATS
+
+
+def record_request(model, ok, tokens=0, seconds=0.0):
+    """记录模型的一次请求结果，统计不可用时忽略"""
+    stats = get_provider_stats()
+    if stats is not None:
+        stats.record(model.provider_key(), ok, tokens, seconds)
+
+
+class ModelPool:
+    """
+    多模型池，把章节和片段分配给所有可用的模型
+    按各模型实测的输出速度和错误率加权随机选择；某个模型熔断或错误率过高时自动降低其权重，
+    请求失败时可通过choose(exclude=...)换用其他模型
+    """
+
+    def __init__(self, models):
+        self.models = list(models)
+        # 进程池并行度取各模型并发数之和
+        self.max_concurrent = sum(model.max_concurrent for model in self.models)
+
+    @property
+    def model_name(self):
+        return " + ".join(model.model_name for model in self.models)
+
+    def weights(self, models):
+        """各模型的权重：token/秒×(1-错误率)²，没有统计的模型取已知模型的平均速度"""
+        stats = get_provider_stats()
+        known = stats.get([model.provider_key() for model in models]) if stats else {}
+        speeds = [speed for speed, _ in known.values() if speed]
+        default_speed = sum(speeds) / len(speeds) if speeds else 1.0
+        weights = []
+        for model in models:
+            speed, error_rate = known.get(model.provider_key(), (None, 0.0))
+            weight = (speed or default_speed) * (1 - error_rate) ** 2
+            if error_rate > DEGRADED_ERROR_RATE or model.circuit_breaker().is_open():
+                weight *= 0.01
+            weights.append(max(weight, 1e-6))
+        return weights
+
+    def choose(self, exclude=()):
+        """按权重随机选择一个模型，exclude中的模型不参与选择，没有可选模型时返回None"""
+        excluded = {model.provider_key() for model in exclude}
+        candidates = [model for model in self.models if model.provider_key() not in excluded]
+        if not candidates:
+            return None
+        return random.choices(candidates, weights=self.weights(candidates))[0]
+
+    def __len__(self):
+        return len(self.models)
@@ -0,0 +1,325 @@
+import argparse
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# 计算PDF哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """分块计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    基于SQLite的OCR结果缓存，按PDF内容的SHA-256和OCR模型名寻址，与PDF的文件名和位置无关
+    保存每页的Markdown和解码后的图片，命中时直接在本地重建Markdown和图片目录，不再上传PDF、调用OCR
+    超过容量上限时按最近访问时间淘汰整篇文档（LRU），可被多个进程同时使用
+    """
+
+    def __init__(self, path, max_mb=2048):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # documents中的行在文档的所有页面写入后才插入，存在即表示缓存完整
+        self._conn.execute("CREATE TABLE IF NOT EXISTS documents ("
+                           "key TEXT PRIMARY KEY, model TEXT, pages INTEGER NOT NULL, size INTEGER NOT NULL, "
+                           "created REAL, last_access REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_last_access ON documents(last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pages ("
+                           "key TEXT NOT NULL, page INTEGER NOT NULL, markdown TEXT NOT NULL, "
+                           "PRIMARY KEY(key, page))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS images ("
+                           "key TEXT NOT NULL, page INTEGER NOT NULL, idx INTEGER NOT NULL, img_id TEXT NOT NULL, "
+                           "data BLOB NOT NULL, PRIMARY KEY(key, page, idx))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @staticmethod
+    def make_key(pdf_sha256, model_name):
+        """计算缓存键，pdf_sha256为PDF内容的SHA-256，见file_sha256"""
+        return hashlib.sha256(f"{model_name}\0{pdf_sha256}".encode("utf-8")).hexdigest()
+
+    def _count(self, name):
+        self._conn.execute("INSERT INTO stats(name, value) VALUES (?, 1) "
+                           "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """
+        查询缓存，命中时更新访问时间并返回逐页读取的迭代器，未命中返回None
+        迭代器每次产生一页：(页面Markdown, [(图片id, 图片数据), ...])
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT pages FROM documents WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            self._conn.execute("UPDATE documents SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count("hits")
+        return self._iter_pages(key, row[0])
+
+    def _iter_pages(self, key, pages):
+        for page in range(pages):
+            with self._lock:
+                row = self._conn.execute("SELECT markdown FROM pages WHERE key = ? AND page = ?",
+                                         (key, page)).fetchone()
+                images = self._conn.execute("SELECT img_id, data FROM images WHERE key = ? AND page = ? "
+                                            "ORDER BY idx", (key, page)).fetchall()
+            if row is None:
+                raise KeyError(f"OCR缓存不完整: {key}")
+            yield row[0], images
+
+    def writer(self, key, model_name=""):
+        """逐页写入一篇文档的OCR结果，见OCRCacheWriter"""
+        return OCRCacheWriter(self, key, model_name)
+
+    def put(self, key, pages, model_name=""):
+        """
+        写入一篇文档的OCR结果，逐页解码图片并写入，内存中只保留当前页解码后的图片
+        超过容量上限时淘汰最久未访问的文档；单篇文档超过容量上限时放弃写入
+        Args:
+            pages: OCR结果的页面列表，每页有markdown和images（图片有id和data URI格式的image_base64）
+        Returns:
+            bool: 是否写入了缓存
+        """
+        with self.writer(key, model_name) as cache_writer:
+            for page in pages:
+                cache_writer.add_pages([page])
+        return cache_writer.committed
+
+    def _insert_pages(self, key, first_page, pages):
+        """在一个事务中写入从first_page开始的若干页，返回写入的字节数"""
+        size = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for page_no, page in enumerate(pages, first_page):
+                    self._conn.execute("INSERT OR REPLACE INTO pages(key, page, markdown) VALUES (?, ?, ?)",
+                                       (key, page_no, page.markdown))
+                    size += len(page.markdown.encode("utf-8"))
+                    for idx, img in enumerate(page.images):
+                        data = base64.b64decode(img.image_base64.split(',')[1])
+                        self._conn.execute("INSERT OR REPLACE INTO images(key, page, idx, img_id, data) "
+                                           "VALUES (?, ?, ?, ?, ?)", (key, page_no, idx, img.id, data))
+                        size += len(data)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return size
+
+    def _insert_document(self, key, model_name, pages, size):
+        """所有页面写入后插入documents中的行，缓存自此生效"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO documents(key, model, pages, size, created, last_access) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", (key, model_name, pages, size, now, now))
+                self._evict(self.max_bytes)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete(self, key):
+        self._conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+        self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+        self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+
+    def delete(self, key):
+        """删除一篇文档的缓存"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._delete(key)
+            self._conn.execute("COMMIT")
+
+    def _delete_orphans(self):
+        """删除没有documents行的页面和图片（写入中途进程被终止留下的）"""
+        self._conn.execute("DELETE FROM pages WHERE key NOT IN (SELECT key FROM documents)")
+        self._conn.execute("DELETE FROM images WHERE key NOT IN (SELECT key FROM documents)")
+
+    def _evict(self, max_bytes):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        to_delete = []
+        for key, size in self._conn.execute("SELECT key, size FROM documents ORDER BY last_access").fetchall():
+            if total <= max_bytes:
+                break
+            to_delete.append(key)
+            total -= size
+        for key in to_delete:
+            self._delete(key)
+        return len(to_delete)
+
+    def prune(self, max_mb):
+        """
+        将缓存裁剪到max_mb以内，返回删除的文档数
+        同时删除未写完的文档留下的页面，运行时不应有正在进行的OCR
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._delete_orphans()
+            removed = self._evict(int(max_mb * 1024 * 1024))
+            self._conn.execute("COMMIT")
+        self._conn.execute("VACUUM")
+        return removed
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for table in ("documents", "pages", "images", "stats"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.execute("COMMIT")
+        self._conn.execute("VACUUM")
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            documents, pages, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pages), 0), COALESCE(SUM(size), 0) FROM documents").fetchone()
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+        return {
+            "documents": documents,
+            "pages": pages,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+class OCRCacheWriter:
+    """
+    逐页写入一篇文档的OCR结果
+    每批页面在单独的事务中写入，写入后调用方即可释放这些页面（包括base64编码的图片），
+    全部页面写入后commit才插入documents中的行，缓存自此生效；失败时abort删除已写入的页面
+    累计大小超过缓存容量上限时放弃写入
+    用法：
+        with cache.writer(key, model_name) as cache_writer:
+            cache_writer.add_pages(pages)  # 按页码顺序，可多次调用
+        # 正常退出时commit，出现异常时abort
+    """
+
+    def __init__(self, cache, key, model_name=""):
+        self.cache = cache
+        self.key = key
+        self.model_name = model_name
+        self.pages = 0
+        self.size = 0
+        # 是否因超过容量上限而放弃写入，以及是否已生效
+        self.overflow = False
+        self.committed = False
+        # 清除该文档旧的或未写完的缓存
+        cache.delete(key)
+
+    def add_pages(self, pages):
+        """按页码顺序写入若干页，pages中每页有markdown和images（图片有id和data URI格式的image_base64）"""
+        if self.overflow:
+            return
+        pages = list(pages)
+        self.size += self.cache._insert_pages(self.key, self.pages, pages)
+        self.pages += len(pages)
+        if self.size > self.cache.max_bytes:
+            self.overflow = True
+            self.cache.delete(self.key)
+
+    def commit(self):
+        """所有页面写入后调用，返回是否写入了缓存"""
+        if not self.overflow and not self.committed:
+            self.cache._insert_document(self.key, self.model_name, self.pages, self.size)
+            self.committed = True
+        return self.committed
+
+    def abort(self):
+        """放弃写入，删除已写入的页面"""
+        if not self.committed:
+            self.cache.delete(self.key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+# 每个进程一个缓存实例
+_CACHE = None
+_CACHE_PID = None
+
+
+def get_ocr_cache():
+    """
+    获取当前进程的OCR缓存，按LLM_API中的OCR_cache_path/OCR_cache_max_mb配置打开
+    未配置缓存路径时返回None
+    """
+    global _CACHE, _CACHE_PID
+    if _CACHE_PID == os.getpid():
+        return _CACHE
+    from LLM_API import OCR_cache_max_mb
+    path = configured_cache_path()
+    _CACHE = OCRCache(path, OCR_cache_max_mb) if path else None
+    _CACHE_PID = os.getpid()
+    return _CACHE
+
+
+def configured_cache_path():
+    """LLM_API中配置的缓存路径，相对路径相对于本项目目录，未配置时返回空字符串"""
+    from LLM_API import OCR_cache_path
+    if not OCR_cache_path:
+        return ""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), OCR_cache_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看或清理OCR缓存")
+    parser.add_argument("--path", default=None, help="缓存文件路径，默认使用LLM_API中的配置")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="显示缓存的文档数、大小和命中率")
+    prune_parser = subparsers.add_parser("prune", help="按最近访问时间淘汰文档，直到缓存不超过指定大小")
+    prune_parser.add_argument("--max-mb", type=float, required=True, help="保留的最大容量(MB)")
+    subparsers.add_parser("clear", help="清空缓存")
+    args = parser.parse_args()
+    args.path = args.path or configured_cache_path()
+
+    if not args.path or not os.path.exists(args.path):
+        print(f"缓存文件不存在: {args.path}")
+        return
+    cache = OCRCache(args.path)
+    if args.command == "stats":
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0
+        print(f"缓存文件: {args.path}")
+        print(f"文档数: {stats['documents']}，页数: {stats['pages']}，大小: {stats['size_bytes'] / 1024 / 1024:.2f}MB")
+        print(f"命中: {stats['hits']}，未命中: {stats['misses']}，命中率: {hit_rate:.1f}%")
+    elif args.command == "prune":
+        removed = cache.prune(args.max_mb)
+        print(f"已删除 {removed} 篇文档的缓存，当前大小: {cache.stats()['size_bytes'] / 1024 / 1024:.2f}MB")
+    elif args.command == "clear":
+        cache.clear()
+        print("缓存已清空")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
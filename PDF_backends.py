@@ -0,0 +1,287 @@
+"""
+PDF转Markdown的后端
+- text_layer：读取PDF自带的文本层，本地离线转换，不到1秒即可完成，适合arXiv等直接由LaTeX/Word生成的PDF（需pip install pymupdf）
+- mistral_ocr：上传到Mistral OCR识别，适合扫描版PDF，公式识别为LaTeX，需要配置Mistral_OCR_API
+两种后端生成的Markdown和图片目录结构相同（PDF文件名.md 和 PDF文件名.assets），均可直接用split_markdown_into_blocks分块
+LLM_API中的PDF_backend为"auto"时，由choose_pdf_backend按文本层的情况为每篇PDF选择后端；
+新的后端继承PDFBackend，实现available和convert后用register_pdf_backend注册即可
+"""
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+
+from Mistral_OCR import OCRResultWriter
+
+# 检测文本层时抽样的页数
+DETECT_SAMPLE_PAGES = 8
+# 文本层可用的条件：有文字的页面比例、每页平均字符数、乱码（无法解码的字符）比例上限
+MIN_TEXT_PAGE_RATIO = 0.9
+MIN_CHARS_PER_PAGE = 500
+MAX_GARBAGE_RATIO = 0.02
+# 数学字体的字符比例超过该值时视为公式较多，配置了OCR时优先OCR（文本层中的公式无法还原为LaTeX）
+MAX_MATH_FONT_RATIO = 0.05
+MATH_FONT_PATTERN = re.compile(r"CMMI|CMSY|CMEX|MSBM|MSAM|Math|Symbol|STIX|Euclid", re.IGNORECASE)
+# 字号比正文大多少（pt）视为标题
+HEADING_SIZE_DELTA = 0.9
+# 标题的最大长度
+MAX_HEADING_CHARS = 120
+# 带编号的粗体短行视为标题，如"3.2 Model Architecture"
+NUMBERED_HEADING_PATTERN = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+\S")
+# 以这些字符开头的段落会被split_markdown_into_blocks识别为标题、公式、表格等，需要转义
+MARKDOWN_SPECIAL_PREFIXES = ("#", "```", "$", "---", "|", "![", "<table>")
+
+
+class PDFBackend(ABC):
+    """PDF转Markdown后端的接口"""
+    # 后端名称，即LLM_API中PDF_backend的取值
+    name = ""
+    # 显示给用户的说明
+    description = ""
+
+    @abstractmethod
+    def available(self) -> bool:
+        """后端当前是否可用（依赖是否安装、API key是否配置）"""
+
+    @abstractmethod
+    def convert(self, pdf_path: str) -> None:
+        """将PDF转换为同目录下的同名Markdown，图片保存在PDF文件名.assets目录中"""
+
+
+class MistralOCRBackend(PDFBackend):
+    name = "mistral_ocr"
+    description = "Mistral OCR"
+
+    def __init__(self, api_key=None):
+        if api_key is None:
+            from LLM_API import Mistral_OCR_API
+            api_key = Mistral_OCR_API
+        self.api_key = api_key
+
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def convert(self, pdf_path: str) -> None:
+        from Mistral_OCR import pdf2markdown
+        pdf2markdown(pdf_path, self.api_key)
+
+
+def _import_pymupdf():
+    try:
+        import pymupdf
+        # pip install pymupdf
+        return pymupdf
+    except ImportError:
+        return None
+
+
+def escape_markdown_line(text: str) -> str:
+    """转义段落开头的Markdown特殊字符，使其仍被识别为普通段落"""
+    return "\\" + text if text.startswith(MARKDOWN_SPECIAL_PREFIXES) else text
+
+
+def join_lines(lines: list) -> str:
+    """将PDF中的多行文字合并为一段，去掉行尾连字符"""
+    text = ""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        elif text:
+            text += " " + line
+        else:
+            text = line
+    return text
+
+
+class TextLayerBackend(PDFBackend):
+    """
+    读取PDF文本层的本地后端
+    正文字号取字符数最多的字号，字号明显更大或带编号的粗体短行视为标题（字号越大、编号层级越少，标题等级越高），
+    PDF中的每个文字块作为一个段落；跳过页码和旋转的文字（如arXiv页边的编号），嵌入的图片按出现位置插入
+    """
+    name = "text_layer"
+    description = "PDF文本层（本地）"
+
+    def available(self) -> bool:
+        return _import_pymupdf() is not None
+
+    def convert(self, pdf_path: str) -> None:
+        pymupdf = _import_pymupdf()
+        with pymupdf.open(pdf_path) as doc:
+            pages = [page.get_text("dict") for page in doc]
+        blocks = [[self._read_block(block) for block in page["blocks"]] for page in pages]
+        body_size, heading_levels = self._font_levels(block for page in blocks for block in page if block)
+
+        with OCRResultWriter(pdf_path) as writer:
+            image_count = 0
+            for page in blocks:
+                paragraphs = []
+                images = []
+                for block in page:
+                    if block is None:
+                        continue
+                    if block["image"] is not None:
+                        img_id = f"img-{image_count}.{block['ext']}"
+                        image_count += 1
+                        images.append((img_id, block["image"]))
+                        paragraphs.append(f"![{img_id}]({img_id})")
+                        continue
+                    level = self._heading_level(block, body_size, heading_levels)
+                    text = " ".join(block["text"].split()) if level else block["text"]
+                    paragraphs.append("#" * level + " " + text if level else escape_markdown_line(text))
+                writer.add_page_data("\n\n".join(paragraphs), images)
+
+    @staticmethod
+    def _read_block(block):
+        """提取文字块的文字、主要字号和是否粗体，图片块提取图片数据；页码、旋转文字等返回None"""
+        if block["type"] == 1:
+            if not block.get("image"):
+                return None
+            return {"image": block["image"], "ext": block.get("ext", "png")}
+        lines = []
+        sizes = Counter()
+        bold_chars = 0
+        for line in block["lines"]:
+            # 只保留水平的文字
+            if abs(line["dir"][1]) > 0.01:
+                continue
+            lines.append("".join(span["text"] for span in line["spans"]))
+            for span in line["spans"]:
+                chars = len(span["text"].strip())
+                sizes[round(span["size"] * 2) / 2] += chars
+                if span["flags"] & 16:
+                    bold_chars += chars
+        text = join_lines(lines)
+        if not text or text.isdigit():
+            return None
+        total = sum(sizes.values()) or 1
+        return {"image": None, "text": text, "lines": len(lines), "size": sizes.most_common(1)[0][0],
+                "bold": bold_chars / total > 0.6}
+
+    @staticmethod
+    def _font_levels(blocks):
+        """正文字号，以及各标题字号对应的等级（字号越大等级越高）"""
+        sizes = Counter()
+        heading_sizes = set()
+        for block in blocks:
+            if block["image"] is None:
+                sizes[block["size"]] += len(block["text"])
+                if len(block["text"]) <= MAX_HEADING_CHARS:
+                    heading_sizes.add(block["size"])
+        body_size = sizes.most_common(1)[0][0] if sizes else 0
+        larger = sorted((size for size in heading_sizes if size >= body_size + HEADING_SIZE_DELTA), reverse=True)
+        return body_size, {size: min(level + 1, 6) for level, size in enumerate(larger)}
+
+    @staticmethod
+    def _heading_level(block, body_size, heading_levels):
+        """文字块作为标题的等级，不是标题时返回0"""
+        text = block["text"]
+        if len(text) > MAX_HEADING_CHARS or block["lines"] > 3 or text.endswith((".", ",", ";", ":")):
+            return 0
+        numbered = NUMBERED_HEADING_PATTERN.match(text)
+        if block["size"] in heading_levels:
+            # 带编号时按编号层级确定等级，如"3.2"为二级标题
+            return numbered.group(1).count(".") + 1 if numbered else heading_levels[block["size"]]
+        if numbered and block["bold"] and block["size"] >= body_size:
+            return numbered.group(1).count(".") + 1
+        return 0
+
+
+def inspect_text_layer(pdf_path: str, sample_pages: int = DETECT_SAMPLE_PAGES):
+    """
+    抽样检查PDF的文本层
+    Returns:
+        dict: 抽样页数、有文字的页数、每页平均字符数、乱码比例、数学字体的字符比例；未安装pymupdf或无法打开时返回None
+    """
+    pymupdf = _import_pymupdf()
+    if pymupdf is None:
+        return None
+    try:
+        doc = pymupdf.open(pdf_path)
+    except Exception:
+        return None
+    with doc:
+        if doc.page_count == 0:
+            return None
+        # 均匀抽样
+        step = max(1, doc.page_count // sample_pages)
+        sampled = list(range(0, doc.page_count, step))[:sample_pages]
+        chars = text_pages = garbage = math_chars = 0
+        for page_no in sampled:
+            page_chars = 0
+            for block in doc[page_no].get_text("dict")["blocks"]:
+                for line in block.get("lines", ()):
+                    for span in line["spans"]:
+                        text = span["text"]
+                        length = len(text.strip())
+                        page_chars += length
+                        garbage += text.count("�")
+                        if MATH_FONT_PATTERN.search(span["font"]):
+                            math_chars += length
+            chars += page_chars
+            text_pages += page_chars >= MIN_CHARS_PER_PAGE / 5
+    return {
+        "pages": len(sampled),
+        "text_pages": text_pages,
+        "chars_per_page": chars / len(sampled),
+        "garbage_ratio": garbage / chars if chars else 1.0,
+        "math_ratio": math_chars / chars if chars else 0.0,
+    }
+
+
+def has_text_layer(stats) -> bool:
+    """抽样结果是否表明文本层完整可用"""
+    return (stats is not None
+            and stats["text_pages"] >= stats["pages"] * MIN_TEXT_PAGE_RATIO
+            and stats["chars_per_page"] >= MIN_CHARS_PER_PAGE
+            and stats["garbage_ratio"] <= MAX_GARBAGE_RATIO)
+
+
+# 已注册的后端，按名称索引
+PDF_BACKENDS = {}
+
+
+def register_pdf_backend(backend_class):
+    """注册PDF转Markdown后端，可作为类装饰器使用"""
+    PDF_BACKENDS[backend_class.name] = backend_class
+    return backend_class
+
+
+register_pdf_backend(TextLayerBackend)
+register_pdf_backend(MistralOCRBackend)
+
+
+def create_pdf_backend(name, ocr_api_key=None):
+    """按名称创建后端，OCR后端使用指定的API key"""
+    if name not in PDF_BACKENDS:
+        raise ValueError(f"未知的PDF后端 {name}，可选: auto, {', '.join(PDF_BACKENDS)}")
+    return MistralOCRBackend(ocr_api_key) if name == MistralOCRBackend.name else PDF_BACKENDS[name]()
+
+
+def choose_pdf_backend(pdf_path: str, ocr_api_key=None, preference=None):
+    """
+    为PDF选择转换后端
+    Args:
+        ocr_api_key: Mistral OCR的API key，默认使用LLM_API中的配置
+        preference: 后端名称或"auto"，默认使用LLM_API中的PDF_backend
+    Returns:
+        PDFBackend: 选中的后端，没有可用后端时返回None
+    """
+    if preference is None:
+        from LLM_API import PDF_backend
+        preference = PDF_backend
+    if preference != "auto":
+        backend = create_pdf_backend(preference, ocr_api_key)
+        return backend if backend.available() else None
+
+    local = TextLayerBackend()
+    ocr = MistralOCRBackend(ocr_api_key)
+    stats = inspect_text_layer(pdf_path) if local.available() else None
+    if has_text_layer(stats) and not (ocr.available() and stats["math_ratio"] > MAX_MATH_FONT_RATIO):
+        return local
+    if ocr.available():
+        return ocr
+    # 没有配置OCR时，文本层不完整也尽量在本地转换
+    return local if stats is not None and stats["chars_per_page"] > 0 else None
@@ -0,0 +1,176 @@
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# 并发名额的租约时长(秒)，持有名额的进程被强制结束时，超时后名额自动释放
+SLOT_LEASE_SECONDS = 600
+# 并发数已满时重新检查的间隔(秒)
+SLOT_POLL_SECONDS = 0.2
+# 两次降低并发数之间的最小间隔(秒)，同一批并发请求同时被限流时只减半一次
+DECREASE_INTERVAL = 5.0
+
+
+class RateLimiter:
+    """
+    跨进程共享的速率限制器，状态保存在SQLite中，进程池中的所有工作进程共用同一份状态
+    每个限流对象（服务地址+模型名）一个令牌桶，按每分钟请求数(rpm)和每分钟token数(tpm)限速；
+    在此之上用AIMD控制同时在途的请求数：请求成功时并发数缓慢增加（每成功约一轮增加1），
+    遇到429或超时时减半，上限为max_concurrent
+    用法：
+        slot = limiter.acquire(estimated_tokens)
+        ...发送请求...
+        limiter.release(slot, "ok", estimated_tokens, actual_tokens)
+    """
+
+    def __init__(self, path, key, rpm=None, tpm=None, max_concurrent=2, adaptive=False):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrent = max(max_concurrent, 1)
+        self.adaptive = adaptive
+        # 开启自适应时从上限的一半起步，否则固定为上限
+        self.initial_concurrent = max(1, math.ceil(self.max_concurrent / 2)) if adaptive else self.max_concurrent
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                           "key TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL, "
+                           "concurrency REAL, last_decrease REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS slots ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, acquired REAL)")
+
+    def _load(self, now):
+        """读取并补充令牌桶，返回(可用请求数, 可用token数, 并发上限, 上次减半时间)，需在事务中调用"""
+        row = self._conn.execute("SELECT requests, tokens, updated, concurrency, last_decrease FROM buckets "
+                                 "WHERE key = ?", (self.key,)).fetchone()
+        if row is None:
+            return self.rpm or 0, self.tpm or 0, self.initial_concurrent, 0
+        requests, tokens, updated, concurrency, last_decrease = row
+        elapsed = max(now - updated, 0)
+        if self.rpm:
+            requests = min(self.rpm, requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            tokens = min(self.tpm, tokens + elapsed * self.tpm / 60)
+        if not self.adaptive:
+            concurrency = self.max_concurrent
+        return requests, tokens, min(max(concurrency, 1), self.max_concurrent), last_decrease
+
+    def _store(self, now, requests, tokens, concurrency, last_decrease):
+        self._conn.execute("INSERT OR REPLACE INTO buckets(key, requests, tokens, updated, concurrency, last_decrease) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", (self.key, requests, tokens, now, concurrency, last_decrease))
+
+    def try_acquire(self, estimated_tokens=0):
+        """
+        尝试获取一次请求的额度
+        Returns:
+            tuple: (名额编号, 0)，或额度不足时(None, 建议等待的秒数)
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens, concurrency, last_decrease = self._load(now)
+                self._conn.execute("DELETE FROM slots WHERE key = ? AND acquired < ?",
+                                   (self.key, now - SLOT_LEASE_SECONDS))
+                inflight = self._conn.execute("SELECT COUNT(*) FROM slots WHERE key = ?", (self.key,)).fetchone()[0]
+                # 单个请求超过tpm时只要求桶满，避免永远等待
+                needed_tokens = min(estimated_tokens, self.tpm) if self.tpm else 0
+
+                wait = 0
+                if inflight >= int(concurrency):
+                    wait = SLOT_POLL_SECONDS
+                elif self.rpm and requests < 1:
+                    wait = (1 - requests) * 60 / self.rpm
+                elif self.tpm and tokens < needed_tokens:
+                    wait = (needed_tokens - tokens) * 60 / self.tpm
+
+                slot = None
+                if not wait:
+                    requests -= 1 if self.rpm else 0
+                    tokens -= needed_tokens
+                    slot = self._conn.execute("INSERT INTO slots(key, acquired) VALUES (?, ?)",
+                                              (self.key, now)).lastrowid
+                self._store(now, requests, tokens, concurrency, last_decrease)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return slot, wait
+
+    def acquire(self, estimated_tokens=0):
+        """阻塞直到获得额度，返回名额编号"""
+        while True:
+            slot, wait = self.try_acquire(estimated_tokens)
+            if slot is not None:
+                return slot
+            time.sleep(wait)
+
+    async def acquire_async(self, estimated_tokens=0, executor=None):
+        """acquire的异步版本，SQLite事务在executor（默认为事件循环的默认线程池）中执行，等待期间不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            slot, wait = await loop.run_in_executor(executor, self.try_acquire, estimated_tokens)
+            if slot is not None:
+                return slot
+            await asyncio.sleep(wait)
+
+    def release(self, slot, outcome="ok", estimated_tokens=0, actual_tokens=None):
+        """
+        释放名额，并根据请求结果调整并发数
+        Args:
+            slot: acquire返回的名额编号
+            outcome: "ok"请求成功；"throttled"遇到429或超时，并发数减半；其他值不调整并发数
+            estimated_tokens: acquire时预估的token数
+            actual_tokens: 服务端返回的实际token数，用于修正令牌桶
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM slots WHERE id = ?", (slot,))
+                requests, tokens, concurrency, last_decrease = self._load(now)
+                if self.tpm and actual_tokens is not None:
+                    tokens = min(self.tpm, tokens + min(estimated_tokens, self.tpm) - actual_tokens)
+                if self.adaptive:
+                    if outcome == "ok":
+                        concurrency = min(self.max_concurrent, concurrency + 1 / concurrency)
+                    elif outcome == "throttled" and now - last_decrease >= DECREASE_INTERVAL:
+                        concurrency = max(1, concurrency / 2)
+                        last_decrease = now
+                        print(f"\n{self.key} 被限流，并发数降至 {int(concurrency)}")
+                self._store(now, requests, tokens, concurrency, last_decrease)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def concurrency(self):
+        """当前的并发上限"""
+        with self._lock:
+            return int(self._load(time.time())[2])
+
+
+# 每个进程按(进程号, 限流对象)缓存的限速器
+_LIMITERS = {}
+
+
+def get_rate_limiter(key, rpm=None, tpm=None, max_concurrent=2, adaptive=False):
+    """
+    获取当前进程中key对应的限速器，按LLM_API中的Rate_limit_path配置打开
+    未配置路径，或rpm、tpm、adaptive均未设置时返回None
+    """
+    if not (rpm or tpm or adaptive):
+        return None
+    from LLM_API import Rate_limit_path
+    if not Rate_limit_path:
+        return None
+    cache_key = (os.getpid(), key)
+    limiter = _LIMITERS.get(cache_key)
+    if limiter is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), Rate_limit_path)
+        limiter = RateLimiter(path, key, rpm, tpm, max_concurrent, adaptive)
+        _LIMITERS[cache_key] = limiter
+    return limiter
@@ -0,0 +1,163 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# 可重试的错误类型：限流、服务端错误、超时、连接中断、未知错误
+RETRYABLE_ERRORS = {"rate_limited", "server", "timeout", "connection", "other"}
+# 退避等待的上限(秒)
+MAX_RETRY_DELAY = 60
+# 连续失败多少次后熔断，以及熔断持续的秒数
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 30
+# 探测请求超过该秒数仍未结束（如所在线程被中断）时视为丢失，重新放行一个探测请求
+BREAKER_PROBE_TIMEOUT_SECONDS = 300
+
+# 续写被中断的输出时附加的提示
+CONTINUE_PROMPT = "输出中断了，请从中断处继续输出剩余内容，不要重复已输出的部分，也不要添加任何说明。"
+
+
+def parse_retry_after(value):
+    """解析Retry-After响应头，支持秒数和HTTP日期，返回需要等待的秒数，无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_status(status, headers=None):
+    """
+    按HTTP状态码对错误分类
+    Returns:
+        tuple: (错误类型, Retry-After等待秒数或None)，错误类型为rate_limited、server、auth或client
+    """
+    retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+    if status == 429:
+        return "rate_limited", retry_after
+    # 鉴权失败、余额不足，与所用的API key有关
+    if status in (401, 402, 403):
+        return "auth", None
+    if status >= 500 or status == 408:
+        return "server", retry_after
+    return "client", None
+
+
+def is_retryable(kind):
+    """请求参数、鉴权等客户端错误用同一个key重试也不会成功，其他错误可以重试"""
+    return kind in RETRYABLE_ERRORS
+
+
+def limiter_outcome(kind):
+    """将错误类型映射为限速器的结果，限流和超时会降低并发数"""
+    return "throttled" if kind in ("rate_limited", "timeout") else "error"
+
+
+def retry_delay(attempt, retry_after=None):
+    """
+    第attempt次重试前的等待秒数
+    服务端给出Retry-After时至少等待该时长，否则按指数退避；均附加随机抖动，避免多个进程同时重试
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    delay = min(MAX_RETRY_DELAY, 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """
+    服务商级别的熔断器
+    连续失败达到阈值后熔断，熔断期间的请求等待冷却结束；冷却结束后只放行一个探测请求，
+    探测成功则恢复，失败则重新熔断；探测请求因其他原因结束（参数错误、被取消等）时须调用release_probe
+    用法：
+        wait, probe = breaker.before_request()
+        try:
+            ...  # 成功时record_success()，服务商出错时record_failure(probe)
+        finally:
+            breaker.release_probe(probe)  # 已调用record_success/record_failure或不是探测请求时无影响
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS,
+                 probe_timeout=BREAKER_PROBE_TIMEOUT_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.failures = 0
+        self.opened_at = None
+        # 当前探测请求的放行时间，没有探测请求时为None
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """是否处于熔断状态"""
+        with self._lock:
+            return self.opened_at is not None
+
+    def before_request(self):
+        """
+        发送请求前调用
+        Returns:
+            tuple: (需要等待的秒数，0表示可以发送, 探测请求的标识，不是探测请求时为None)
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0, None
+            now = time.monotonic()
+            remaining = self.opened_at + self.cooldown - now
+            if remaining > 0:
+                return remaining, None
+            if self._probe_started is not None and now - self._probe_started < self.probe_timeout:
+                return 1, None
+            # 冷却结束，放行一个探测请求
+            self._probe_started = now
+            return 0, now
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"\n{self.name} 已恢复")
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self, probe=None):
+        """记录一次服务商错误，probe为before_request返回的探测请求标识时表示探测失败，立即重新熔断"""
+        with self._lock:
+            self.failures += 1
+            is_probe = probe is not None and probe == self._probe_started
+            if is_probe or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._probe_started = None
+                print(f"\n{self.name} 连续失败 {self.failures} 次，暂停请求 {self.cooldown} 秒")
+
+    def release_probe(self, probe):
+        """探测请求未得出结果就结束时调用，熔断状态不变，之后的请求重新作为探测请求；probe为None时无影响"""
+        with self._lock:
+            if probe is not None and probe == self._probe_started:
+                self._probe_started = None
+
+
+# 每个进程内按(进程号, 服务商)缓存的熔断器
+_BREAKERS = {}
+
+
+def get_circuit_breaker(name):
+    """获取当前进程中name对应的熔断器，不存在则创建"""
+    key = (os.getpid(), name)
+    breaker = _BREAKERS.get(key)
+    if breaker is None:
+        breaker = _BREAKERS.setdefault(key, CircuitBreaker(name))
+    return breaker
+
+
+def continuation_messages(messages, partial_output):
+    """请求中断后续写的消息：在原对话后附上已输出的部分和续写提示"""
+    return messages + [{"role": "assistant", "content": partial_output},
+                       {"role": "user", "content": CONTINUE_PROMPT}]
@@ -0,0 +1,85 @@
+from utils import determine_heading_level
+
+# 拆分过大的章节时依次尝试的标题等级
+SPLIT_HEADING_LEVELS = (2, 3)
+
+
+def split_at_headings(section, level):
+    """在第level级标题处将章节拆分为若干小节，第一个小节包含章节开头到第一个该级标题之前的内容"""
+    starts = [0] + [i for i, block in enumerate(section)
+                    if i > 0 and block.type == 'header' and determine_heading_level(block.text) == level]
+    return [section[start:end] for start, end in zip(starts, starts[1:] + [len(section)])]
+
+
+def split_oversized_section(section, cost, limit, levels=SPLIT_HEADING_LEVELS):
+    """
+    将耗时超过limit的章节在二级、三级标题处拆分为若干部分
+    相邻的小节合并为不超过limit的部分，合并后仍然过大的部分再按下一级标题拆分；没有可拆分的标题时保持原样
+    Args:
+        section: 章节的块列表
+        cost: 计算块列表预计耗时的函数
+        limit: 每部分的耗时上限
+    Returns:
+        list: 按原顺序排列的各部分，拼接后与原章节相同
+    """
+    if not levels or cost(section) <= limit:
+        return [section]
+    subsections = split_at_headings(section, levels[0])
+    if len(subsections) == 1:
+        return split_oversized_section(section, cost, limit, levels[1:])
+
+    parts = []
+    current = []
+    current_cost = 0
+    for subsection in subsections:
+        subsection_cost = cost(subsection)
+        if current and current_cost + subsection_cost > limit:
+            parts.append(current)
+            current = []
+            current_cost = 0
+        current = current + subsection
+        current_cost += subsection_cost
+    parts.append(current)
+    return [piece for part in parts for piece in split_oversized_section(part, cost, limit, levels[1:])]
+
+
+class SectionSchedule:
+    """
+    章节翻译任务的调度计划
+    总耗时取决于最大的章节，因此：
+    - 预计耗时超过平均每个并行单元工作量（总耗时/并行数）的章节，在二级、三级标题处拆分为多个独立任务
+    - 按预计耗时从大到小提交任务（LPT），大任务先开始，小任务填补空闲
+    任务按原文顺序编号，各任务的结果按编号顺序拼接即为完整的译文
+    """
+
+    def __init__(self, sections, cost, workers):
+        """
+        Args:
+            sections: 按一级标题划分的章节列表
+            cost: 计算块列表预计耗时的函数
+            workers: 并行数
+        """
+        section_costs = [cost(section) for section in sections]
+        limit = sum(section_costs) / max(workers, 1)
+        # 各任务的块列表、所属章节编号、预计耗时，按原文顺序排列
+        self.jobs = []
+        self.section_of = []
+        self.costs = []
+        for idx, (section, section_cost) in enumerate(zip(sections, section_costs)):
+            parts = split_oversized_section(section, cost, limit) if section_cost > limit else [section]
+            for part in parts:
+                self.jobs.append(part)
+                self.section_of.append(idx)
+                self.costs.append(cost(part) if len(parts) > 1 else section_cost)
+        # 任务是否为所在章节的最后一部分，章节之间需要分隔，同一章节的各部分直接拼接
+        self.section_ends = [job + 1 == len(self.jobs) or self.section_of[job + 1] != self.section_of[job]
+                             for job in range(len(self.jobs))]
+        # 提交顺序：预计耗时从大到小，耗时相同时按原文顺序
+        self.order = sorted(range(len(self.jobs)), key=lambda job: (-self.costs[job], job))
+
+    def layout(self):
+        """任务的划分方式：各任务在源Markdown中的起始行号，用于判断断点日志是否仍然适用"""
+        return [job[0].start_line for job in self.jobs]
+
+    def __len__(self):
+        return len(self.jobs)
@@ -0,0 +1,136 @@
+import time
+
+
+class OutputSink:
+    """
+    流式输出的接收端，LLM_Stream_Response会将每个增量内容写入sink
+    子类需实现write，按需实现flush和close
+    """
+
+    def write(self, text):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def checkpoint(self):
+        """返回当前写入位置，用于请求失败时回滚；不支持回滚的sink返回None"""
+        return None
+
+    def rollback(self, checkpoint):
+        """丢弃checkpoint之后写入的内容"""
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BufferedFileSink(OutputSink):
+    """
+    带缓冲的文件sink，文件在整个生命周期内只打开一次
+    缓冲区超过flush_bytes字节或距上次落盘超过flush_interval秒时写入磁盘，以便实时预览block文件
+    """
+
+    def __init__(self, file_path, mode='a', flush_bytes=4096, flush_interval=0.5, encoding='utf-8'):
+        self.file_path = file_path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._file = open(file_path, mode, encoding=encoding)
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, text):
+        if not text:
+            return
+        self._buffer.append(text)
+        # 按字符数估计字节数，避免逐个增量编码
+        self._buffered_bytes += len(text)
+        if (self._buffered_bytes >= self.flush_bytes
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write("".join(self._buffer))
+            self._buffer = []
+            self._buffered_bytes = 0
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def checkpoint(self):
+        self.flush()
+        return self._file.tell()
+
+    def rollback(self, checkpoint):
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._file.seek(checkpoint)
+        self._file.truncate()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+class MemorySink(OutputSink):
+    """将输出保存在内存中，通过getvalue获取"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        if text:
+            self._parts.append(text)
+
+    def checkpoint(self):
+        return len(self._parts)
+
+    def rollback(self, checkpoint):
+        del self._parts[checkpoint:]
+
+    def getvalue(self):
+        return "".join(self._parts)
+
+
+class CallbackSink(OutputSink):
+    """每收到一个增量内容就调用一次callback(text)，可用于界面实时显示或进程间转发"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, text):
+        if text:
+            self.callback(text)
+
+
+class QueueSink(CallbackSink):
+    """将每个增量内容放入队列（queue.Queue、multiprocessing.Queue等）"""
+
+    def __init__(self, queue):
+        super().__init__(queue.put)
+        self.queue = queue
+
+
+def open_sink(target, **kwargs):
+    """
+    将写入目标统一为OutputSink
+    Args:
+        target: None、文件路径或OutputSink对象
+        **kwargs: 传给BufferedFileSink的参数
+    Returns:
+        tuple: (sink, sink是否为新建的，新建的sink需在使用完后关闭)
+    """
+    if target is None:
+        return None, False
+    if isinstance(target, OutputSink):
+        return target, False
+    return BufferedFileSink(target, **kwargs), True
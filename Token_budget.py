@@ -0,0 +1,100 @@
+import math
+from functools import lru_cache
+
+from utils import estimate_tokens
+
+# 逐句对照的输出约为原文token数的倍数：原文照抄一遍，再加上中文译文
+OUTPUT_RATIO = 2.5
+# 拆分片段时为输出预留的余量，预计输出只占max_tokens的该比例
+OUTPUT_FILL = 0.8
+# 设置单次请求的max_tokens时，在预计输出之上额外放宽的比例和token数，避免估计偏小时截断
+MAX_TOKENS_MARGIN = 1.3
+MAX_TOKENS_SLACK = 256
+# 每个分词器缓存的文本数
+TOKEN_CACHE_SIZE = 65536
+
+
+class Tokenizer:
+    """
+    计算文本token数的分词器，结果按文本缓存
+    安装了tiktoken且模型名可识别（如gpt-4o）时使用对应的分词器精确计数，
+    否则用utils.estimate_tokens估算，再乘以模型配置的token_scale校准
+    """
+
+    def __init__(self, name, encode=None, scale=1.0):
+        """
+        Args:
+            name: 分词器名称
+            encode: 将文本编码为token列表的函数，为None时使用估算
+            scale: 估算值的校准系数，即实际token数/估算token数
+        """
+        self.name = name
+        self._encode = encode
+        self.scale = scale
+        self.count = lru_cache(maxsize=TOKEN_CACHE_SIZE)(self._count)
+
+    def _count(self, text):
+        if not text:
+            return 0
+        if self._encode is not None:
+            return len(self._encode(text))
+        return math.ceil(estimate_tokens(text) * self.scale)
+
+    def count_block(self, block):
+        """MarkdownBlock的token数"""
+        return self.count(block.text)
+
+
+# 按(分词器名称, 校准系数)缓存的分词器
+_TOKENIZERS = {}
+
+
+def get_tokenizer(model):
+    """
+    获取模型的分词器
+    模型配置了tokenizer（tiktoken编码名，如"o200k_base"）时使用该编码；未配置时按模型名查找tiktoken的编码；
+    未安装tiktoken、找不到编码或无法下载编码文件（如离线）时使用估算
+    """
+    name = model.tokenizer
+    encode = None
+    try:
+        import tiktoken
+        # pip install tiktoken
+        encoding = tiktoken.get_encoding(name) if name else tiktoken.encoding_for_model(model.model_name)
+        name, encode = encoding.name, encoding.encode_ordinary
+    except Exception:
+        # tiktoken首次使用编码时需要下载BPE文件，离线时抛出requests或OSError异常
+        name = "estimate"
+    key = (name, model.token_scale if encode is None else 1.0)
+    tokenizer = _TOKENIZERS.get(key)
+    if tokenizer is None:
+        tokenizer = _TOKENIZERS.setdefault(key, Tokenizer(name, encode, key[1]))
+    return tokenizer
+
+
+class TokenBudget:
+    """
+    片段的token预算
+    按模型的输出上限max_output_tokens拆分片段，使每个片段的预计输出（约为原文的OUTPUT_RATIO倍）
+    占满输出窗口又不超过上限
+    """
+
+    def __init__(self, model):
+        self.tokenizer = get_tokenizer(model)
+        self.max_output_tokens = model.max_output_tokens
+        # 单个片段原文的token上限
+        self.chunk_tokens = max(1, int(self.max_output_tokens * OUTPUT_FILL / OUTPUT_RATIO))
+
+    @classmethod
+    def for_models(cls, models):
+        """多个模型共用的预算，取片段上限最小的模型，保证切换模型后片段仍不超出输出上限"""
+        return min((cls(model) for model in models), key=lambda budget: budget.chunk_tokens)
+
+    def count_block(self, block):
+        return self.tokenizer.count_block(block)
+
+
+def request_max_tokens(model, source_text):
+    """按待翻译原文的长度设置单次请求的max_tokens，不超过模型的输出上限"""
+    expected = get_tokenizer(model).count(source_text) * OUTPUT_RATIO
+    return min(model.max_output_tokens, math.ceil(expected * MAX_TOKENS_MARGIN) + MAX_TOKENS_SLACK)
@@ -1,16 +1,25 @@
 import os
 import random
+import shutil
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from difflib import SequenceMatcher
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from Autoadjust_title import arrange_titles
+from Conversation_history import ConversationHistory
 from LLM_API import *
 from LLM_API import ChooseLLM, Mistral_OCR_API
 from LLM_tools import LLM_Stream_Response
-from Mistral_OCR import pdf2markdown
-from utils import split_markdown_into_blocks, merge_by_top_section, count_words, clean_filename, select_md_or_pdf_files
+from Model_pool import ModelPool
+from PDF_backends import choose_pdf_backend
+from Section_scheduler import SectionSchedule
+from Stream_sinks import BufferedFileSink
+from Token_budget import TokenBudget, request_max_tokens
+from Translation_cache import TranslationCache, cached_response, get_translation_cache
+from Translation_journal import TranslationJournal
+from utils import split_markdown_into_blocks, merge_by_top_section, count_words, clean_filename, select_md_or_pdf_files, \
+    MarkdownBlock, align_paragraphs
 
 
 # from LLM_API_test import gemini_2_flash
@@ -29,52 +38,24 @@ def recover_paragraph(translated_file_path, original_blocks):
     # 解析翻译后的内容为blocks
     translated_blocks = split_markdown_into_blocks(translated_content)
 
-    # 提取原文中的paragraph blocks及其开头内容
-    original_paragraphs = []
-    for i, block in enumerate(original_blocks):
-        if block[0] == 'paragraph':
-            # 提取开头的N个字符作为匹配特征
-            preview = block[1][:100] if len(block[1]) > 100 else block[1]
-            original_paragraphs.append((i, preview, block))
-
-    # 提取翻译后的paragraph blocks
-    translated_paragraphs = []
-    for i, block in enumerate(translated_blocks):
-        if block[0] == 'paragraph':
-            translated_paragraphs.append((i, block[1]))
-
-    # 对每个原文paragraph找到最匹配的译文paragraph
-    matches = []
-    for orig_idx, orig_preview, orig_block in original_paragraphs:
-        best_match_score = 0
-        best_match_idx = -1
-
-        # 使用SequenceMatcher查找最佳匹配
-        for trans_idx, trans_content in translated_paragraphs:
-            # 比较原文预览与译文开头的相似度
-            matcher = SequenceMatcher(None, orig_preview,
-                                      trans_content[:100] if len(trans_content) > 100 else trans_content)
-            score = matcher.ratio()
-
-            if score > best_match_score:
-                best_match_score = score
-                best_match_idx = trans_idx
-
-        if best_match_idx != -1:
-            matches.append((orig_idx, best_match_idx))
-
-    # 按原文顺序排序匹配结果
-    matches.sort(key=lambda x: x[0])
+    # 提取原文和译文中的paragraph blocks的下标
+    original_paragraphs = [i for i, block in enumerate(original_blocks) if block.type == 'paragraph']
+    translated_paragraphs = [i for i, block in enumerate(translated_blocks) if block.type == 'paragraph']
+
+    # 按顺序将每个原文paragraph对齐到译文paragraph
+    matches = align_paragraphs([original_blocks[i].text for i in original_paragraphs],
+                               [translated_blocks[i].text for i in translated_paragraphs])
+    matched_indices = {translated_paragraphs[trans_pos] for _, trans_pos in matches}
 
     # 构建新的输出内容
     output_content = []
 
     for trans_idx, block in enumerate(translated_blocks):
         # 如果当前block是已匹配的paragraph
-        if block[0] == 'paragraph' and any(m[1] == trans_idx for m in matches):
+        if trans_idx in matched_indices:
             # 添加额外的换行符
             output_content.append('\n')
-        output_content.append(block[1])
+        output_content.append(block.text)
     # 覆写文件
     with open(translated_file_path, 'w', encoding='utf-8') as f:
         f.writelines(output_content)
@@ -95,13 +76,22 @@ def translate_references(section, block_file, model: LLM_model, max_translation=
         - 保持原有的引用编号格式
         - 直接输出译文，不要有任何解释"""
 
-        translated_text, token_usage = LLM_Stream_Response(
-            model=model,
-            system_prompt=system_prompt,
-            prompt=f"翻译以下参考文献：\n{text_batch}",
+        prompt = f"翻译以下参考文献：\n{text_batch}"
+        cache_key = TranslationCache.make_key(model.model_name, prompt, system_prompt)
+        batch_cache_keys.append(cache_key)
+        translated_text, token_usage = cached_response(
+            cache,
+            cache_key,
+            lambda: LLM_Stream_Response(
+                model=model,
+                system_prompt=system_prompt,
+                prompt=prompt,
+                write_file=block_file,
+                timeout=10,
+                max_tokens=4095
+            ),
             write_file=block_file,
-            timeout=10,
-            max_tokens=4095
+            model_name=model.model_name
         )
 
         if translated_text is None:
@@ -115,10 +105,14 @@ def translate_references(section, block_file, model: LLM_model, max_translation=
         if len(translated_blocks) != len(original_blocks):
             return False
         for trans_block, orig_block in zip(translated_blocks, original_blocks):
-            if trans_block[0] != orig_block[0]:
+            if trans_block.type != orig_block.type:
                 return False
         return True
 
+    cache = get_translation_cache()
+    # 本次尝试中各批次的缓存键，验证失败时丢弃对应缓存，避免重试时再次命中
+    batch_cache_keys = []
+
     # 清空输出文件
     open(block_file, 'w', encoding='utf-8').close()
 
@@ -128,12 +122,11 @@ def translate_references(section, block_file, model: LLM_model, max_translation=
     batch_contents = []
 
     # 将翻译的内容分批
-    for block in section:
-        block_type, block_content = block
-        current_text += block_content + '\n'
+    for block_index, block in enumerate(section):
+        current_text += block.text + '\n'
         current_words += count_words(block)
 
-        if current_words >= max_translation or block == section[-1]:
+        if current_words >= max_translation or block_index == len(section) - 1:
             batch_contents.append(current_text)
             current_text = ""
             current_words = 0
@@ -141,6 +134,7 @@ def translate_references(section, block_file, model: LLM_model, max_translation=
     # 对每个批次进行翻译和验证
     for retry in range(max_retries):
         translated_content = ""
+        batch_cache_keys.clear()
         open(block_file, 'w', encoding='utf-8').close()  # 清空文件
 
         # 翻译每个批次
@@ -159,13 +153,13 @@ def translate_references(section, block_file, model: LLM_model, max_translation=
             # 重新处理内容：将译文和原文对照
             final_content = []
             for trans_block, orig_block in zip(translated_blocks, section):
-                if trans_block[0] == "paragraph" and orig_block[0] == "paragraph":
-                    if trans_block[1].lstrip().startswith('[') and orig_block[1].lstrip().startswith('['):
-                        final_content.append(f"{trans_block[1].rstrip()} ==> {orig_block[1]}")
+                if trans_block.type == "paragraph" and orig_block.type == "paragraph":
+                    if trans_block.text.lstrip().startswith('[') and orig_block.text.lstrip().startswith('['):
+                        final_content.append(f"{trans_block.text.rstrip()} ==> {orig_block.text}")
                     else:
-                        final_content.append(trans_block[1])
+                        final_content.append(trans_block.text)
                 else:
-                    final_content.append(orig_block[1])
+                    final_content.append(orig_block.text)
 
             # 写入最终结果
             with open(block_file, 'w', encoding='utf-8') as f:
@@ -173,29 +167,21 @@ def translate_references(section, block_file, model: LLM_model, max_translation=
             return block_file
 
         print(f"参考文献翻译验证失败（第{retry + 1}次尝试），准备重试...")
+        if cache:
+            for cache_key in batch_cache_keys:
+                cache.delete(cache_key)
+        batch_cache_keys.clear()
         time.sleep(random.uniform(2, 5))
 
     # 所有重试都失败，使用原文
     print("参考文献翻译失败，使用原文")
     with open(block_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(block[1] for block in section))
+        f.write('\n'.join(block.text for block in section))
     return block_file
 
 
-def TranslateProcess(section, idx, file_dir, model: LLM_model, max_translation=1000, md_file_name=""):
-    """
-    处理单个块的翻译过程，并将结果写入文件
-    Args:
-        section: 待处理的section内容（块列表）
-        idx: section序号
-        file_dir: 输出目录
-        max_translation: 最大翻译字数
-        model: LLM模型
-        md_file_name: 原始Markdown文件名（不含扩展名）
-    Returns:
-        str: 生成的块文件路径
-    """
-    SYS_PROMPT = """
+# 逐句对照翻译的系统提示词
+TRANSLATION_SYS_PROMPT = """
 你是专业从事学术论文翻译的高技能翻译引擎。你的职责是将学术文本翻译成中文，确保复杂概念和专业术语的准确翻译，而不改变原有的学术语气或添加解释。
 注意:
 - 保持和原文格式一致。
@@ -206,44 +192,11 @@ def TranslateProcess(section, idx, file_dir, model: LLM_model, max_translation=1
 你将以逐句对照的形式给出翻译，要求原文一句，译文一句，原文在上，英文在下
 """
 
-    # 提取标题文本
-    title_text = "untitled"
-    for block in section:
-        if block[0] == 'header' and block[1].startswith('#'):
-            title_text = block[1].strip('#').strip()
-            break
-
-    # 清理并限制标题长度
-    safe_title = clean_filename(title_text)[:30]
-
-    # 创建块文件
-    block_file = os.path.join(file_dir, f"block_{idx:02d}_{safe_title}_{md_file_name}.md")
-
-    """处理参考文献章节"""
-    # 检查是否为参考文献章节
-    is_references = False
-    for block in section:
-        if block[0] == 'header' and title_text == '参考文献':
-            is_references = True
-            break
-
-    if is_references:
-        # 使用专门的参考文献处理函数
-        # translate_references(section, block_file)
-        # return block_file
-        # 不翻译，直接写入
-        with open(block_file, 'w', encoding='utf-8') as f:
-            for block in section:
-                f.write(block[1] + '\n')
-        return block_file
-
-    # 初始化对话历史
-    # todo 保持对话历史不超过n轮
-    conversation_history = [
-        {"role": "system", "content": SYS_PROMPT},
-        {"role": "user",
-         "content": f"A microservice system in industry is usually a large-scale distributed system consisting of dozens to thousands of services running in different machines. An anomaly of the system often can be reflected in traces and logs, which record inter-service interactions and intra-service behaviors respectively.Existing trace anomaly detection approaches treat a trace as a sequence of service invocations. They ignore the complex structure of a trace brought by its invocation hierarchy and parallel/asynchronous invocations."},
-        {"role": "assistant", "content": """A microservice system in industry is usually a large-scale distributed system consisting of dozens to thousands of services running in different machines.
+# 案例引导用的示例对话
+FEW_SHOT_MESSAGES = [
+    {"role": "user",
+     "content": f"A microservice system in industry is usually a large-scale distributed system consisting of dozens to thousands of services running in different machines. An anomaly of the system often can be reflected in traces and logs, which record inter-service interactions and intra-service behaviors respectively.Existing trace anomaly detection approaches treat a trace as a sequence of service invocations. They ignore the complex structure of a trace brought by its invocation hierarchy and parallel/asynchronous invocations."},
+    {"role": "assistant", "content": """A microservice system in industry is usually a large-scale distributed system consisting of dozens to thousands of services running in different machines.
 工业中的微服务系统通常是由数十到数千个服务在不同机器上运行的大规模分布式系统。
 An anomaly of the system often can be reflected in traces and logs, which record inter-service interactions and intra-service behaviors respectively.
 系统的异常通常可以在痕迹和日志中反映出来，分别记录服务间交互和服务内行为。
@@ -251,78 +204,376 @@ Existing trace anomaly detection approaches treat a trace as a sequence of servi
 现有的痕迹异常检测方法将痕迹视为服务调用的序列。
 They ignore the complex structure of a trace brought by its invocation hierarchy and parallel/asynchronous invocations.
 它们忽略了痕迹因调用层次结构和并行/异步调用带来的复杂结构。"""},
-    ]
+]
 
-    def translate_text(text_to_translate):
-        """执行实际的翻译请求"""
-        # 添加用户消息到对话历史
-        conversation_history.append({"role": "user", "content": f"{text_to_translate}"})
 
-        # 调用新的LLM_Stream_Response函数
-        translated_content, token_usage = LLM_Stream_Response(
-            model=model,
-            messages=conversation_history,
-            write_file=block_file,
-            timeout=30,
-            max_tokens=4095
-        )
+def chunk_cache_key(model: LLM_model, text):
+    """章节片段翻译结果的缓存键"""
+    return TranslationCache.make_key(model.model_name, text, TRANSLATION_SYS_PROMPT, FEW_SHOT_MESSAGES)
 
-        # 处理响应
-        if translated_content is None:
-            # 所有重试都失败，写入原文
-            with open(block_file, 'a', encoding='utf-8') as f:
-                f.write(text_to_translate)
-                f.write(f"\n[翻译出错，使用原文]\n")
-            # 移除失败的用户消息
-            conversation_history.pop()
-            return
-        # 解析翻译结果
 
-        # 记录assistant的完整回复，用于下一次对话
-        conversation_history.append({"role": "assistant", "content": translated_content})
+def initial_conversation():
+    """初始的对话历史：系统提示词+示例对话"""
+    return [{"role": "system", "content": TRANSLATION_SYS_PROMPT}] + [dict(message) for message in FEW_SHOT_MESSAGES]
 
-    # 处理每个块
+
+def section_block_file(section, idx, file_dir, md_file_name=""):
+    """
+    计算章节对应的块文件路径
+    Returns:
+        tuple: (块文件路径, 章节标题)
+    """
+    # 提取标题文本
+    title_text = "untitled"
+    for block in section:
+        if block.type == 'header' and block.text.startswith('#'):
+            title_text = block.text.strip('#').strip()
+            break
+
+    # 清理并限制标题长度
+    safe_title = clean_filename(title_text)[:30]
+
+    return os.path.join(file_dir, f"block_{idx:02d}_{safe_title}_{md_file_name}.md"), title_text
+
+
+def write_section_verbatim(section, block_file):
+    """不翻译，直接将章节原文写入块文件"""
+    with open(block_file, 'w', encoding='utf-8') as f:
+        for block in section:
+            f.write(block.text + '\n')
+    return block_file
+
+
+def split_section_chunks(section, max_translation=1000, budget=None):
+    """
+    将章节拆分为按顺序处理的片段
+    Args:
+        section: 章节的块列表
+        max_translation: 每个片段的最大单词数；提供budget时为可选的额外上限，为None时只按token数拆分
+        budget: 可选的TokenBudget，按token数拆分片段，使每个片段的预计输出不超过模型的输出上限
+    Returns:
+        list: (片段类型, 内容, (起始行, 结束行)) 列表，片段类型为"translate"（待翻译文本）
+              或"text"（直接写入的非paragraph内容），行号为片段在源Markdown中的行范围（左闭右开）
+    """
+    chunks = []
     current_text = ""
+    current_size = 0
     current_words = 0
+    current_lines = None
+    # 片段大小的计量方式：有token预算时按token数，否则按单词数
+    count_size = budget.count_block if budget is not None else count_words
+    max_size = budget.chunk_tokens if budget is not None else max_translation
+    # 有token预算时，max_translation作为额外的单词数上限
+    max_words = max_translation if budget is not None and max_translation else float('inf')
+
+    def flush_current():
+        nonlocal current_text, current_size, current_words, current_lines
+        chunks.append(("translate", current_text, current_lines))
+        current_text = ""
+        current_size = 0
+        current_words = 0
+        current_lines = None
 
     for block in section:
-        block_type, block_content = block
+        block_type, block_content = block.type, block.text
 
         # 如果遇到非paragraph类型，先处理已累积的内容
         if block_type != 'paragraph':
             if current_text:
                 # 先翻译已累积的段落
-                translate_text(current_text)
-                current_text = ""
-                current_words = 0
+                flush_current()
 
             # 直接写入非paragraph内容
-            with open(block_file, 'a', encoding='utf-8') as f:
-                f.write('\n\n' + block_content + '\n\n')
+            chunks.append(("text", '\n\n' + block_content + '\n\n', (block.start_line, block.end_line)))
             continue
 
         # 处理paragraph类型
-        words_count = count_words(block)
+        block_size = count_size(block)
+        words_count = count_words(block) if max_words != float('inf') else 0
 
         # 如果累积内容将超过限制，先翻译当前累积的内容
-        if current_words + words_count > max_translation and current_text:
-            translate_text(current_text)
-            current_text = ""
-            current_words = 0
+        if current_text and (current_size + block_size > max_size or current_words + words_count > max_words):
+            flush_current()
 
         # 累积内容
         current_text += block_content + '\n'
+        current_size += block_size
         current_words += words_count
+        current_lines = (current_lines[0] if current_lines else block.start_line, block.end_line)
 
         # 如果累积内容达到上限，进行翻译
-        if current_words >= max_translation:
-            translate_text(current_text)
-            current_text = ""
-            current_words = 0
+        if current_size >= max_size or current_words >= max_words:
+            flush_current()
 
     # 翻译剩余内容
     if current_text:
-        translate_text(current_text)
+        flush_current()
+    return chunks
+
+
+# 章节内并行翻译时，每个片段附带的上下文最大字符数
+CHUNK_CONTEXT_CHARS = 1500
+
+
+def chunk_context_messages(sources, position, chunk_context="source", last_completed=None,
+                           context_chars=CHUNK_CONTEXT_CHARS):
+    """
+    章节内并行翻译时，为第position个待翻译片段构造有限长度的上下文消息
+    Args:
+        sources: 章节内所有待翻译片段的原文
+        position: 当前片段在sources中的下标
+        chunk_context: "source"附带前后相邻片段的原文；"previous"附带最近一次完成的翻译（原文+译文）
+        last_completed: 最近完成的(原文, 译文)，仅"previous"模式使用
+        context_chars: 上下文的最大字符数
+    Returns:
+        list: 插入在示例对话之后、待翻译内容之前的消息
+    """
+    if chunk_context == "previous":
+        if not last_completed:
+            return []
+        source, translation = last_completed
+        return [{"role": "user", "content": source[-context_chars:]},
+                {"role": "assistant", "content": translation[-context_chars:]}]
+
+    half = context_chars // 2
+    before = sources[position - 1][-half:] if position > 0 else ""
+    after = sources[position + 1][:half] if position + 1 < len(sources) else ""
+    parts = []
+    if before:
+        parts.append(f"上文：\n{before}")
+    if after:
+        parts.append(f"下文：\n{after}")
+    if not parts:
+        return []
+    return [{"role": "user", "content": "以下是待翻译内容的上下文，仅供理解语境，不需要翻译：\n\n" + "\n\n".join(parts)},
+            {"role": "assistant", "content": "好的，我已了解上下文语境。"}]
+
+
+def request_with_failover(model: LLM_model, model_pool, request):
+    """
+    用model发送请求，失败时从模型池中换用其他模型重试
+    Args:
+        model_pool: ModelPool，为None时不切换模型
+        request: 函数request(model)，返回(译文, token统计)，失败时译文为None
+    Returns:
+        tuple: (译文, token统计, 最终使用的模型)
+    """
+    tried = []
+    while True:
+        if model_pool is not None and model.circuit_breaker().is_open():
+            # 模型已熔断，优先换用其他模型，不等待冷却
+            next_model = model_pool.choose(exclude=tried + [model])
+            if next_model is not None:
+                tried.append(model)
+                model = next_model
+        content, token_usage = request(model)
+        if content is not None or model_pool is None:
+            return content, token_usage, model
+        tried.append(model)
+        next_model = model_pool.choose(exclude=tried)
+        if next_model is None:
+            return None, None, model
+        print(f"\n{model.model_name} 请求失败，切换到 {next_model.model_name}")
+        model = next_model
+
+
+def translate_chunks_parallel(chunks, model: LLM_model, block_sink, chunk_concurrency=3, chunk_context="source",
+                              section_journal=None, model_pool=None):
+    """
+    并发翻译章节内的片段，每个片段只携带示例对话和有限的上下文，译文按原顺序写入block_sink
+    Args:
+        chunks: split_section_chunks的结果
+        chunk_concurrency: 同时翻译的片段数
+        chunk_context: 上下文模式，见chunk_context_messages
+        section_journal: 可选的SectionJournal，已记录的片段直接使用记录的译文，新完成的片段写入日志
+        model_pool: 可选的ModelPool，每个片段从池中按权重选择模型，失败时换用其他模型
+    Returns:
+        int: 翻译失败（使用原文）的片段数
+    """
+    translate_chunks = [(content, lines) for kind, content, lines in chunks if kind == "translate"]
+    sources = [content for content, lines in translate_chunks]
+    journaled = [section_journal.completed(position, source) if section_journal is not None else None
+                 for position, source in enumerate(sources)]
+    lock = threading.Lock()
+    last_completed = [None]
+    cache = get_translation_cache()
+
+    def translate_one(position):
+        with lock:
+            previous = last_completed[0]
+        messages = (initial_conversation()
+                    + chunk_context_messages(sources, position, chunk_context, previous)
+                    + [{"role": "user", "content": sources[position]}])
+        translated_content, token_usage, used_model = request_with_failover(
+            model_pool.choose() if model_pool else model,
+            model_pool,
+            lambda chunk_model: cached_response(
+                cache,
+                chunk_cache_key(chunk_model, sources[position]),
+                lambda: LLM_Stream_Response(
+                    model=chunk_model,
+                    messages=messages,
+                    timeout=30,
+                    max_tokens=request_max_tokens(chunk_model, sources[position])
+                ),
+                model_name=chunk_model.model_name
+            )
+        )
+        if translated_content is not None:
+            with lock:
+                last_completed[0] = (sources[position], translated_content)
+            if section_journal is not None:
+                content, (start_line, end_line) = translate_chunks[position]
+                section_journal.record(position, content, start_line, end_line, translated_content,
+                                       used_model.model_name)
+        return translated_content
+
+    with ThreadPoolExecutor(max_workers=chunk_concurrency) as executor:
+        futures = [executor.submit(translate_one, position) if journaled[position] is None else None
+                   for position in range(len(sources))]
+        position = 0
+        failed = 0
+        # 按原顺序写入，前面的片段完成后即可实时预览
+        for kind, content, lines in chunks:
+            if kind != "translate":
+                block_sink.write(content)
+                continue
+            if futures[position] is None:
+                translated_content = journaled[position]
+            else:
+                translated_content = futures[position].result()
+            position += 1
+            if translated_content is None:
+                # 所有重试都失败，写入原文
+                block_sink.write(content)
+                block_sink.write(f"\n[翻译出错，使用原文]\n")
+                failed += 1
+            else:
+                block_sink.write(translated_content)
+            block_sink.flush()
+    return failed
+
+
+def TranslateProcess(section, idx, file_dir, model: LLM_model, max_translation=None, md_file_name="",
+                     chunk_concurrency=1, chunk_context="source", journal=None, model_pool=None):
+    """
+    处理单个块的翻译过程，并将结果写入文件
+    Args:
+        section: 待处理的section内容（块列表）
+        idx: section序号
+        file_dir: 输出目录
+        max_translation: 可选的片段单词数上限；片段按模型的输出token上限(max_output_tokens)拆分，为None时不额外限制
+        model: LLM模型
+        md_file_name: 原始Markdown文件名（不含扩展名）
+        chunk_concurrency: 大于1时章节内的片段并发翻译，每个片段只携带示例对话和有限的上下文
+        chunk_context: 并发翻译时的上下文模式，"source"或"previous"，见chunk_context_messages
+        journal: 可选的TranslationJournal，跳过日志中已完成的片段，从中断处继续翻译
+        model_pool: 可选的ModelPool，model请求失败时从池中换用其他模型，并用于后续片段
+    Returns:
+        str: 生成的块文件路径
+    """
+    # 创建块文件
+    block_file, title_text = section_block_file(section, idx, file_dir, md_file_name)
+
+    """处理参考文献章节"""
+    # 检查是否为参考文献章节
+    if title_text == '参考文献':
+        # 使用专门的参考文献处理函数
+        # translate_references(section, block_file)
+        # return block_file
+        # 不翻译，直接写入
+        write_section_verbatim(section, block_file)
+        if journal:
+            journal.section(idx).mark_done()
+        return block_file
+
+    # 初始化对话历史，超出模型的token预算时裁剪最早的轮次
+    conversation_history = ConversationHistory(initial_conversation(), model.history_tokens)
+    # 翻译缓存，相同的片段直接使用缓存的译文
+    cache = get_translation_cache()
+    # 断点日志，记录已完成的片段
+    section_journal = journal.section(idx) if journal else None
+    if section_journal is not None and len(section_journal):
+        print(f"\n章节 {idx + 1} 从断点恢复，已完成 {len(section_journal)} 个片段")
+
+    # 当前使用的模型，请求失败切换模型后，后续片段沿用新模型
+    current_model = [model]
+
+    def translate_text(text_to_translate):
+        """执行实际的翻译请求，返回译文，失败时返回None"""
+        # 添加用户消息到对话历史
+        conversation_history.append({"role": "user", "content": f"{text_to_translate}"})
+
+        # 先查缓存，未命中时调用LLM_Stream_Response函数
+        translated_content, token_usage, current_model[0] = request_with_failover(
+            current_model[0],
+            model_pool,
+            lambda chunk_model: cached_response(
+                cache,
+                chunk_cache_key(chunk_model, text_to_translate),
+                lambda: LLM_Stream_Response(
+                    model=chunk_model,
+                    messages=conversation_history.window(),
+                    write_file=block_sink,
+                    timeout=30,
+                    max_tokens=request_max_tokens(chunk_model, text_to_translate)
+                ),
+                write_file=block_sink,
+                model_name=chunk_model.model_name
+            )
+        )
+
+        # 处理响应
+        if translated_content is None:
+            # 所有重试都失败，写入原文
+            block_sink.write(text_to_translate)
+            block_sink.write(f"\n[翻译出错，使用原文]\n")
+            # 移除失败的用户消息
+            conversation_history.pop()
+            return None
+        # 解析翻译结果
+
+        # 记录assistant的完整回复，用于下一次对话
+        conversation_history.append({"role": "assistant", "content": translated_content})
+        return translated_content
+
+    # 整个章节共用一个带缓冲的文件sink，避免每个增量都重新打开文件
+    # 块文件每次从头重建，中断前写入的不完整内容不会重复
+    with BufferedFileSink(block_file, mode='w') as block_sink:
+        # 按模型的输出上限拆分片段，使用模型池时取各模型中最小的上限
+        budget = TokenBudget.for_models(model_pool.models if model_pool is not None else [model])
+        chunks = split_section_chunks(section, max_translation, budget)
+        if chunk_concurrency > 1:
+            failed = translate_chunks_parallel(chunks, model, block_sink, chunk_concurrency, chunk_context,
+                                               section_journal, model_pool)
+        else:
+            position = 0
+            failed = 0
+            for kind, content, (start_line, end_line) in chunks:
+                if kind != "translate":
+                    block_sink.write(content)
+                    continue
+
+                journaled = section_journal.completed(position, content) if section_journal is not None else None
+                if journaled is not None:
+                    # 已完成的片段直接写入记录的译文，并恢复对话历史
+                    block_sink.write(journaled)
+                    conversation_history.append({"role": "user", "content": content})
+                    conversation_history.append({"role": "assistant", "content": journaled})
+                else:
+                    translated_content = translate_text(content)
+                    if translated_content is None:
+                        failed += 1
+                    elif section_journal is not None:
+                        section_journal.record(position, content, start_line, end_line, translated_content,
+                                               current_model[0].model_name)
+                position += 1
+
+    if section_journal is not None and not failed:
+        section_journal.mark_done()
+
+    if conversation_history.saved_tokens:
+        print(f"\n章节 {idx + 1} 裁剪对话历史，节省约 {conversation_history.saved_tokens} 个prompt token")
 
     # 恢复分段
     recover_paragraph(block_file, section)
@@ -337,16 +588,16 @@ def check_titles_consistency(orig_titles, translated_titles):
 
     for orig, trans in zip(orig_titles, translated_titles):
         # 检查标题等级（#的数量）是否一致
-        orig_level = len(orig[1].split()[0])  # 计算#的数量
-        trans_level = len(trans[1].split()[0])  # 计算#的数量
+        orig_level = len(orig.text.split()[0])  # 计算#的数量
+        trans_level = len(trans.text.split()[0])  # 计算#的数量
         if orig_level != trans_level:
             return False
     return True
 
 
-def translate_titles(title_blocks, model: LLM_model):
-    """翻译标题块"""
-    title_text = "\n".join(block[1] for block in title_blocks)
+def translate_titles(title_blocks, model: LLM_model, model_pool=None):
+    """翻译标题块，提供model_pool时model请求失败后换用池中的其他模型"""
+    title_text = "\n".join(block.text for block in title_blocks)
 
     system_prompt = """你是专业的Markdown文档标题翻译器。
 请将给定的英文标题翻译成中文，注意：
@@ -356,15 +607,30 @@ def translate_titles(title_blocks, model: LLM_model):
 4. 直接输出翻译结果，不要有任何解释
 """
 
+    cache = get_translation_cache()
+    prompt = f"翻译以下Markdown标题：\n{title_text}"
+
+    def title_cache_key(title_model):
+        return TranslationCache.make_key(title_model.model_name, prompt, system_prompt, temperature=0.3)
+
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            # 使用新的LLM_Stream_Response函数
-            translated_text,token_usage = LLM_Stream_Response(
-                model=model,
-                system_prompt=system_prompt,
-                prompt=f"翻译以下Markdown标题：\n{title_text}",
-                temperature=0.3
+            # 先查缓存，未命中时调用LLM_Stream_Response函数
+            translated_text, token_usage, model = request_with_failover(
+                model,
+                model_pool,
+                lambda title_model: cached_response(
+                    cache,
+                    title_cache_key(title_model),
+                    lambda: LLM_Stream_Response(
+                        model=title_model,
+                        system_prompt=system_prompt,
+                        prompt=prompt,
+                        temperature=0.3
+                    ),
+                    model_name=title_model.model_name
+                )
             )
 
             if translated_text is None:
@@ -376,13 +642,16 @@ def translate_titles(title_blocks, model: LLM_model):
             for line in translated_text.split('\n'):
                 line = line.strip()
                 if line and line.startswith('#'):
-                    translated_titles.append(('header', line))
+                    translated_titles.append(MarkdownBlock('header', line))
 
             # 检查翻译结果是否符合要求
             if check_titles_consistency(title_blocks, translated_titles):
-                return translated_titles
+                # 译文标题沿用原标题块的位置信息
+                return [orig.with_text(trans.text) for orig, trans in zip(title_blocks, translated_titles)]
 
             print(f"第{attempt + 1}次翻译的标题结构不符合要求，重试...")
+            if cache:
+                cache.delete(title_cache_key(model))
 
         except Exception as e:
             print(f"翻译标题时出错: {str(e)}")
@@ -393,73 +662,156 @@ def translate_titles(title_blocks, model: LLM_model):
     return title_blocks
 
 
-from tqdm.auto import tqdm
-
-
-def process_markdown_translation(md_file_path, model: LLM_model, max_translation=1000, max_concurrent=3,remove_block_files=False ):
+def append_file(dst, src_path):
     """
-    处理Markdown文件的翻译
-    Args:
-        md_file_path: Markdown文件路径
-        max_concurrent: 最大并行数
+    将文件src_path的内容追加到已打开的二进制文件dst末尾，支持时使用os.sendfile在内核中直接复制
+    dst不能以追加模式('ab')打开：Linux上sendfile不能写入O_APPEND的文件
+    Returns:
+        bool: 是否使用了sendfile
     """
-    # 获取Markdown文件名（不含扩展名）
-    md_file_name = os.path.splitext(os.path.basename(md_file_path))[0]
-
-    # 读取文件内容
-    with open(md_file_path, 'r', encoding='utf-8') as file:
-        content = file.readlines()
+    with open(src_path, 'rb') as src:
+        if hasattr(os, 'sendfile'):
+            dst.flush()
+            size = os.fstat(src.fileno()).st_size
+            offset = 0
+            try:
+                while offset < size:
+                    sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                # sendfile写入后文件描述符的位置已前移，同步Python文件对象的位置
+                dst.seek(0, os.SEEK_END)
+                return True
+            except OSError:
+                # 部分文件系统不支持sendfile，从头改用普通复制
+                if offset:
+                    raise
+        shutil.copyfileobj(src, dst)
+        return False
 
-    # 分析文件路径
-    file_dir = os.path.dirname(md_file_path)
 
-    # 按照markdown块分割
-    blocks = split_markdown_into_blocks(content)
+class OrderedSectionMerger:
+    """
+    按章节顺序流式合并块文件
+    章节可以乱序完成，第i个章节在0..i都完成后立即追加到输出文件末尾，未轮到的章节暂存在重排缓冲区中
+    用法：
+        merger = OrderedSectionMerger(output_file, len(sections), header)
+        merger.add(idx, block_file)  # 每个章节完成时调用，出错的章节传入None
+        merger.close()
+    """
 
-    # 检查一级标题数量
-    level1_count = sum(1 for t, c in blocks if t == 'header' and c.startswith('# '))
-    if level1_count <= 1:
-        print("检测到一级标题数量不足，正在调整标题层级...")
-        # 调整标题层级，gemini做不来，只能用gpt-4
-        arrange_titles(md_file_path, model=model)
-        with open(md_file_path, 'r', encoding='utf-8') as file:
-            content = file.readlines()
-        # 重新读取调整后的内容
-        blocks = split_markdown_into_blocks(content)
-        print("标题层级调整完成")
+    def __init__(self, output_file, total, header="", remove_block_files=False, section_ends=None):
+        """
+        Args:
+            section_ends: 可选，各块文件是否为所在章节的最后一部分（见SectionSchedule），
+                          章节之间以换行分隔，同一章节拆分出的各部分直接拼接
+        """
+        self.output_file = output_file
+        self.total = total
+        self.remove_block_files = remove_block_files
+        self.section_ends = section_ends
+        self.merged = 0
+        # 使用sendfile追加的块文件数
+        self.sendfile_count = 0
+        # 当前章节是否已写入了内容，用于在章节末尾补上分隔的换行
+        self._section_written = False
+        self._pending = {}
+        self._lock = threading.Lock()
+        # 不使用追加模式打开，否则无法用sendfile写入
+        self._out = open(output_file, 'wb')
+        self._out.write(header.encode('utf-8'))
+
+    def add(self, idx, block_file):
+        """登记第idx个章节的块文件，并追加所有已就绪的连续章节"""
+        with self._lock:
+            self._pending[idx] = block_file
+            while self.merged in self._pending:
+                block_file = self._pending.pop(self.merged)
+                section_end = self.section_ends is None or self.section_ends[self.merged]
+                self.merged += 1
+                # 出错的部分不写入最终结果，但章节的前几部分已写入时仍在章节末尾换行
+                if block_file is not None:
+                    self.sendfile_count += append_file(self._out, block_file)
+                    self._section_written = True
+                if section_end:
+                    if self._section_written:
+                        self._out.write(b'\n')
+                    self._section_written = False
+                self._out.flush()
+                # 删除临时块文件
+                if block_file is not None and self.remove_block_files:
+                    os.remove(block_file)
+
+    def close(self):
+        self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# 每次请求除翻译内容外的固定耗时，折算为token数，用于估计章节的翻译耗时
+REQUEST_OVERHEAD_TOKENS = 200
+
+
+def section_cost(section, budget, max_translation=None):
+    """
+    估计章节（或章节的一部分）的翻译耗时，以token计：待翻译片段的token数之和，加上每次请求的固定开销
+    参考文献章节不翻译，耗时为0
+    """
+    if section_block_file(section, 0, "")[1] == '参考文献':
+        return 0
+    chunks = [content for kind, content, lines in split_section_chunks(section, max_translation, budget)
+              if kind == "translate"]
+    return sum(budget.tokenizer.count(content) for content in chunks) + REQUEST_OVERHEAD_TOKENS * len(chunks)
 
-    # 提取并翻译标题块
-    title_blocks = [(t, c) for t, c in blocks if t == 'header']
 
-    if title_blocks:
-        print("正在翻译文档标题...")
-        translated_titles = translate_titles(title_blocks, model)
+def prewarm_models(models):
+    """进程池的初始化函数：为开启了预热的模型预先建立连接"""
+    for model in models:
+        if model.prewarm_on_start:
+            model.prewarm()
 
-        # 替换原文中的标题
-        title_index = 0
-        for i, (block_type, _) in enumerate(blocks):
-            if block_type == 'header':
-                blocks[i] = translated_titles[title_index]
-                title_index += 1
-        print("标题翻译+替换完成")
 
-    # 按照一级标题合并块
-    sections = merge_by_top_section(blocks)
+def translate_sections_in_pool(sections, file_dir, model: LLM_model, max_translation=None, md_file_name="",
+                               max_concurrent=3, chunk_concurrency=1, chunk_context="source", journal=None,
+                               on_done=None, model_pool=None, order=None):
+    """
+    使用进程池并行翻译各章节
+    Args:
+        on_done: 可选回调on_done(idx, block_file)，每个章节完成时在主进程中调用，出错的章节block_file为None
+        model_pool: 可选的ModelPool，每个章节从池中按权重选择模型，失败时换用其他模型
+        order: 可选的章节提交顺序（章节编号列表），进程池按提交顺序执行，见SectionSchedule.order
+    Returns:
+        list: 完成的块文件路径列表（按完成顺序）
+    """
+    from tqdm.auto import tqdm
 
-    # 并行处理翻译
     block_files = []
-    with ProcessPoolExecutor(max_workers=max_concurrent) as executor:
+    # 开启预热时，每个工作进程启动后先建立好到模型服务的连接
+    models = model_pool.models if model_pool else [model]
+    pool_kwargs = {}
+    if any(pool_model.prewarm_on_start for pool_model in models):
+        pool_kwargs = {"initializer": prewarm_models, "initargs": (models,)}
+    with ProcessPoolExecutor(max_workers=max_concurrent, **pool_kwargs) as executor:
         futures = {
             executor.submit(
                 TranslateProcess,
-                section,
+                sections[idx],
                 idx,
                 file_dir,
-                model,
+                model_pool.choose() if model_pool else model,
                 max_translation,
-                md_file_name  # 传递Markdown文件名
+                md_file_name,  # 传递Markdown文件名
+                chunk_concurrency,
+                chunk_context,
+                journal,
+                model_pool
             ): idx
-            for idx, section in enumerate(sections)
+            for idx in (order if order is not None else range(len(sections)))
         }
 
         # 使用tqdm显示进度
@@ -470,142 +822,297 @@ def process_markdown_translation(md_file_path, model: LLM_model, max_translation
                 block_files.append(block_file)
             except Exception as e:
                 print(f"\n处理章节 {idx + 1} 时出错: {str(e)}")
+                block_file = None
+            if on_done:
+                on_done(idx, block_file)
+    return block_files
 
-    # 按序号排序文件列表
-    block_files.sort(key=lambda x: os.path.basename(x))
-    # todo:不必等到所有翻译完成后再合并，逐个翻译逐个合并
-    '''合并翻译结果'''
-    base_name = os.path.splitext(os.path.basename(md_file_path))[0]
-    # 调整文件名
-    if '_EN_' in base_name:
-        base_name = base_name.replace('_EN_', '_CH_')
-    output_file = os.path.join(file_dir, f"{base_name}_逐句对照.md")
-
-    # 执行断行检查
+
+def break_check_header(md_file_path):
+    """执行断行检查，返回写在最终输出文件开头的检查结果"""
     from Abnormal_line_breaking_check import check_paragraphs_breaks
     print("执行断行检查...")
     issues = check_paragraphs_breaks(md_file_path)
+    header = ["# 断行检查结果\n\n"]
+    if issues:
+        header.append("发现以下异常断行：\n\n")
+        for issue in issues:
+            header.append(f"- 行号 {issue['行号']}: {issue['内容']}\n")
+            if issue.get('开头异常'):
+                header.append("  - 开头异常\n")
+            if issue.get('结尾异常'):
+                header.append("  - 结尾异常\n")
+            if issue.get('引用异常'):
+                header.append("  - 引用格式异常\n")
+    else:
+        header.append("未发现异常断行\n")
+    header.append("\n---\n\n")
+    return "".join(header)
+
+
+class MarkdownDocument:
+    """
+    单个Markdown文档的翻译任务
+    prepare()完成翻译前的准备：调整标题层级、翻译标题、划分并调度章节任务、打开断点日志；
+    各章节任务（schedule.jobs）翻译完成后交给merger()按顺序合并，最后调用finish()收尾
+    """
 
-    # 写入断行检查结果和翻译内容
-    with open(output_file, 'w', encoding='utf-8') as outfile:
-        # 首先写入断行检查结果
-        outfile.write("# 断行检查结果\n\n")
-        if issues:
-            outfile.write("发现以下异常断行：\n\n")
-            for issue in issues:
-                outfile.write(f"- 行号 {issue['行号']}: {issue['内容']}\n")
-                if issue.get('开头异常'):
-                    outfile.write("  - 开头异常\n")
-                if issue.get('结尾异常'):
-                    outfile.write("  - 结尾异常\n")
-                if issue.get('引用异常'):
-                    outfile.write("  - 引用格式异常\n")
+    def __init__(self, md_file_path):
+        self.md_file_path = md_file_path
+        # 获取Markdown文件名（不含扩展名）
+        self.md_file_name = os.path.splitext(os.path.basename(md_file_path))[0]
+        # 分析文件路径
+        self.file_dir = os.path.dirname(md_file_path)
+        base_name = self.md_file_name
+        # 调整文件名
+        if '_EN_' in base_name:
+            base_name = base_name.replace('_EN_', '_CH_')
+        self.output_file = os.path.join(self.file_dir, f"{base_name}_逐句对照.md")
+        self.sections = []
+        self.schedule = None
+        self.journal = None
+        self.header = ""
+
+    def prepare(self, model: LLM_model, model_pool=None, workers=3, max_translation=None):
+        """
+        翻译前的准备
+        Args:
+            model: 用于调整标题层级和翻译标题的模型
+            model_pool: 可选的ModelPool，标题翻译失败时换用其他模型，章节按池中最小的token预算拆分
+            workers: 并行数，用于拆分耗时过长的章节
+            max_translation: 可选的片段单词数上限，与翻译时的拆分方式一致，用于估计章节耗时
+        """
+        md_file_path = self.md_file_path
+
+        # 读取文件内容
+        with open(md_file_path, 'r', encoding='utf-8') as file:
+            content = file.readlines()
+
+        # 按照markdown块分割
+        blocks = split_markdown_into_blocks(content)
+
+        # 检查一级标题数量
+        level1_count = sum(1 for block in blocks if block.type == 'header' and block.text.startswith('# '))
+        if level1_count <= 1:
+            print("检测到一级标题数量不足，正在调整标题层级...")
+            # 调整标题层级，gemini做不来，只能用gpt-4
+            arrange_titles(md_file_path, model=model)
+            with open(md_file_path, 'r', encoding='utf-8') as file:
+                content = file.readlines()
+            # 重新读取调整后的内容
+            blocks = split_markdown_into_blocks(content)
+            print("标题层级调整完成")
+
+        # 打开断点日志，源文件内容变化时日志作废
+        journal = TranslationJournal(md_file_path, "".join(content))
+        if journal.resumed:
+            print("检测到未完成的翻译，从断点继续...")
+
+        # 提取并翻译标题块
+        title_blocks = [block for block in blocks if block.type == 'header']
+
+        if title_blocks:
+            journaled_titles = journal.load_titles()
+            if journaled_titles is not None and len(journaled_titles) == len(title_blocks):
+                translated_titles = [orig.with_text(text) for orig, text in zip(title_blocks, journaled_titles)]
+            else:
+                print("正在翻译文档标题...")
+                translated_titles = translate_titles(title_blocks, model, model_pool)
+                journal.save_titles([block.text for block in translated_titles])
+
+            # 替换原文中的标题
+            title_index = 0
+            for i, block in enumerate(blocks):
+                if block.type == 'header':
+                    blocks[i] = translated_titles[title_index]
+                    title_index += 1
+            print("标题翻译+替换完成")
+
+        # 按照一级标题合并块
+        self.sections = merge_by_top_section(blocks)
+        # 按预计耗时调度：过大的章节在二、三级标题处拆分为多个任务，耗时大的任务先提交
+        budget = TokenBudget.for_models(model_pool.models if model_pool else [model])
+        self.schedule = SectionSchedule(self.sections, lambda section: section_cost(section, budget, max_translation),
+                                        workers)
+        if len(self.schedule) > len(self.sections):
+            print(f"拆分耗时较长的章节，共 {len(self.schedule)} 个翻译任务")
+        journal.use_layout(self.schedule.layout())
+        self.journal = journal
+
+        # 执行断行检查，结果写在最终输出文件开头
+        self.header = break_check_header(md_file_path)
+        return self
+
+    def merger(self, remove_block_files=False):
+        """按顺序流式合并各章节任务的块文件，前面的章节可以先行阅读"""
+        return OrderedSectionMerger(self.output_file, len(self.schedule), self.header, remove_block_files,
+                                    self.schedule.section_ends)
+
+    def finish(self, model_pool=None):
+        """
+        翻译结束后的收尾：使用模型池时在结果末尾记录每个章节由哪些模型翻译；所有章节都翻译成功后删除断点日志
+        Returns:
+            bool: 是否所有章节都翻译成功
+        """
+        schedule, journal = self.schedule, self.journal
+        if model_pool:
+            # 记录每个章节由哪些模型翻译
+            model_report = ["\n---\n\n# 翻译模型\n\n"]
+            for idx, section in enumerate(self.sections):
+                title_text = section_block_file(section, idx, self.file_dir, self.md_file_name)[1]
+                model_names = [name for job in range(len(schedule)) if schedule.section_of[job] == idx
+                               for name in journal.section(job).models()]
+                model_names = list(dict.fromkeys(model_names))
+                model_report.append(f"- {title_text}: {', '.join(model_names) or '未翻译'}\n")
+            with open(self.output_file, 'a', encoding='utf-8') as f:
+                f.writelines(model_report)
+            print("".join(model_report[1:]))
+
+        # 所有章节都翻译成功后删除断点日志，否则保留以便重新运行时继续
+        complete = all(journal.section_done(idx) for idx in range(len(schedule)))
+        if complete:
+            journal.finish()
         else:
-            outfile.write("未发现异常断行\n")
-        outfile.write("\n---\n\n")
+            print("部分内容翻译失败，已保留断点，重新运行可继续翻译未完成的部分")
+        print(f"翻译完成，最终结果已保存至: {self.output_file}")
+        return complete
 
-        # 然后写入翻译内容
-        for block_file in block_files:
-            with open(block_file, 'r', encoding='utf-8') as infile:
-                outfile.write(infile.read())
-                outfile.write('\n')
-            # 删除临时块文件
-            if remove_block_files:
-                os.remove(block_file)
 
-    print(f"翻译完成，最终结果已保存至: {output_file}")
+def process_markdown_translation(md_file_path, model: LLM_model | ModelPool, max_translation=None, max_concurrent=3,remove_block_files=False,
+                                 backend="process", chunk_concurrency=1, chunk_context="source"):
+    """
+    处理Markdown文件的翻译
+    Args:
+        md_file_path: Markdown文件路径
+        model: LLM模型，或ModelPool（各章节和片段分配给池中的所有模型，最终结果末尾记录每个章节使用的模型）
+        max_translation: 可选的片段单词数上限，默认只按模型的输出token上限拆分片段
+        max_concurrent: 最大并行数（process后端的进程数）
+        backend: "process"使用进程池并行翻译各章节；"async"在单进程内用asyncio并发翻译，并发数取模型的max_concurrent
+        chunk_concurrency: 大于1时开启章节内并行翻译，每个章节同时翻译的片段数
+        chunk_context: 章节内并行翻译时的上下文模式，"source"附带相邻原文，"previous"附带最近完成的翻译
+    翻译进度记录在文件旁的断点日志中，中断后重新运行会跳过已完成的片段，全部翻译成功后删除日志
+    Returns:
+        bool: 是否所有章节都翻译成功
+    """
+    # 多模型池：标题等单次请求从池中选一个模型
+    model_pool = model if isinstance(model, ModelPool) else None
+    if model_pool:
+        model = model_pool.choose()
+
+    workers = max_concurrent if backend != "async" else (model_pool or model).max_concurrent
+    document = MarkdownDocument(md_file_path).prepare(model, model_pool, workers, max_translation)
+    schedule = document.schedule
+
+    # 并行处理翻译，每个章节完成后按顺序流式合并到最终输出文件，前面的章节可以先行阅读
+    with document.merger(remove_block_files) as merger:
+        if backend == "async":
+            from tqdm.auto import tqdm
+            from Async_translate import translate_sections_async
+
+            def on_done(idx, block_file):
+                merger.add(idx, block_file)
+                progress.update(1)
+
+            with tqdm(total=len(schedule), desc="翻译进度") as progress:
+                translate_sections_async(schedule.jobs, document.file_dir, model, max_translation,
+                                         document.md_file_name, on_done=on_done,
+                                         chunk_concurrency=chunk_concurrency, chunk_context=chunk_context,
+                                         journal=document.journal, model_pool=model_pool, order=schedule.order)
+        else:
+            translate_sections_in_pool(schedule.jobs, document.file_dir, model, max_translation,
+                                       document.md_file_name, max_concurrent, chunk_concurrency, chunk_context,
+                                       document.journal, on_done=merger.add, model_pool=model_pool,
+                                       order=schedule.order)
 
+    return document.finish(model_pool)
 
-def auto_batch_translation(input_dir, model):
+
+def auto_batch_translation(input_dir, model, max_concurrent=None, backend="process", remove_block_files=False,
+                           report_file=None):
     """
-    自动批量翻译指定文件夹下的Markdown文件
+    自动批量翻译指定文件夹下的Markdown文件，多个文件共用一个并发预算同时翻译，无需任何对话框
     Args:
         input_dir: 输入文件夹路径
         model: 要使用的翻译模型
+        max_concurrent: 全局并行数，默认取模型的max_concurrent
+        backend: "process"或"async"，见process_markdown_translation
+        report_file: 可选，汇总报告的保存路径
+    Returns:
+        int: 全部翻译成功的文件数
     """
+    from Batch_translate import collect_markdown_files, translate_markdown_batch
+
     # 首先收集所有符合条件的文件
-    target_files = []
     print(f"开始遍历文件夹收集目标文件: {input_dir}")
-
-    for root, dirs, files in os.walk(input_dir):
-        md_files = [f for f in files if f.endswith('.md')]
-        if len(md_files) == 1:
-            md_file = os.path.join(root, md_files[0])
-            # 文件名需含有_EN_
-            if '_EN_' in md_file and '笔记' not in md_file:
-                target_files.append(md_file)
+    target_files = collect_markdown_files(input_dir)
     print(f"找到 {len(target_files)} 个需要处理的文件")
     for file in target_files:
         print(file)
 
-    # 逐个处理收集到的文件
-    total_processed = 0
-    for md_file in target_files:
-        print(f"\n处理文件 [{total_processed + 1}/{len(target_files)}]: {md_file}")
-        try:
-            process_markdown_translation(md_file, max_translation=800, max_concurrent=1, model=model)
-            total_processed += 1
-            print(f"已完成 {total_processed}/{len(target_files)} 个文件的翻译")
-        except Exception as e:
-            print(f"处理文件 {md_file} 时出错: {str(e)}")
-
+    items = translate_markdown_batch(target_files, model, max_concurrent=max_concurrent,
+                                     backend=backend, remove_block_files=remove_block_files,
+                                     report_file=report_file)
+    total_processed = sum(1 for item in items if item.status == "完成")
     print(f"\n翻译完成，共处理 {total_processed}/{len(target_files)} 个文件")
     return total_processed
 
+def markdown_for_file(file_path, ocr_api_key=None):
+    """
+    获取待翻译文件对应的Markdown文件，PDF文件先转换为同名Markdown
+    有完整文本层的PDF在本地直接提取，扫描版PDF使用Mistral OCR，见PDF_backends.choose_pdf_backend
+    Args:
+        file_path: Markdown或PDF文件路径
+        ocr_api_key: Mistral OCR的API key，默认使用LLM_API中的配置
+    Returns:
+        str: Markdown文件路径，无法转换或不支持的文件类型返回None
+    """
+    ocr_api_key = ocr_api_key if ocr_api_key is not None else Mistral_OCR_API
+    if file_path.lower().endswith('.md'):
+        return file_path
+    if not file_path.lower().endswith('.pdf'):
+        print(f"不支持的文件类型: {file_path}")
+        return None
+
+    pdf_md_path = Path(file_path).with_suffix('.md')
+    if pdf_md_path.exists() and TranslationJournal.exists(pdf_md_path):
+        # 上次翻译中断，沿用已转换的Markdown，不重新转换
+        print(f"检测到未完成的翻译，跳过PDF转换，从断点继续...")
+        return str(pdf_md_path)
+    backend = choose_pdf_backend(file_path, ocr_api_key)
+    if backend is None:
+        print("该PDF没有可用的文本层，且Mistral OCR API密钥未设置，无法翻译，请检查配置。")
+        return None
+    print(f"检测到PDF文件，正在使用{backend.description}将其转换为Markdown...")
+    try:
+        backend.convert(file_path)
+    except Exception as e:
+        print(f"PDF处理出错: {str(e)}")
+        return None
+    if not pdf_md_path.exists():
+        print(f"PDF转Markdown失败，未找到生成的Markdown文件")
+        return None
+    print(f"PDF转Markdown成功，开始翻译处理...")
+    return str(pdf_md_path)
+
+
 def translation_GUI(remove_block_files=False):
     # 选择LLM模型
-    selected_llm: LLM_model = ChooseLLM(MyLLMs)
+    selected_llm: LLM_model | ModelPool = ChooseLLM(MyLLMs, allow_pool=True)
     if selected_llm is None:
         print("没有有效的LLM模型可供选择，程序退出。")
         exit(1)
 
     # 检查Mistral OCR API密钥
     if not Mistral_OCR_API:
-        print("Mistral OCR API密钥未设置，将无法翻译PDF文件，请检查配置。")
+        print("Mistral OCR API密钥未设置，只能翻译带文本层的PDF文件，扫描版PDF需要配置OCR。")
 
     files = select_md_or_pdf_files()
-    total_files = len(files)
-    md_file_to_translate=""
-    for i, file_path in enumerate(files):
-        print(f"\n[{i + 1}/{total_files}] 开始处理文件: {os.path.basename(file_path)}")
-        start_time = time.time()
-
-        # 检查文件类型
-        if file_path.lower().endswith('.pdf'):
-            if not Mistral_OCR_API:
-                print("Mistral OCR API密钥未设置，将无法翻译PDF文件，请检查配置。")
-                continue
-            print(f"检测到PDF文件，正在使用Mistral OCR将其转换为Markdown...")
-            try:
-                pdf2markdown(file_path, Mistral_OCR_API)
-                # 获取生成的Markdown文件路径
-                md_file_path = Path(file_path).with_suffix('.md')
-                if md_file_path.exists():
-                    print(f"PDF转Markdown成功，开始翻译处理...")
-                    md_file_to_translate = str(md_file_path)
-                else:
-                    print(f"PDF转Markdown失败，未找到生成的Markdown文件")
-            except Exception as e:
-                print(f"PDF处理出错: {str(e)}")
-        elif file_path.lower().endswith('.md'):
-            # 直接处理Markdown文件
-            md_file_to_translate=file_path
-        else:
-            print(f"不支持的文件类型: {file_path}")
-            continue
-        #执行翻译
-        try:
-            process_markdown_translation(md_file_to_translate, max_translation=800,
-                                         max_concurrent=selected_llm.max_concurrent, model=selected_llm,
-                                         remove_block_files=remove_block_files)
-        except Exception as e:
-            print(f"处理文件 {file_path} 时出错: {str(e)}")
-            continue
-
-        elapsed_time = time.time() - start_time
-        print(f"[{i + 1}/{total_files}] 文件处理完成: {os.path.basename(file_path)}")
-        print(f"处理耗时: {elapsed_time:.2f}秒 ({elapsed_time / 60:.2f}分钟)")
-        print(f"总体进度: {(i + 1) / total_files * 100:.1f}% 完成")
+    if not files:
+        return
+    # PDF的OCR与已转换文件的翻译同时进行，见Batch_translate.translate_markdown_batch
+    from Batch_translate import translate_markdown_batch
+    translate_markdown_batch(files, selected_llm, max_concurrent=selected_llm.max_concurrent,
+                             remove_block_files=remove_block_files)
 
 if __name__ == "__main__":
     # todo:DeepSeek过于戏精，表现不够稳定，或许要调整Prompt
@@ -0,0 +1,130 @@
+"""
+命令行翻译入口，不弹出任何对话框，适合在服务器上或脚本中运行
+用法：
+    python Translate_cli.py paper.pdf paper2.md --model deepseek-chat
+    python Translate_cli.py 论文文件夹 --model all --config my_llms.json --backend async --report 报告.md
+文件夹中按auto_batch_translation的规则查找文件；--model all表示使用配置中的全部模型
+配置文件可以是与LLM_API.py格式相同的.py文件（定义MyLLMs和Mistral_OCR_API），
+也可以是.json文件：{"mistral_ocr_api": "", "models": [{"model_name": "...", "post_url": "...", "api_key": "..."}]}，
+models中的每一项为LLM_model的参数；不指定时使用项目中的LLM_API.py
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+# 重量级依赖（openai、mistralai、tqdm等）都在首次使用时才导入，命令行和进程池的工作进程都能快速启动
+from LLM_tools import LLM_model
+from Model_pool import ModelPool
+
+
+def load_config(config_path=None):
+    """
+    读取模型配置
+    Args:
+        config_path: .py或.json配置文件路径，为None时使用LLM_API.py
+    Returns:
+        tuple: (LLM_model列表, Mistral OCR的API key)
+    """
+    if config_path is None:
+        import LLM_API
+        return LLM_API.MyLLMs, LLM_API.Mistral_OCR_API
+    if config_path.lower().endswith('.json'):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return [LLM_model(**kwargs) for kwargs in config.get("models", [])], config.get("mistral_ocr_api", "")
+
+    spec = importlib.util.spec_from_file_location("_translate_config", config_path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return getattr(config, "MyLLMs", []), getattr(config, "Mistral_OCR_API", "")
+
+
+def select_model(models, model_name=None):
+    """
+    按名称选择模型，不进行任何交互
+    Args:
+        models: LLM_model列表，只考虑填写了API key的模型
+        model_name: 模型名，"all"表示全部模型；为None时要求只有1个可用模型
+    Returns:
+        LLM_model或ModelPool
+    Raises:
+        ValueError: 找不到对应的模型
+    """
+    valid_llms = [llm for llm in models if llm.api_key]
+    if not valid_llms:
+        raise ValueError("没有找到有效的LLM模型，请先配置API密钥")
+    names = ", ".join(llm.model_name for llm in valid_llms)
+    if model_name == "all":
+        return ModelPool(valid_llms) if len(valid_llms) > 1 else valid_llms[0]
+    if model_name is None:
+        if len(valid_llms) == 1:
+            return valid_llms[0]
+        raise ValueError(f"可用模型不止1个，请用--model指定: {names}, all")
+    for llm in valid_llms:
+        if llm.model_name == model_name:
+            return llm
+    raise ValueError(f"未找到已配置API key的模型 {model_name}，可用模型: {names}, all")
+
+
+def collect_input_files(paths):
+    """展开命令行中的路径：文件原样保留，文件夹按auto_batch_translation的规则查找Markdown文件"""
+    from Batch_translate import collect_markdown_files
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(collect_markdown_files(path))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"文件不存在，已跳过: {path}")
+    return files
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="论文一键翻译（命令行，无对话框）")
+    parser.add_argument("paths", nargs="+", help="Markdown/PDF文件或文件夹")
+    parser.add_argument("-m", "--model", help="模型名（配置中的model_name），all表示使用全部模型")
+    parser.add_argument("-c", "--config", help="模型配置文件（.py或.json），默认使用LLM_API.py")
+    parser.add_argument("--backend", choices=("process", "async"), default="process", help="并行方式，默认process")
+    parser.add_argument("--max-concurrent", type=int, help="全局并行数，默认取模型的max_concurrent")
+    parser.add_argument("--max-translation", type=int,
+                        help="每个片段的单词数上限，默认只按模型的输出token上限(max_output_tokens)拆分片段")
+    parser.add_argument("--chunk-concurrency", type=int, default=1, help="章节内片段的并发数，默认1")
+    parser.add_argument("--keep-block-files", action="store_true", help="保留各章节的临时翻译文件")
+    parser.add_argument("--ocr-workers", type=int, help="同时进行OCR的PDF数，默认使用配置中的Mistral_OCR_max_concurrent")
+    parser.add_argument("--report", help="汇总报告的保存路径")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        models, ocr_api_key = load_config(args.config)
+        model = select_model(models, args.model)
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(str(e))
+    print(f"使用模型: {', '.join(llm.model_name for llm in model.models) if isinstance(model, ModelPool) else model.model_name}")
+
+    from Batch_translate import translate_markdown_batch
+
+    files = collect_input_files(args.paths)
+    if not files:
+        print("没有需要翻译的文件")
+        return 1
+
+    # PDF的OCR与已转换文件的翻译同时进行
+    items = translate_markdown_batch(files, model, max_translation=args.max_translation,
+                                     max_concurrent=args.max_concurrent, backend=args.backend,
+                                     chunk_concurrency=args.chunk_concurrency,
+                                     remove_block_files=not args.keep_block_files, report_file=args.report,
+                                     ocr_api_key=ocr_api_key, ocr_workers=args.ocr_workers)
+    return 0 if all(item.status == "完成" for item in items) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from Stream_sinks import open_sink
+
+
+def normalize_text(text):
+    """规范化待翻译文本：去掉每行末尾空白及首尾空行，使仅有空白差异的文本命中同一缓存"""
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+
+class TranslationCache:
+    """
+    基于SQLite的翻译结果缓存，按内容哈希寻址
+    键由规范化的待翻译文本、模型名、系统提示词、示例对话和温度计算得到
+    超过容量上限时按最近访问时间淘汰（LRU），命中/未命中次数持久化在stats表中
+    缓存总大小由触发器维护在meta表中，写入时无需扫描全表；可被多个进程同时使用
+    """
+
+    def __init__(self, path, max_mb=512):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                           "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                           "model TEXT, created REAL, last_access REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 条目增删改时同步更新总大小
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_size_insert AFTER INSERT ON entries BEGIN "
+                               "UPDATE meta SET value = value + NEW.size WHERE name = 'size'; END")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_size_delete AFTER DELETE ON entries BEGIN "
+                               "UPDATE meta SET value = value - OLD.size WHERE name = 'size'; END")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS entries_size_update AFTER UPDATE OF size ON entries BEGIN "
+                               "UPDATE meta SET value = value - OLD.size + NEW.size WHERE name = 'size'; END")
+            # 旧版本创建的缓存文件没有总大小，统计一次
+            self._conn.execute("INSERT OR IGNORE INTO meta(name, value) "
+                               "SELECT 'size', COALESCE(SUM(size), 0) FROM entries")
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def make_key(model_name, text, system_prompt="", few_shot=(), temperature=0.7):
+        """计算缓存键"""
+        payload = json.dumps({
+            "text": normalize_text(text),
+            "model": model_name,
+            "system": system_prompt.strip() if system_prompt else "",
+            "few_shot": [[message["role"], message["content"]] for message in few_shot],
+            "temperature": temperature,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, name):
+        self._conn.execute("INSERT INTO stats(name, value) VALUES (?, 1) "
+                           "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """查询缓存，命中时返回译文并更新访问时间，未命中返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count("hits")
+            return row[0]
+
+    def put(self, key, value, model_name=""):
+        """写入缓存，超过容量上限时淘汰最久未访问的条目"""
+        now = time.time()
+        with self._lock:
+            # 不使用INSERT OR REPLACE：替换时删除旧行不会触发DELETE触发器
+            self._conn.execute("INSERT INTO entries(key, value, size, model, created, last_access) "
+                               "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                               "value = excluded.value, size = excluded.size, model = excluded.model, "
+                               "created = excluded.created, last_access = excluded.last_access",
+                               (key, value, len(value.encode("utf-8")), model_name, now, now))
+            self._evict(self.max_bytes)
+
+    def delete(self, key):
+        """删除一条缓存，用于丢弃未通过校验的译文"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _total_size(self):
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def _evict(self, max_bytes):
+        total = self._total_size()
+        if total <= max_bytes:
+            return 0
+        to_delete = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if total <= max_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+        return len(to_delete)
+
+    def prune(self, max_mb):
+        """将缓存裁剪到max_mb以内，返回删除的条目数"""
+        with self._lock:
+            removed = self._evict(int(max_mb * 1024 * 1024))
+        self._conn.execute("VACUUM")
+        return removed
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM stats")
+        self._conn.execute("VACUUM")
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = self._total_size()
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            models = self._conn.execute("SELECT model, COUNT(*) FROM entries GROUP BY model ORDER BY 2 DESC").fetchall()
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "models": models,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+# 每个进程一个缓存实例
+_CACHE = None
+_CACHE_PID = None
+
+
+def get_translation_cache():
+    """
+    获取当前进程的翻译缓存，按LLM_API中的Translation_cache_path/Translation_cache_max_mb配置打开
+    未配置缓存路径时返回None
+    """
+    global _CACHE, _CACHE_PID
+    if _CACHE_PID == os.getpid():
+        return _CACHE
+    from LLM_API import Translation_cache_max_mb
+    path = configured_cache_path()
+    _CACHE = TranslationCache(path, Translation_cache_max_mb) if path else None
+    _CACHE_PID = os.getpid()
+    return _CACHE
+
+
+def configured_cache_path():
+    """LLM_API中配置的缓存路径，相对路径相对于本项目目录，未配置时返回空字符串"""
+    from LLM_API import Translation_cache_path
+    if not Translation_cache_path:
+        return ""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), Translation_cache_path)
+
+
+def cached_response(cache, key, request, write_file=None, model_name=""):
+    """
+    先查缓存，未命中时调用request()并缓存成功的结果
+    Args:
+        cache: TranslationCache，为None时直接调用request
+        key: 缓存键，见TranslationCache.make_key
+        request: 无参函数，返回(译文, token统计)，与LLM_Stream_Response相同
+        write_file: 命中缓存时，将译文写入的文件路径或OutputSink
+    Returns:
+        tuple: (译文, token统计)，命中缓存时token统计为None
+    """
+    if cache is None:
+        return request()
+
+    content = cache.get(key)
+    if content is not None:
+        sink, owns_sink = open_sink(write_file)
+        if sink:
+            sink.write(content)
+            if owns_sink:
+                sink.close()
+            else:
+                sink.flush()
+        return content, None
+
+    content, token_usage = request()
+    if content is not None:
+        cache.put(key, content, model_name)
+    return content, token_usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看或清理翻译缓存")
+    parser.add_argument("--path", default=None, help="缓存文件路径，默认使用LLM_API中的配置")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="显示缓存条目数、大小和命中率")
+    prune_parser = subparsers.add_parser("prune", help="按最近访问时间淘汰条目，直到缓存不超过指定大小")
+    prune_parser.add_argument("--max-mb", type=float, required=True, help="保留的最大容量(MB)")
+    subparsers.add_parser("clear", help="清空缓存")
+    args = parser.parse_args()
+    args.path = args.path or configured_cache_path()
+
+    if not args.path or not os.path.exists(args.path):
+        print(f"缓存文件不存在: {args.path}")
+        return
+    cache = TranslationCache(args.path)
+    if args.command == "stats":
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0
+        print(f"缓存文件: {args.path}")
+        print(f"条目数: {stats['entries']}，大小: {stats['size_bytes'] / 1024 / 1024:.2f}MB")
+        print(f"命中: {stats['hits']}，未命中: {stats['misses']}，命中率: {hit_rate:.1f}%")
+        for model_name, count in stats["models"]:
+            print(f"  {model_name or '(未知模型)'}: {count} 条")
+    elif args.command == "prune":
+        removed = cache.prune(args.max_mb)
+        print(f"已删除 {removed} 条缓存，当前大小: {cache.stats()['size_bytes'] / 1024 / 1024:.2f}MB")
+    elif args.command == "clear":
+        cache.clear()
+        print("缓存已清空")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
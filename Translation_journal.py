@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SectionJournal:
+    """单个章节的翻译日志，每个已完成的片段占一行JSON，只由翻译该章节的进程写入"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done_path = os.path.splitext(path)[0] + ".done"
+        self._records = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 中断时可能留下不完整的最后一行
+                        continue
+                    self._records[record["chunk"]] = record
+
+    def completed(self, position, source):
+        """返回第position个片段已完成的译文；未完成或原文已变化时返回None"""
+        record = self._records.get(position)
+        if record is None or record["source_sha256"] != text_sha256(source):
+            return None
+        return record["output"]
+
+    def record(self, position, source, start_line, end_line, output, model_name=""):
+        """记录一个已完成的片段及翻译它的模型，立即落盘"""
+        record = {
+            "chunk": position,
+            "start_line": start_line,
+            "end_line": end_line,
+            "source_sha256": text_sha256(source),
+            "output": output,
+            "model": model_name,
+        }
+        self._records[position] = record
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def models(self):
+        """翻译本章节用到的模型名，按片段顺序去重"""
+        names = [self._records[position].get("model") for position in sorted(self._records)]
+        return list(dict.fromkeys(name for name in names if name))
+
+    def mark_done(self):
+        """章节的所有片段均已翻译成功"""
+        open(self.done_path, 'w').close()
+
+    def __len__(self):
+        return len(self._records)
+
+
+class TranslationJournal:
+    """
+    文档级的翻译断点日志，保存在Markdown文件旁的.{文件名}_journal目录中
+    记录翻译后的标题和每个章节已完成的片段，重新运行时跳过已完成的片段，从中断处继续
+    源Markdown内容变化后日志自动作废
+    """
+
+    def __init__(self, md_file_path, source_text):
+        md_file_path = os.path.abspath(md_file_path)
+        md_file_name = os.path.splitext(os.path.basename(md_file_path))[0]
+        self.directory = os.path.join(os.path.dirname(md_file_path), f".{md_file_name}_journal")
+        self.source_sha256 = text_sha256(source_text)
+        self.resumed = False
+
+        meta_path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("source_sha256") == self.source_sha256:
+                self.resumed = True
+            else:
+                print("源Markdown文件已变化，丢弃之前的翻译断点")
+                shutil.rmtree(self.directory)
+        if not self.resumed:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"source_sha256": self.source_sha256}, f)
+
+    @staticmethod
+    def exists(md_file_path):
+        """Markdown文件是否有未完成的翻译断点"""
+        md_file_path = os.path.abspath(md_file_path)
+        md_file_name = os.path.splitext(os.path.basename(md_file_path))[0]
+        return os.path.isdir(os.path.join(os.path.dirname(md_file_path), f".{md_file_name}_journal"))
+
+    def use_layout(self, layout):
+        """
+        记录章节任务的划分方式，划分与上次不同时（如并行数变化导致大章节的拆分方式不同）丢弃各章节的日志，
+        已翻译的片段仍可命中翻译缓存
+        """
+        path = os.path.join(self.directory, "layout.json")
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous != layout:
+                print("章节划分已变化，丢弃各章节的翻译断点")
+                for name in os.listdir(self.directory):
+                    if name.startswith("section_"):
+                        os.remove(os.path.join(self.directory, name))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(layout, f)
+
+    def section(self, idx):
+        """第idx个章节的日志"""
+        return SectionJournal(os.path.join(self.directory, f"section_{idx:02d}.jsonl"))
+
+    def section_done(self, idx):
+        """第idx个章节是否已全部翻译成功"""
+        return os.path.exists(os.path.join(self.directory, f"section_{idx:02d}.done"))
+
+    def load_titles(self):
+        """已翻译的标题文本列表，没有时返回None"""
+        path = os.path.join(self.directory, "titles.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_titles(self, titles):
+        with open(os.path.join(self.directory, "titles.json"), 'w', encoding='utf-8') as f:
+            json.dump(titles, f, ensure_ascii=False)
+
+    def finish(self):
+        """文档翻译完成，删除日志"""
+        shutil.rmtree(self.directory, ignore_errors=True)
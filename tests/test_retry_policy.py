@@ -0,0 +1,125 @@
+import json
+
+import pytest
+import requests
+
+import LLM_tools
+from Key_rotation import KeyRing
+from Retry_policy import CircuitBreaker
+
+
+class FakeResponse:
+    def __init__(self, status, content=""):
+        self.status_code = status
+        self.headers = {}
+        self.content = content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+    def iter_lines(self):
+        yield "data: " + json.dumps({"choices": [{"delta": {"content": self.content}}]})
+        yield "data: [DONE]"
+
+
+class FakeSession:
+    """按顺序返回预设的状态码，记录每次请求使用的API key"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.keys = []
+
+    def post(self, url, headers, **kwargs):
+        self.keys.append(headers["Authorization"])
+        return FakeResponse(self.statuses.pop(0), "ok")
+
+
+class FakeModel:
+    post_url = "http://fake/v1/chat/completions"
+
+    def __init__(self, statuses, keys=("key-a",)):
+        self._session = FakeSession(statuses)
+        self._key_ring = KeyRing("fake", list(keys))
+        self._breaker = CircuitBreaker("fake", failure_threshold=1, cooldown=0)
+
+    def session(self):
+        return self._session
+
+    def key_ring(self):
+        return self._key_ring
+
+    def circuit_breaker(self):
+        return self._breaker
+
+
+@pytest.fixture(autouse=True)
+def no_stats(monkeypatch):
+    monkeypatch.setattr(LLM_tools, "record_request", lambda *args, **kwargs: None)
+    monkeypatch.setattr(LLM_tools, "retry_delay", lambda *args, **kwargs: 0)
+
+
+def open_breaker(breaker):
+    breaker.record_failure()
+    assert breaker.is_open()
+
+
+def stream(model, max_retry=3):
+    return LLM_tools._stream_with_retry(model, {}, {"messages": []}, None, max_retry, 5)
+
+
+def test_probe_released_after_client_error():
+    model = FakeModel([400, 200])
+    open_breaker(model.circuit_breaker())
+    # 探测请求返回400，不重试，也不能一直占着探测名额
+    assert stream(model) == (None, None)
+    assert model.circuit_breaker().is_open()
+    wait, probe = model.circuit_breaker().before_request()
+    assert wait == 0 and probe is not None
+    model.circuit_breaker().release_probe(probe)
+    # 下一个请求作为探测请求发送，成功后恢复
+    assert stream(model)[0] == "ok"
+    assert not model.circuit_breaker().is_open()
+
+
+def test_probe_released_on_exception():
+    breaker = CircuitBreaker("fake", failure_threshold=1, cooldown=0)
+    open_breaker(breaker)
+    _, probe = breaker.before_request()
+    assert breaker.before_request() == (1, None)
+    breaker.release_probe(probe)
+    assert breaker.before_request()[1] is not None
+
+
+def test_probe_timeout():
+    breaker = CircuitBreaker("fake", failure_threshold=1, cooldown=0, probe_timeout=0)
+    open_breaker(breaker)
+    _, lost = breaker.before_request()
+    # 探测请求丢失（未调用任何结果方法），超时后放行新的探测请求
+    wait, probe = breaker.before_request()
+    assert wait == 0 and probe is not None and probe != lost
+
+
+def test_probe_failure_reopens():
+    breaker = CircuitBreaker("fake", failure_threshold=5, cooldown=0)
+    for _ in range(5):
+        breaker.record_failure()
+    _, probe = breaker.before_request()
+    breaker.record_failure(probe)
+    assert breaker.is_open()
+    assert breaker.before_request()[1] is not None
+
+
+def test_key_switch_keeps_probe():
+    model = FakeModel([429, 200], keys=("key-a", "key-b"))
+    open_breaker(model.circuit_breaker())
+    # 持有探测名额的请求被限流后换用其他key，不能等待自己持有的探测名额
+    assert stream(model, max_retry=1)[0] == "ok"
+    assert len(set(model.session().keys)) == 2
+    assert not model.circuit_breaker().is_open()
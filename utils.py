@@ -1,9 +1,7 @@
+import bisect
 import os
 import re
-import tkinter as tk
-from tkinter import filedialog
-
-from openai import OpenAI
+from difflib import SequenceMatcher
 
 
 # 获取用户输入的markdown文件路径
@@ -22,6 +20,7 @@ def get_md_file_path(tip="请输入markdown文件路径："):
 
 # 简单调用LLM的API进行处理
 def simple_llm_api_process(content, api_key, url, model, prompt, system_prompt=None, print_result=True):
+    from openai import OpenAI
     client = OpenAI(api_key=api_key,base_url= url)
     completion = client.chat.completions.create(
         model=model,
@@ -44,143 +43,178 @@ def simple_llm_api_process(content, api_key, url, model, prompt, system_prompt=N
 
 
 
-# 拆分Markdown成块
-def split_markdown_into_blocks(lines,skip_empty_line=True):
-    # 定义Markdown各个部分的正则表达式
-    patterns = {
-        "header": r"^(#{1,6})\s*(.*)",  # 匹配标题，#、##、### 等
-        "standard_link": r"^\s*\!\[(.*?)\]\((.*?)\)\s*$", # 匹配wiki型链接![[]]
-        "wiki_link": r"^\s*\!\[\[(.*?)\]\]\s*$",  # 匹配标准链接 ![alt text](url)
-        "code_block_start": r"^```",  # 匹配代码块开始 ```
-        "code_block_end": r"^```",  # 匹配代码块结束 ```
-        "formula_block_start": r"^\$\$\s*$",  # 匹配公式块开始 $$
-        "formula_block_end": r"^\$\$\s*$",  # 匹配公式块结束 $$
-        "single_line_formula": r"^\$\$.*\$\$$",  # 匹配单行公式 $formula$
-        "inline_formula": r"^\s*\$\s*.*\s*\$\s*$",
-        "yaml_start": r"^---\s*$",  # 匹配YAML头开始 ---
-        "yaml_end": r"^---\s*$",  # 匹配YAML头结束 ---
-        "table": r"^<table>.*</table>$",  # 匹配单行表格 <table>...</table>
-        "markdown_table_row": r"^\s*\|.*\|\s*$",  # 匹配Markdown表格行
-        "markdown_table_separator": r"^\s*\|[\s\-\|:]*\|\s*$",  # 匹配表格分隔符行
-    }
+# Markdown各个部分的正则表达式，模块加载时预编译一次
+MD_PATTERNS = {
+    "header": re.compile(r"^(#{1,6})\s*(.*)"),  # 匹配标题，#、##、### 等
+    "standard_link": re.compile(r"^\s*\!\[(.*?)\]\((.*?)\)\s*$"),  # 匹配标准链接 ![alt text](url)
+    "wiki_link": re.compile(r"^\s*\!\[\[(.*?)\]\]\s*$"),  # 匹配wiki型链接![[]]
+    "code_block": re.compile(r"^```"),  # 匹配代码块开始/结束 ```
+    "formula_block": re.compile(r"^\$\$\s*$"),  # 匹配公式块开始/结束 $$
+    "single_line_formula": re.compile(r"^\$\$.*\$\$$"),  # 匹配单行公式 $$formula$$
+    "inline_formula": re.compile(r"^\s*\$\s*.*\s*\$\s*$"),  # 匹配单$包裹的单行公式
+    "yaml": re.compile(r"^---\s*$"),  # 匹配YAML头开始/结束 ---
+    "table": re.compile(r"^<table>.*</table>$"),  # 匹配单行表格 <table>...</table>
+    "markdown_table_row": re.compile(r"^\s*\|.*\|\s*$"),  # 匹配Markdown表格行
+    "markdown_table_separator": re.compile(r"^\s*\|[\s\-\|:]*\|\s*$"),  # 匹配表格分隔符行
+}
 
-    blocks = []
 
-    in_code_block = False
-    in_formula_block = False
-    in_yaml_block = False
-    in_markdown_table = False
-    current_code_block = []
-    current_formula_block = []
-    current_yaml_block = []
-    current_markdown_table = []
-
-    for line in lines:
-        # 处理代码块
-        if in_code_block:
-            current_code_block.append(line)
-            if re.match(patterns["code_block_end"], line):
-                # 代码块结束
-                blocks.append(("code_block", "".join(current_code_block)))
-                in_code_block = False
-                current_code_block = []
-            continue
+class MarkdownBlock:
+    """
+    Markdown块记录，保存块类型、内容及其在源文本中的位置。
+    start_line/end_line为块在行列表中的起止下标（左闭右开），未知位置时均为-1。
+    兼容旧的(块类型, 块内容)元组用法：支持解包、block[0]/block[1]，并按(类型, 内容)比较相等。
+    """
+    __slots__ = ("type", "text", "start_line", "end_line")
 
-        # 处理公式块
-        if in_formula_block:
-            current_formula_block.append(line)
-            if re.match(patterns["formula_block_end"], line):
-                # 公式块结束
-                blocks.append(("formula", "".join(current_formula_block)))
-                in_formula_block = False
-                current_formula_block = []
-            continue
+    def __init__(self, type, text, start_line=-1, end_line=-1):
+        self.type = type
+        self.text = text
+        self.start_line = start_line
+        self.end_line = end_line
 
-        # 处理YAML头
-        if in_yaml_block:
-            current_yaml_block.append(line)
-            if re.match(patterns["yaml_end"], line):
-                # YAML头结束
-                blocks.append(("yaml", "".join(current_yaml_block)))
-                in_yaml_block = False
-                current_yaml_block = []
-            continue
+    @property
+    def line_number(self):
+        """块起始行的行号（从1开始）"""
+        return self.start_line + 1
 
-        # 处理Markdown表格
-        if in_markdown_table:
-            if re.match(patterns["markdown_table_row"], line) or re.match(patterns["markdown_table_separator"], line):
-                current_markdown_table.append(line)
-                continue
+    def with_text(self, text):
+        """返回替换内容后的新块，保留原块的位置信息"""
+        return MarkdownBlock(self.type, text, self.start_line, self.end_line)
+
+    def __iter__(self):
+        yield self.type
+        yield self.text
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return (self.type, self.text)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, MarkdownBlock):
+            return self.type == other.type and self.text == other.text
+        if isinstance(other, tuple):
+            return (self.type, self.text) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.type, self.text))
+
+    def __repr__(self):
+        return f"MarkdownBlock({self.type!r}, {self.text!r}, lines={self.start_line}:{self.end_line})"
+
+
+# 拆分Markdown成块
+def split_markdown_into_blocks(lines, skip_empty_line=True):
+    """
+    按行将Markdown拆分为块，返回MarkdownBlock列表。
+    每行先按首字符（及去掉前导空白后的首字符）分派，只对可能命中的模式执行正则，
+    块的划分结果与逐个尝试全部正则完全一致。
+    """
+    standard_link = MD_PATTERNS["standard_link"].match
+    wiki_link = MD_PATTERNS["wiki_link"].match
+    formula_block = MD_PATTERNS["formula_block"].match
+    single_line_formula = MD_PATTERNS["single_line_formula"].match
+    inline_formula = MD_PATTERNS["inline_formula"].match
+    yaml = MD_PATTERNS["yaml"].match
+    table = MD_PATTERNS["table"].match
+    table_row = MD_PATTERNS["markdown_table_row"].match
+    table_separator = MD_PATTERNS["markdown_table_separator"].match
+
+    blocks = []
+    append = blocks.append
+
+    # 当前所处的多行块类型（code_block/formula/yaml/markdown_table）及其内容和起始行
+    in_block = None
+    current_block = []
+    block_start = 0
+
+    for index, line in enumerate(lines):
+        first = line[:1]
+        if in_block is not None:
+            if in_block == "markdown_table":
+                # 表格行必以|开头（忽略前导空白）
+                if line.lstrip()[:1] == '|' and (table_row(line) or table_separator(line)):
+                    current_block.append(line)
+                    continue
+                # 表格结束，当前行需要继续处理
+                append(MarkdownBlock("markdown_table", "".join(current_block), block_start, index))
+                in_block = None
+                current_block = []
             else:
-                # 表格结束
-                if current_markdown_table:
-                    blocks.append(("markdown_table", "".join(current_markdown_table)))
-                    in_markdown_table = False
-                    current_markdown_table = []
-                # 不要continue，因为当前行需要继续处理
-
-        # 匹配代码块开始
-        if re.match(patterns["code_block_start"], line):
-            in_code_block = True
-            current_code_block.append(line)
-            continue
+                current_block.append(line)
+                if in_block == "code_block":
+                    closed = first == '`' and line.startswith("```")
+                elif in_block == "formula":
+                    closed = first == '$' and formula_block(line) is not None
+                else:
+                    closed = first == '-' and yaml(line) is not None
+                if closed:
+                    append(MarkdownBlock(in_block, "".join(current_block), block_start, index + 1))
+                    in_block = None
+                    current_block = []
+                continue
 
-        # 匹配公式块开始
-        if re.match(patterns["formula_block_start"], line):
-            in_formula_block = True
-            current_formula_block.append(line)
+        # 按行首字符分派
+        if first == '`':
+            if line.startswith("```"):
+                # 代码块开始
+                in_block = "code_block"
+        elif first == '$':
+            if formula_block(line):
+                # 公式块开始
+                in_block = "formula"
+        elif first == '-':
+            if yaml(line):
+                # YAML头开始
+                in_block = "yaml"
+        elif first == '#':
+            # 以#开头的行必然匹配标题
+            append(MarkdownBlock("header", line, index, index + 1))
             continue
-
-        # 匹配YAML头开始
-        if re.match(patterns["yaml_start"], line):
-            in_yaml_block = True
-            current_yaml_block.append(line)
+        if in_block is not None:
+            current_block.append(line)
+            block_start = index
             continue
 
-        # 匹配Markdown表格
-        if re.match(patterns["markdown_table_row"], line) and not in_markdown_table:
-            in_markdown_table = True
-            current_markdown_table.append(line)
-            continue
+        # 去掉前导空白后的首字符，用于|、!、$的分派
+        lead = first if not first.isspace() else line.lstrip()[:1]
 
-        # 匹配标题
-        if re.match(patterns["header"], line):
-            # blocks.append(("header", re.match(patterns["header"], line).groups()))
-            blocks.append(("header", line))
-        # 匹配链接
-        elif re.findall(patterns["standard_link"], line):
-            # images = re.findall(patterns["image"], line)
-            # for alt_text, url in images:
-            #     blocks.append(("link", alt_text, url))
-            blocks.append(("link", line))
-        elif re.findall(patterns["wiki_link"], line):
-            # images = re.findall(patterns["image"], line)
-            # for alt_text, url in images:
-            #     blocks.append(("link", alt_text, url))
-            blocks.append(("link", line))
-        # 匹配单行公式
-        elif re.match(patterns["single_line_formula"], line):
-            blocks.append(("formula", line))
-        # 匹配单$包裹的单行公式
-        elif re.search(patterns["inline_formula"], line):
-            blocks.append(("formula", line))
-        # 匹配表格
-        elif re.match(patterns["table"], line):
-            blocks.append(("table", line))
-        # 跳过空行
-        elif not line.strip():
-            if skip_empty_line:
+        block_type = None
+        if lead == '|':
+            if table_row(line):
+                # Markdown表格开始
+                in_block = "markdown_table"
+                current_block.append(line)
+                block_start = index
+                continue
+        elif lead == '!':
+            if standard_link(line) or wiki_link(line):
+                block_type = "link"
+        elif lead == '$':
+            # 单行公式 / 单$包裹的单行公式
+            if (first == '$' and single_line_formula(line)) or inline_formula(line):
+                block_type = "formula"
+        elif first == '<':
+            if table(line):
+                block_type = "table"
+
+        if block_type is None:
+            if lead:
+                # 匹配段落
+                block_type = "paragraph"
+            elif skip_empty_line:
+                # 跳过空行
                 continue
             else:
-                blocks.append(("empty_line", line))
-
-        # 匹配段落
-        else:
-            blocks.append(("paragraph", line))
+                block_type = "empty_line"
+        append(MarkdownBlock(block_type, line, index, index + 1))
 
     # 处理文件末尾可能的未闭合表格
-    if in_markdown_table and current_markdown_table:
-        blocks.append(("markdown_table", "".join(current_markdown_table)))
+    if in_block == "markdown_table" and current_block:
+        append(MarkdownBlock("markdown_table", "".join(current_block), block_start, block_start + len(current_block)))
 
     return blocks
 
@@ -202,25 +236,23 @@ def determine_heading_level(title):
 # 检查Markdown块是否一致
 def check_blocks_consistency(en_blocks, ch_blocks ,en_lines, ch_lines):
     # 跳过yaml块
-    en_blocks = [block for block in en_blocks if block[0] != "yaml"]
-    ch_blocks = [block for block in ch_blocks if block[0] != "yaml"]
+    en_blocks = [block for block in en_blocks if block.type != "yaml"]
+    ch_blocks = [block for block in ch_blocks if block.type != "yaml"]
     # 打印块数
     print(f"英文块数：{len(en_blocks)}")
     print(f"中文块数：{len(ch_blocks)}")
     # 比较块类型
     for i, (en_block, ch_block) in enumerate(zip(en_blocks, ch_blocks)):
-        if en_block[0] != ch_block[0]:
+        if en_block.type != ch_block.type:
             print(f"第 {i+1} 个块类型不一致")
-            #查找块的开头在原文中的行号
-            en_block_start_line = en_lines.index(en_block[1])+1
-            ch_block_start_line = ch_lines.index(ch_block[1])+1
-            print(f"===>英文行号：{en_block_start_line}")
-            print(f"===>中文行号：{ch_block_start_line}")
+            # 块的开头在原文中的行号
+            print(f"===>英文行号：{en_block.line_number}")
+            print(f"===>中文行号：{ch_block.line_number}")
             # 打印块的类型和内容
-            print(f"英文块类型:{en_block[0]}")
-            print(f"{en_block[1]}")
-            print(f"中文块类型:{ch_block[0]}")
-            print(f"{ch_block[1]}")
+            print(f"英文块类型:{en_block.type}")
+            print(f"{en_block.text}")
+            print(f"中文块类型:{ch_block.type}")
+            print(f"{ch_block.text}")
             return False
 
     # 比较块数
@@ -231,51 +263,159 @@ def check_blocks_consistency(en_blocks, ch_blocks ,en_lines, ch_lines):
     return True
 
 
+# 段落对齐参数：锚点前缀长度、模糊匹配的搜索窗口、模糊匹配的最低相似度、比较的开头字符数
+ANCHOR_CHARS = 32
+ALIGN_BAND = 50
+ALIGN_MIN_RATIO = 0.6
+ALIGN_PREVIEW_CHARS = 100
+
+
+def _normalize_for_align(text):
+    return " ".join(text.split())
+
+
+def align_paragraphs(original_texts, translated_texts):
+    """
+    将原文段落单调地对齐到逐句对照译文中的段落（译文以原文句子开头）。
+    先用规范化后的开头前缀建立锚点索引做精确匹配，找不到时在上一个匹配位置之后的窗口内做模糊匹配，
+    整体为线性复杂度。
+    Args:
+        original_texts: 原文段落文本列表
+        translated_texts: 译文段落文本列表
+    Returns:
+        list: (原文段落下标, 译文段落下标) 列表，两个下标均单调递增
+    """
+    # 建立译文开头前缀 -> 译文下标列表的索引，短于锚点长度的段落单独记录其长度
+    anchor_index = {}
+    short_lengths = set()
+    normalized_translations = []
+    for trans_pos, text in enumerate(translated_texts):
+        normalized = _normalize_for_align(text)
+        normalized_translations.append(normalized)
+        if not normalized:
+            continue
+        key = normalized[:ANCHOR_CHARS]
+        anchor_index.setdefault(key, []).append(trans_pos)
+        if len(key) < ANCHOR_CHARS:
+            short_lengths.add(len(key))
+    short_lengths = sorted(short_lengths, reverse=True)
+
+    def next_anchor(key, last):
+        positions = anchor_index.get(key)
+        if not positions:
+            return -1
+        i = bisect.bisect_right(positions, last)
+        return positions[i] if i < len(positions) else -1
+
+    matches = []
+    last = -1
+    for orig_pos, text in enumerate(original_texts):
+        normalized = _normalize_for_align(text)
+        if not normalized:
+            continue
+
+        # 精确锚点匹配：取上一个匹配之后最近的位置
+        best = next_anchor(normalized[:ANCHOR_CHARS], last)
+        if best == -1:
+            # 译文首句短于锚点长度时，按其长度截取原文前缀查找
+            for length in short_lengths:
+                if length > len(normalized):
+                    continue
+                candidate = next_anchor(normalized[:length], last)
+                if candidate != -1 and (best == -1 or candidate < best):
+                    best = candidate
+
+        if best == -1:
+            # 模糊匹配：仅比较上一个匹配之后窗口内的译文段落
+            preview = normalized[:ALIGN_PREVIEW_CHARS]
+            matcher = SequenceMatcher(None, autojunk=False)
+            matcher.set_seq2(preview)
+            best_score = ALIGN_MIN_RATIO
+            for trans_pos in range(last + 1, min(last + 1 + ALIGN_BAND, len(translated_texts))):
+                matcher.set_seq1(normalized_translations[trans_pos][:ALIGN_PREVIEW_CHARS])
+                if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                    continue
+                score = matcher.ratio()
+                if score > best_score:
+                    best_score = score
+                    best = trans_pos
+                    if score == 1.0:
+                        break
+
+        if best != -1:
+            matches.append((orig_pos, best))
+            last = best
+    return matches
+
+
 # 对md块计算单词
 def count_words(block):
-    return len(re.findall(r'\w+', block[1]))
+    return len(re.findall(r'\w+', block.text))
 
 
-def merge_markdown_blocks(blocks, max_words, by_top_section=False, try_title=True):
+# 中日韩字符及全角标点，每个字符大约对应1个token
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗略估计文本的token数：中日韩字符按1个token计，其余字符按4个字符1个token计"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
 
-    # 统计指定索引之间的单词数
-    def count_words_between(blocks, start, end):
-        return sum(count_words(block) for block in blocks[start:end])
+
+def merge_markdown_blocks(blocks, max_words, by_top_section=False, try_title=True):
+    """
+    将块合并为单词数不超过max_words的文本段
+    优先在标题处断开：从当前块起尽量合并到最远的、累计单词数不超过max_words的标题之前；
+    找不到这样的标题时，一直合并到累计单词数达到max_words的块（含该块）为止
+    单词数用前缀和数组计算，标题位置用二分查找，复杂度为O(n log n)
+    Args:
+        blocks: 块列表
+        max_words: 每段的最大单词数
+        by_top_section: 只在一级标题处断开
+        try_title: 是否优先在标题处断开
+    Returns:
+        list: 合并后的文本列表
+    """
+    # prefix[i]为前i个块的单词数之和，blocks[start:end]的单词数为prefix[end] - prefix[start]
+    prefix = [0]
+    for block in blocks:
+        prefix.append(prefix[-1] + count_words(block))
 
     # 合并指定索引之间的块
-    def merge_blocks(blocks, start, end):
-        return '\n\n'.join(block[1] for block in blocks[start:end])  # 强化换行
+    def merge_blocks(start, end):
+        return '\n\n'.join(block.text for block in blocks[start:end])  # 强化换行
 
     # 记录所有标题块的索引位置
-    header_indices = [i for i, (block_type, _) in enumerate(blocks) if block_type == 'header']
+    header_indices = [i for i, block in enumerate(blocks) if block.type == 'header']
     if by_top_section:# 仅提取一级标题
-        header_indices = [i for i, (block_type, block_content) in enumerate(blocks) if block_type == 'header' and determine_heading_level(block_content)==1]
+        header_indices = [i for i, block in enumerate(blocks) if block.type == 'header' and determine_heading_level(block.text)==1]
+    # 各标题之前的累计单词数，随标题位置单调不减
+    header_prefix = [prefix[i] for i in header_indices]
     current_index = 0
     result = []
 
     while current_index < len(blocks):
+        limit = prefix[current_index] + max_words
         # 从最近的标题块开始计算单词数
-        # 记录所有大于当前块的标题块索引
         possible_end_index = current_index
         if try_title:
-            next_header_indices = [header_index for header_index in header_indices if header_index > current_index]
-
-            # 尝试合并当前块和最近标题块之间的块
-            for next_header_index in next_header_indices:
-                if count_words_between(blocks, current_index, next_header_index) > max_words:
-                    break
-                else:
-                    possible_end_index = next_header_index
+            # 当前块之后的标题中，最远的一个满足当前块到它之间的单词数不超过max_words
+            first = bisect.bisect_right(header_indices, current_index)
+            last = bisect.bisect_right(header_prefix, limit, lo=first) - 1
+            if last >= first:
+                possible_end_index = header_indices[last]
 
         # 如果没有找到合适的标题块，直接合并至最大长度
         if possible_end_index == current_index:
-            end_index = current_index
-            while end_index < len(blocks) and count_words_between(blocks, current_index, end_index) < max_words:
-                end_index += 1
-            result.append(merge_blocks(blocks, current_index, end_index+1))
+            # 第一个累计单词数达到max_words的位置，没有则为末尾
+            end_index = bisect.bisect_left(prefix, limit, lo=current_index, hi=len(blocks))
+            result.append(merge_blocks(current_index, end_index+1))
             current_index = end_index+1
         else:
-            result.append(merge_blocks(blocks, current_index, possible_end_index))
+            result.append(merge_blocks(current_index, possible_end_index))
             current_index = possible_end_index
     return result
 
@@ -285,7 +425,7 @@ def merge_by_top_section(blocks):
     result = []
     current_section = []
     for block in blocks:
-        if (block[0] == 'header' and determine_heading_level(block[1]) == 1):
+        if (block.type == 'header' and determine_heading_level(block.text) == 1):
             if current_section:
                 result.append(current_section)
             current_section = [block]
@@ -297,11 +437,18 @@ def merge_by_top_section(blocks):
 
 
 
-def select_pdf():
-    # 打开文件对话框选择PDF文件
+def _filedialog():
+    """创建并隐藏tkinter主窗口，返回filedialog模块；tkinter只在需要弹出对话框时导入"""
+    import tkinter as tk
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()  # 隐藏主窗口
-    pdf_path = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
+    return filedialog
+
+
+def select_pdf():
+    # 打开文件对话框选择PDF文件
+    pdf_path = _filedialog().askopenfilename(filetypes=[("PDF files", "*.pdf")])
     return pdf_path
 
 
@@ -311,18 +458,14 @@ def select_pdf_files():
     Returns:
         list: 选中的PDF文件路径列表，如果用户未选择则返回空列表
     """
-    root = tk.Tk()
-    root.withdraw()
-    pdf_paths = filedialog.askopenfilenames(
+    pdf_paths = _filedialog().askopenfilenames(
         title="选择一个或多个PDF文件",
         filetypes=[("PDF files", "*.pdf")]
     )
     return list(pdf_paths)  # 将返回的tuple转换为list
 
 def select_md():
-    root = tk.Tk()
-    root.withdraw()
-    md_path = filedialog.askopenfilename(filetypes=[("Markdown files", "*.md")])
+    md_path = _filedialog().askopenfilename(filetypes=[("Markdown files", "*.md")])
     return md_path if md_path else ""
 
 
@@ -332,9 +475,7 @@ def select_md_files():
     Returns:
         list: 选中的markdown文件路径列表，如果用户未选择则返回空列表
     """
-    root = tk.Tk()
-    root.withdraw()
-    md_paths = filedialog.askopenfilenames(
+    md_paths = _filedialog().askopenfilenames(
         title="选择一个或多个Markdown文件",
         filetypes=[("Markdown files", "*.md")]
     )
@@ -345,10 +486,7 @@ def select_md_or_pdf_files():
     选择一个或多个Markdown或PDF文件
     返回文件路径列表
     """
-    root = tk.Tk()
-    root.withdraw()  # 隐藏主窗口
-
-    file_paths = filedialog.askopenfilenames(
+    file_paths = _filedialog().askopenfilenames(
         title="选择Markdown或PDF文件",
         filetypes=[("Markdown/PDF文件", "*.md *.pdf"), ("Markdown文件", "*.md"), ("PDF文件", "*.pdf"), ("所有文件", "*.*")]
     )